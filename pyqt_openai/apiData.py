@@ -16,6 +16,51 @@ ENDPOINT_DICT = {
     '/vi/moderations': ['text-moderation-stable', 'text-moderation-latest']
 }
 
+# USD per 1K tokens, (prompt, completion)
+# https://openai.com/pricing
+MODEL_PRICE_DICT = {
+    'gpt-4': (0.03, 0.06),
+    'gpt-4-0314': (0.03, 0.06),
+    'gpt-4-32k': (0.06, 0.12),
+    'gpt-4-32k-0314': (0.06, 0.12),
+    'gpt-3.5-turbo': (0.0015, 0.002),
+    'gpt-3.5-turbo-0301': (0.0015, 0.002),
+    'text-davinci-003': (0.02, 0.02),
+    'text-davinci-002': (0.02, 0.02),
+    'text-curie-001': (0.002, 0.002),
+    'text-babbage-001': (0.0005, 0.0005),
+    'text-ada-001': (0.0004, 0.0004),
+}
+
+# context window of the model in tokens (prompt and completion together)
+# https://platform.openai.com/docs/models
+MODEL_CONTEXT_WINDOW_DICT = {
+    'gpt-4': 8192,
+    'gpt-4-0314': 8192,
+    'gpt-4-32k': 32768,
+    'gpt-4-32k-0314': 32768,
+    'gpt-3.5-turbo': 4096,
+    'gpt-3.5-turbo-0301': 4096,
+    'text-davinci-003': 4097,
+    'text-davinci-002': 4097,
+    'text-curie-001': 2049,
+    'text-babbage-001': 2049,
+    'text-ada-001': 2049,
+}
+
+def getModelContextWindow(model):
+    """
+    :return: context window of the model, 4096 for the unknown model
+    """
+    return MODEL_CONTEXT_WINDOW_DICT.get(model, 4096)
+
+def getModelCost(model, token_cnt, is_user):
+    """
+    :return: cost of the tokens in USD, 0 for the unknown model
+    """
+    prompt_price, completion_price = MODEL_PRICE_DICT.get(model, (0, 0))
+    return token_cnt * (prompt_price if is_user else completion_price) / 1000
+
 def getModelEndpoint(model):
     print(model)
     for k, v in ENDPOINT_DICT.items():
@@ -1,17 +1,52 @@
 import json
 import os
 
-import requests
-
 from qtpy.QtCore import Qt, Signal
-from qtpy.QtGui import QPixmap, QFont
-from qtpy.QtWidgets import QScrollArea, QVBoxLayout, QToolButton, QMenu, QAction, QWidget, QLabel, QHBoxLayout, QTextEdit, QStackedWidget
+from qtpy.QtGui import QPixmap, QFont, QTextCursor
+from qtpy.QtWidgets import QScrollArea, QVBoxLayout, QToolButton, QMenu, QAction, QWidget, QLabel, QHBoxLayout, QTextEdit, \
+    QStackedWidget, QFrame
 
+from pyqt_openai.httpClient import getHttpClient
 from pyqt_openai.svgToolButton import SvgToolButton
 
 
+class StreamLabel(QTextEdit):
+    """
+    read-only text which the streamed reply is appended to, only the end of the document is laid out again
+    (QLabel.setText copies and lays out the whole text for every chunk)
+
+    it grows with the text like QLabel, ChatBrowser replaces it with QLabel when the stream is finished
+    """
+    def __init__(self, text=''):
+        super().__init__()
+        self.__initUi()
+        self.appendText(text)
+
+    def __initUi(self):
+        self.setReadOnly(True)
+        self.setFrameShape(QFrame.NoFrame)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setStyleSheet('QTextEdit { background-color: #DDD; padding: 1em }')
+        self.document().documentLayout().documentSizeChanged.connect(self.__adjustHeight)
+
+    def appendText(self, text):
+        cursor = self.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+
+    def text(self):
+        return self.toPlainText()
+
+    def __adjustHeight(self, size):
+        # frame and padding around the viewport
+        self.setFixedHeight(int(size.height()) + self.height() - self.viewport().height())
+
+
 class ChatBrowser(QScrollArea):
     convUnitUpdated = Signal(int, int, str)
+    # id of the conversation, seq of the oldest unit shown
+    olderConvUnitRequested = Signal(int, int)
 
     def __init__(self):
         super().__init__()
@@ -21,6 +56,16 @@ class ChatBrowser(QScrollArea):
     def __initVal(self):
         self.__cur_id = 0
 
+        # paging state of the current conversation
+        self.__oldest_seq = 0
+        self.__has_older = False
+        self.__loading_older = False
+        # distance between the scroll value and the bottom to keep after the next range change,
+        # 0 means sticking to the bottom, None means leaving the scroll bar as it is
+        self.__scroll_from_bottom = None
+        # key (id of the request) - label of the reply which is being streamed
+        self.__stream_dict = {}
+
     def __initUi(self):
         self.__homeWidget = QLabel('Home')
         self.__homeWidget.setAlignment(Qt.AlignCenter)
@@ -40,24 +85,64 @@ class ChatBrowser(QScrollArea):
         self.setWidget(widget)
         self.setWidgetResizable(True)
 
+        self.verticalScrollBar().valueChanged.connect(self.__scrollValueChanged)
+        self.verticalScrollBar().rangeChanged.connect(self.__scrollRangeChanged)
+
     def getChatWidget(self):
         return self.__chatWidget
 
-    def showLabel(self, text, user_f, stream_f, image_f):
+    def showLabel(self, text, user_f, image_f):
+        """
+        show the whole unit and store it, the streamed reply is shown by appendStream and finishStream instead
+        """
         if image_f:
             self.showImage(text, user_f)
         else:
-            self.showText(text, stream_f, user_f)
-        if not stream_f:
-            # change user_f type from bool to int to insert in db
-            self.convUnitUpdated.emit(self.__cur_id, int(user_f), text)
+            self.showText(text, user_f)
+        # change user_f type from bool to int to insert in db
+        self.convUnitUpdated.emit(self.__cur_id, int(user_f), text)
+
+    def appendStream(self, key, text):
+        """
+        append the chunk to the reply of the request ``key``, its label is added on the first chunk
+        """
+        self.widget().setCurrentIndex(1)
+        lbl = self.__stream_dict.get(key)
+        if lbl:
+            lbl.appendText(text)
+        else:
+            self.__stream_dict[key] = StreamLabel(text)
+            self.getChatWidget().layout().addWidget(self.__stream_dict[key])
 
-    def streamFinished(self):
-        self.convUnitUpdated.emit(self.__cur_id, 0, self.getLastResponse())
+    def finishStream(self, key, text):
+        """
+        replace the streamed reply of the request ``key`` with the label of ``text`` (the whole reply, with its mark),
+        where it is, as the stored units are shown. it is not stored, the caller stores ``text``
+        """
+        lbl = self.__stream_dict.pop(key, None)
+        if lbl:
+            self.getChatWidget().layout().replaceWidget(lbl, self.__getLabel(text, False))
+            lbl.deleteLater()
+        else:
+            self.showText(text, False)
+
+    def showNote(self, text):
+        """
+        show the note which is not a part of the conversation (not stored, skipped by getAllText and getEveryResponse)
+        """
+        self.widget().setCurrentIndex(1)
+        noteLbl = QLabel(text)
+        noteLbl.setObjectName('note')
+        noteLbl.setWordWrap(True)
+        noteLbl.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        noteLbl.setStyleSheet('QLabel { color: gray; padding: 0.5em }')
+        # not AlignLeft, so the streamed text is not appended to it
+        noteLbl.setAlignment(Qt.AlignHCenter)
+        self.getChatWidget().layout().addWidget(noteLbl)
 
     def showImage(self, image_url, user_f):
         chatLbl = QLabel()
-        response = requests.get(image_url)
+        response = getHttpClient().get(image_url)
         pixmap = QPixmap()
         pixmap.loadFromData(response.content)
         pixmap = pixmap.scaled(chatLbl.width(), chatLbl.height())
@@ -65,14 +150,17 @@ class ChatBrowser(QScrollArea):
         chatLbl.setStyleSheet('QLabel { background-color: #DDD; padding: 1em }')
         self.getChatWidget().layout().addWidget(chatLbl)
 
-    def showText(self, text, stream_f, user_f):
+    def showText(self, text, user_f):
         if self.widget().currentWidget() == self.__chatWidget:
             pass
         else:
             self.widget().setCurrentIndex(1)
-        self.__setLabel(text, stream_f, user_f)
+        self.__setLabel(text, user_f)
 
-    def __setLabel(self, text, stream_f, user_f):
+    def __setLabel(self, text, user_f):
+        self.getChatWidget().layout().addWidget(self.__getLabel(text, user_f))
+
+    def __getLabel(self, text, user_f):
         chatLbl = QLabel(text)
         chatLbl.setWordWrap(True)
         chatLbl.setTextInteractionFlags(Qt.TextSelectableByMouse)
@@ -80,15 +168,10 @@ class ChatBrowser(QScrollArea):
             chatLbl.setStyleSheet('QLabel { padding: 1em }')
             chatLbl.setAlignment(Qt.AlignRight)
         else:
-            if stream_f:
-                lbl = self.getChatWidget().layout().itemAt(self.getChatWidget().layout().count()-1).widget()
-                if isinstance(lbl, QLabel) and lbl.alignment() == Qt.AlignLeft:
-                    lbl.setText(lbl.text()+text)
-                    return
             chatLbl.setStyleSheet('QLabel { background-color: #DDD; padding: 1em }')
             chatLbl.setAlignment(Qt.AlignLeft)
             chatLbl.setOpenExternalLinks(True)
-        self.getChatWidget().layout().addWidget(chatLbl)
+        return chatLbl
 
     def event(self, e):
         if e.type() == 43:
@@ -103,7 +186,7 @@ class ChatBrowser(QScrollArea):
             for i in range(lay.count()):
                 if lay.itemAt(i) and lay.itemAt(i).widget():
                     widget = lay.itemAt(i).widget()
-                    if isinstance(widget, QLabel):
+                    if isinstance(widget, QLabel) and widget.objectName() != 'note':
                         all_text_lst.append(widget.text())
 
         return '\n'.join(all_text_lst)
@@ -122,12 +205,11 @@ class ChatBrowser(QScrollArea):
         lay = self.getChatWidget().layout()
         if lay:
             text_lst = []
-            for i in range(lay.count()):
-                item = lay.itemAt(i)
-                if item and item.widget():
-                    widget = item.widget()
-                    if isinstance(widget, QLabel) and i % 2 == 1:
-                        text_lst.append(widget.text())
+            widget_lst = [lay.itemAt(i).widget() for i in range(lay.count()) if lay.itemAt(i) and lay.itemAt(i).widget()]
+            widget_lst = [widget for widget in widget_lst if widget.objectName() != 'note']
+            for i, widget in enumerate(widget_lst):
+                if isinstance(widget, QLabel) and i % 2 == 1:
+                    text_lst.append(widget.text())
             return '\n'.join(text_lst)
         else:
             return ''
@@ -138,12 +220,21 @@ class ChatBrowser(QScrollArea):
             for i in range(lay.count()-1, -1, -1):
                 item = lay.itemAt(i)
                 if item and item.widget():
-                    lay.removeWidget(item.widget())
+                    widget = item.widget()
+                    lay.removeWidget(widget)
+                    widget.deleteLater()
         self.widget().setCurrentIndex(0)
+        self.__stream_dict.clear()
+        self.__oldest_seq = 0
+        self.__has_older = False
+        self.__loading_older = False
 
     def isNew(self):
         return self.widget().currentIndex() == 0
 
+    def getCurId(self):
+        return self.__cur_id
+
     def setCurId(self, id):
         self.__cur_id = id
 
@@ -152,11 +243,54 @@ class ChatBrowser(QScrollArea):
         self.setCurId(id)
 
     def replaceConv(self, id, conv_data):
+        """
+        show the newest page of the conversation, older pages are requested with olderConvUnitRequested on scrolling up
+        :param conv_data: list of (seq, is_user, conv) in ascending order
+        """
         self.clear()
         self.setCurId(id)
         self.widget().setCurrentIndex(1)
-        for i in range(len(conv_data)):
-            self.__setLabel(conv_data[i], False, not bool(i % 2))
+        for seq, is_user, conv in conv_data:
+            self.__setLabel(conv, bool(is_user))
+        self.__oldest_seq = conv_data[0][0] if conv_data else 0
+        self.__has_older = bool(conv_data)
+        self.__scroll_from_bottom = 0
+
+    def prependConv(self, id, conv_data):
+        """
+        show an older page above the units which are already shown, keeping the visible part where it is
+        :param conv_data: list of (seq, is_user, conv) in ascending order, empty if there is nothing older
+        """
+        if id != self.__cur_id:
+            return
+        self.__loading_older = False
+        if not conv_data:
+            self.__has_older = False
+            return
+        bar = self.verticalScrollBar()
+        self.__scroll_from_bottom = bar.maximum() - bar.value()
+        lay = self.getChatWidget().layout()
+        for i, (seq, is_user, conv) in enumerate(conv_data):
+            lay.insertWidget(i, self.__getLabel(conv, bool(is_user)))
+        self.__oldest_seq = conv_data[0][0]
+
+    def __requestOlderConvUnit(self):
+        if self.__has_older and not self.__loading_older:
+            self.__loading_older = True
+            self.olderConvUnitRequested.emit(self.__cur_id, self.__oldest_seq)
+
+    def __scrollValueChanged(self, v):
+        bar = self.verticalScrollBar()
+        if v == bar.minimum() and bar.maximum() > 0 and self.__scroll_from_bottom is None:
+            self.__requestOlderConvUnit()
+
+    def __scrollRangeChanged(self, min_v, max_v):
+        if self.__scroll_from_bottom is not None:
+            self.verticalScrollBar().setValue(max_v - self.__scroll_from_bottom)
+            self.__scroll_from_bottom = None
+        # the page doesn't fill the view yet, so there is no scrolling which would request the older one
+        if max_v == 0:
+            self.__requestOlderConvUnit()
 
 
 class TextEditPrompt(QTextEdit):
@@ -244,6 +378,9 @@ class TextEditPropmtGroup(QWidget):
         return content
 
 class Prompt(QWidget):
+    # stop button is clicked, the reply which is being generated should be cancelled
+    stopClicked = Signal()
+
     def __init__(self):
         super().__init__()
         self.__initUi()
@@ -278,7 +415,16 @@ class Prompt(QWidget):
         settingsBtn.setMenu(menu)
         settingsBtn.setPopupMode(QToolButton.InstantPopup)
 
+        # shown while the reply of the current conversation is being generated
+        self.__stopBtn = SvgToolButton()
+        self.__stopBtn.setIcon('ico/stop.svg')
+        self.__stopBtn.setToolTip('Stop Generating (Esc)')
+        self.__stopBtn.setShortcut('Esc')
+        self.__stopBtn.clicked.connect(self.stopClicked)
+        self.__stopBtn.setVisible(False)
+
         lay = QVBoxLayout()
+        lay.addWidget(self.__stopBtn)
         lay.addWidget(settingsBtn)
         lay.setContentsMargins(1, 1, 1, 1)
         lay.setAlignment(Qt.AlignBottom)
@@ -301,6 +447,9 @@ class Prompt(QWidget):
     def getTextEdit(self):
         return self.__textEditGroup.getGroup()[1]
 
+    def setStopVisible(self, f):
+        self.__stopBtn.setVisible(f)
+
     def getContent(self):
         return self.__textEditGroup.getContent()
 
@@ -0,0 +1,214 @@
+from qtpy.QtCore import Qt
+from qtpy.QtGui import QIcon
+from qtpy.QtWidgets import QDialog, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QListWidgetItem, QLineEdit, \
+    QTextEdit, QPushButton, QScrollArea, QSplitter, QFrame
+
+from pyqt_openai.apiData import getChatModel
+from pyqt_openai.chatWidget import StreamLabel
+from pyqt_openai.compareRunner import CompareBranch, CompareRunner, parseTemperatures
+from pyqt_openai.requestBridge import RequestBridge
+from pyqt_openai.requestEngine import RequestEngine
+
+
+class CompareColumn(QWidget):
+    """
+    answer of one model (and sampling setting) of the comparison, with its time to first token, latency and tokens
+    """
+    def __init__(self, branch: CompareBranch):
+        super().__init__()
+        self.__initVal(branch)
+        self.__initUi()
+
+    def __initVal(self, branch):
+        self.__branch = branch
+
+    def __initUi(self):
+        model, temperature = self.__branch.getModel(), self.__branch.getTemperature()
+        title = model if temperature is None else f'{model} (temperature {temperature})'
+        titleLbl = QLabel(title)
+        titleLbl.setWordWrap(True)
+
+        self.__stopBtn = QPushButton('Stop')
+        self.__stopBtn.clicked.connect(self.__branch.cancel)
+
+        lay = QHBoxLayout()
+        lay.addWidget(titleLbl)
+        lay.addWidget(self.__stopBtn)
+        lay.setContentsMargins(0, 0, 0, 0)
+
+        headerWidget = QWidget()
+        headerWidget.setLayout(lay)
+
+        self.__answerLbl = StreamLabel()
+
+        answerArea = QScrollArea()
+        answerArea.setWidget(self.__answerLbl)
+        answerArea.setWidgetResizable(True)
+        answerArea.setFrameShape(QFrame.NoFrame)
+
+        self.__statsLbl = QLabel('Waiting...')
+        self.__statsLbl.setWordWrap(True)
+        self.__statsLbl.setStyleSheet('QLabel { color: gray }')
+
+        lay = QVBoxLayout()
+        lay.addWidget(headerWidget)
+        lay.addWidget(answerArea)
+        lay.addWidget(self.__statsLbl)
+        lay.setContentsMargins(2, 2, 2, 2)
+        self.setLayout(lay)
+        self.setMinimumWidth(240)
+
+    def appendText(self, text):
+        self.__answerLbl.appendText(text)
+
+    def showMessage(self, text):
+        # rich text, unlike the answer
+        self.__answerLbl.append(text)
+
+    def finish(self, state):
+        """
+        :param state: how the request ended, e.g. 'Done', 'Stopped', 'Failed'
+        """
+        self.__stopBtn.setEnabled(False)
+        ttft, latency, prompt_token_cnt, completion_token_cnt, cost = self.__branch.getStats()
+        ttft_text = '-' if ttft is None else f'{ttft:.2f}s'
+        self.__statsLbl.setText(f'{state}\n'
+                                f'Time to first token: {ttft_text}, latency: {latency:.2f}s\n'
+                                f'Tokens: {prompt_token_cnt} prompt, {completion_token_cnt} completion (${cost:.4f})')
+
+    def getStatsText(self):
+        return self.__statsLbl.text()
+
+
+class CompareDialog(QDialog):
+    """
+    send one prompt to several models (or temperatures) at once and show their answers side by side
+
+    the requests run concurrently in the request engine of the main window (CompareRunner),
+    their results come to the dialog through a listener of its own. the cache is not used, every answer is generated
+    """
+    def __init__(self, requestEngine: RequestEngine, system='', *args, **kwargs):
+        """
+        :param requestEngine: engine of the main window, which is already started
+        :param system: system message sent with the prompt
+        """
+        super().__init__(*args, **kwargs)
+        self.__initVal(requestEngine, system)
+        self.__initUi()
+
+    def __initVal(self, requestEngine, system):
+        self.__system = system
+        # handle id - column
+        self.__column_dict = {}
+
+        self.__requestBridge = RequestBridge()
+        self.__requestBridge.chunkGenerated.connect(self.__chunkGenerated)
+        self.__requestBridge.replyGenerated.connect(self.__replyGenerated)
+        self.__requestBridge.failed.connect(self.__requestFailed)
+        self.__requestBridge.cancelled.connect(self.__requestCancelled)
+        self.__requestBridge.done.connect(self.__requestDone)
+        self.__runner = CompareRunner(requestEngine, self.__requestBridge)
+        # the remaining requests are cancelled when the dialog is closed
+        self.finished.connect(lambda result: self.__runner.stopAll())
+
+        # handle id - how it ended
+        self.__state_dict = {}
+
+    def __initUi(self):
+        self.setWindowTitle('Compare Models')
+        self.setWindowIcon(QIcon('ico/openai.svg'))
+        self.setWindowFlags(Qt.Window | Qt.WindowCloseButtonHint)
+
+        self.__modelListWidget = QListWidget()
+        for model in getChatModel():
+            item = QListWidgetItem(model)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Unchecked)
+            self.__modelListWidget.addItem(item)
+        self.__modelListWidget.setMaximumHeight(120)
+
+        self.__temperatureLineEdit = QLineEdit()
+        self.__temperatureLineEdit.setPlaceholderText('Temperatures, e.g. 0, 0.7, 1 (default if empty)')
+
+        self.__promptTextEdit = QTextEdit()
+        self.__promptTextEdit.setPlaceholderText('Write the prompt to compare...')
+        self.__promptTextEdit.setMaximumHeight(120)
+
+        self.__runBtn = QPushButton('Run')
+        self.__runBtn.clicked.connect(self.__run)
+
+        stopAllBtn = QPushButton('Stop All')
+        stopAllBtn.clicked.connect(self.__runner.stopAll)
+
+        lay = QHBoxLayout()
+        lay.addWidget(self.__temperatureLineEdit)
+        lay.addWidget(self.__runBtn)
+        lay.addWidget(stopAllBtn)
+        lay.setContentsMargins(0, 0, 0, 0)
+
+        runWidget = QWidget()
+        runWidget.setLayout(lay)
+
+        lay = QVBoxLayout()
+        lay.addWidget(QLabel('Models'))
+        lay.addWidget(self.__modelListWidget)
+        lay.addWidget(self.__promptTextEdit)
+        lay.addWidget(runWidget)
+        lay.setContentsMargins(0, 0, 0, 0)
+
+        topWidget = QWidget()
+        topWidget.setLayout(lay)
+
+        self.__columnSplitter = QSplitter()
+        self.__columnSplitter.setChildrenCollapsible(False)
+
+        columnArea = QScrollArea()
+        columnArea.setWidget(self.__columnSplitter)
+        columnArea.setWidgetResizable(True)
+
+        lay = QVBoxLayout()
+        lay.addWidget(topWidget)
+        lay.addWidget(columnArea)
+        self.setLayout(lay)
+        self.resize(1024, 768)
+
+    def __run(self):
+        prompt = self.__promptTextEdit.toPlainText().strip()
+        model_lst = [self.__modelListWidget.item(i).text() for i in range(self.__modelListWidget.count())
+                     if self.__modelListWidget.item(i).checkState() == Qt.Checked]
+        if not prompt or not model_lst:
+            return
+        self.__clearColumns()
+        # the results are queued signals, so nothing of the new run comes before its columns are added
+        for branch in self.__runner.run(prompt, model_lst, parseTemperatures(self.__temperatureLineEdit.text()), self.__system):
+            column = CompareColumn(branch)
+            self.__columnSplitter.addWidget(column)
+            self.__column_dict[branch.getHandle().getId()] = column
+
+    def __clearColumns(self):
+        for i in range(self.__columnSplitter.count()-1, -1, -1):
+            self.__columnSplitter.widget(i).deleteLater()
+        self.__column_dict.clear()
+        self.__state_dict.clear()
+
+    def __chunkGenerated(self, handle_id, conv_id, text):
+        if handle_id in self.__column_dict:
+            self.__column_dict[handle_id].appendText(text)
+
+    def __replyGenerated(self, handle_id, conv_id, text, image_f):
+        if handle_id in self.__column_dict:
+            self.__column_dict[handle_id].appendText(text)
+
+    def __requestFailed(self, handle_id, conv_id, message):
+        if handle_id in self.__column_dict:
+            self.__column_dict[handle_id].showMessage(message)
+            self.__state_dict[handle_id] = 'Failed'
+
+    def __requestCancelled(self, handle_id, conv_id, text):
+        if handle_id in self.__column_dict:
+            self.__state_dict[handle_id] = 'Stopped'
+
+    def __requestDone(self, handle_id, conv_id):
+        column = self.__column_dict.get(handle_id)
+        if column:
+            column.finish(self.__state_dict.pop(handle_id, 'Done'))
@@ -0,0 +1,113 @@
+from pyqt_openai.apiData import getModelCost
+from pyqt_openai.requestEngine import RequestEngine, RequestListener
+from pyqt_openai.tokenizer import getTokenizer
+
+
+# conversation id of the comparison requests, no conversation has it
+COMPARE_CONV_ID = 0
+
+
+def parseTemperatures(text):
+    """
+    :param text: comma separated temperatures, e.g. '0, 0.7, 1'
+    :return: list of the temperatures (clamped into 0 - 2), [None] (the default one) if nothing valid is written
+    """
+    temperature_lst = []
+    for value in text.split(','):
+        try:
+            temperature_lst.append(min(max(float(value), 0), 2))
+        except ValueError:
+            pass
+    return temperature_lst or [None]
+
+
+class CompareBranch:
+    """
+    request of one model (and sampling setting) of the comparison
+    """
+    def __init__(self, model, temperature, prompt_token_cnt):
+        super().__init__()
+        self.__model = model
+        self.__temperature = temperature
+        self.__prompt_token_cnt = prompt_token_cnt
+        self.__handle = None
+
+    def getModel(self):
+        return self.__model
+
+    def getTemperature(self):
+        return self.__temperature
+
+    def getOpenAIArg(self, messages):
+        openai_arg = {'model': self.__model, 'messages': messages, 'stream': True}
+        if self.__temperature is not None:
+            openai_arg['temperature'] = self.__temperature
+        return openai_arg
+
+    def getHandle(self):
+        return self.__handle
+
+    def setHandle(self, handle):
+        self.__handle = handle
+
+    def cancel(self):
+        if self.__handle:
+            self.__handle.cancel()
+
+    def getStats(self):
+        """
+        :return: (time to first token, latency, prompt tokens, completion tokens, cost in USD) of the ended request,
+        the times are seconds (time to first token is None if nothing came)
+        """
+        completion_token_cnt = getTokenizer(self.__model).count(self.__handle.getText())
+        cost = getModelCost(self.__model, self.__prompt_token_cnt, True) + getModelCost(self.__model, completion_token_cnt, False)
+        return self.__handle.getTimeToFirstToken(), self.__handle.getLatency(), self.__prompt_token_cnt, completion_token_cnt, cost
+
+
+class CompareRunner:
+    """
+    send one prompt to every model and temperature at once, through the request engine of the main window
+    with the listener of the comparison, so its results don't go to the conversations.
+    the cache is not used, every answer is generated
+    """
+    def __init__(self, engine: RequestEngine, listener: RequestListener):
+        super().__init__()
+        self.__engine = engine
+        self.__listener = listener
+        # handle id - branch of the latest run
+        self.__branch_dict = {}
+
+    def run(self, prompt, model_lst, temperature_lst=None, system=''):
+        """
+        cancel the previous run and submit a branch for each pair of the model and the temperature
+
+        :param temperature_lst: None means the default temperature only
+        :return: list of the branches, in the order of the models then the temperatures
+        """
+        self.stopAll()
+        self.__branch_dict.clear()
+        messages = [{'role': 'user', 'content': prompt}]
+        if system:
+            messages.insert(0, {'role': 'system', 'content': system})
+        branch_lst = []
+        for model in model_lst:
+            prompt_token_cnt = sum(getTokenizer(model).countBatch([message['content'] for message in messages]))
+            for temperature in temperature_lst or [None]:
+                branch = CompareBranch(model, temperature, prompt_token_cnt)
+                # every branch is submitted at once, the rate limiter decides when each one goes
+                handle = self.__engine.submit(COMPARE_CONV_ID, model, branch.getOpenAIArg(messages),
+                                              listener=self.__listener, cache_f=False)
+                branch.setHandle(handle)
+                self.__branch_dict[handle.getId()] = branch
+                branch_lst.append(branch)
+        return branch_lst
+
+    def getBranch(self, handle_id):
+        """
+        :return: branch of the request of the latest run, None if it is of the previous one
+        """
+        return self.__branch_dict.get(handle_id)
+
+    def stopAll(self):
+        for branch in self.__branch_dict.values():
+            branch.cancel()
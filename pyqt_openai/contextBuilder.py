@@ -0,0 +1,200 @@
+import re
+from collections import OrderedDict
+
+from pyqt_openai.apiData import getModelContextWindow
+from pyqt_openai.sqlite import SqliteDatabase
+from pyqt_openai.tokenizer import getTokenizer
+
+
+# appended to the reply which is stopped while it is generated
+TRUNCATED_MARK = '\n\n[truncated]'
+# failure message of RequestEngine, shown and stored in place of the reply
+_ERROR_PREFIX = '<p style="color:red">'
+# reply of the image models, the url of the image
+_IMAGE_URL_PATTERN = re.compile(r'https?://\S+')
+
+
+def isContextUnit(is_user, conv):
+    """
+    :return: False for the units which are not a turn of the conversation, the failure messages,
+    the urls of the images and the stopped replies
+    """
+    if is_user:
+        return True
+    return not (conv.startswith(_ERROR_PREFIX) or conv.endswith(TRUNCATED_MARK) or _IMAGE_URL_PATTERN.fullmatch(conv))
+
+
+class _ConvContext:
+    """
+    messages of one conversation which are already read from the database, the newest ones after the summary
+    (if it has one), and the newest part of them which fits into the last budget
+    """
+    def __init__(self, summary_row=None):
+        """
+        :param summary_row: (until_seq, summary, token_cnt) of the latest summary
+        """
+        self.summary_row = summary_row
+        self.from_seq = summary_row[0] if summary_row else 0
+        # seq of the oldest and the newest unit read, None if nothing is read yet
+        self.first_seq = None
+        self.last_seq = None
+        # every unit after the summary is read
+        self.complete_f = False
+        self.message_lst = []
+        self.token_cnt_lst = []
+        # message_lst[start:] is what fits, total is the count of its tokens
+        self.start = 0
+        self.total = 0
+
+    def append(self, message, token_cnt):
+        self.message_lst.append(message)
+        self.token_cnt_lst.append(token_cnt)
+        self.total += token_cnt
+
+    def prepend(self, message_lst, token_cnt_lst):
+        """
+        add the older messages, they are not in what fits until the next fit
+        """
+        self.message_lst[:0] = message_lst
+        self.token_cnt_lst[:0] = token_cnt_lst
+        self.start += len(message_lst)
+
+    def fit(self, budget):
+        # drop the oldest ones while it is over the budget,
+        # take the older ones back if the budget got bigger (another model, shorter prompt)
+        while self.start < len(self.message_lst) and self.total > budget:
+            self.total -= self.token_cnt_lst[self.start]
+            self.start += 1
+        while self.start > 0 and self.total + self.token_cnt_lst[self.start-1] <= budget:
+            self.start -= 1
+            self.total += self.token_cnt_lst[self.start]
+        return self.message_lst[self.start:]
+
+
+class ContextBuilder:
+    """
+    build the messages of the chat completion from the units of the conversation stored in the database,
+    as user/assistant turns, the newest ones as many as the context window of the model allows
+
+    if the older units are summarized (ConvSummarizer), the latest summary and the units after it are sent instead.
+    units are read newest first, one page at a time until the budget is filled, so a long conversation
+    without a summary isn't read as a whole. what is read is cached for each conversation,
+    so the next turn only reads the units added since then.
+    the failure messages, the urls of the images and the stopped replies are not sent (isContextUnit)
+    """
+    # tokens which every message takes besides its content (role, separators)
+    MESSAGE_TOKEN_CNT = 4
+
+    def __init__(self, db: SqliteDatabase, reply_ratio: float = 0.25, cache_size: int = 16, page_size: int = 50):
+        """
+        :param reply_ratio: part of the context window which is left for the reply
+        :param cache_size: count of the conversations to keep the messages of
+        :param page_size: count of the units read at once
+        """
+        super().__init__()
+        self.__db = db
+        self.__reply_ratio = reply_ratio
+        self.__cache_size = cache_size
+        self.__page_size = page_size
+        # conversation id - _ConvContext, the least recently used one first
+        self.__ctx_dict = OrderedDict()
+
+    def countTokens(self, text, model=None):
+        return getTokenizer(model).count(text)
+
+    def countMessages(self, messages, model=None):
+        """
+        :return: count of the tokens of the messages of the chat completion, what the prompt is billed for
+        """
+        cnt_lst = getTokenizer(model).countBatch([message['content'] for message in messages])
+        return sum(cnt_lst) + len(messages) * ContextBuilder.MESSAGE_TOKEN_CNT
+
+    def getBudget(self, model, system='', prompt=''):
+        """
+        :return: count of the tokens which the previous turns of the conversation can take
+        """
+        window = getModelContextWindow(model)
+        budget = window - int(window * self.__reply_ratio)
+        for text in (system, prompt):
+            budget -= self.countTokens(text, model) + ContextBuilder.MESSAGE_TOKEN_CNT
+        return max(budget, 0)
+
+    def build(self, id, model, system='', prompt=''):
+        """
+        :param prompt: new message of the user which is not stored yet
+        :return: messages of the chat completion
+        """
+        ctx = self.__getContext(id)
+        budget = self.getBudget(model, system, prompt)
+        messages = []
+        if system:
+            messages.append({'role': 'system', 'content': system})
+        if ctx.summary_row:
+            until_seq, summary, token_cnt = ctx.summary_row
+            messages.append({'role': 'system', 'content': f'Summary of the earlier conversation:\n{summary}'})
+            budget = max(budget - (token_cnt or self.countTokens(summary, model)) - ContextBuilder.MESSAGE_TOKEN_CNT, 0)
+        self.__readContext(id, model, ctx, budget)
+        messages.extend(ctx.fit(budget))
+        messages.append({'role': 'user', 'content': prompt})
+        return messages
+
+    def invalidate(self, id=None):
+        """
+        forget what is read of the conversation (every conversation if id is None)
+        """
+        if id is None:
+            self.__ctx_dict.clear()
+        else:
+            self.__ctx_dict.pop(id, None)
+
+    def __getContext(self, id):
+        ctx = self.__ctx_dict.pop(id, None)
+        summary_row = self.__db.selectConvSummary(id)
+        # read again from the new summary
+        if ctx is None or ctx.summary_row != summary_row:
+            ctx = _ConvContext(summary_row)
+        self.__ctx_dict[id] = ctx
+        while len(self.__ctx_dict) > self.__cache_size:
+            self.__ctx_dict.popitem(last=False)
+        return ctx
+
+    def __readContext(self, id, model, ctx, budget):
+        """
+        read the units added since the last time, and the older ones until what is read is over the budget
+        """
+        if ctx.last_seq is None:
+            row_lst = self.__db.selectConvUnitAfter(id, ctx.from_seq, limit=self.__page_size)
+            ctx.complete_f = len(row_lst) < self.__page_size
+            ctx.first_seq = row_lst[0][0] if row_lst else None
+            ctx.last_seq = row_lst[-1][0] if row_lst else ctx.from_seq
+        else:
+            row_lst = self.__db.selectConvUnitAfter(id, ctx.last_seq)
+            if row_lst:
+                ctx.last_seq = row_lst[-1][0]
+                if ctx.first_seq is None:
+                    ctx.first_seq = row_lst[0][0]
+        message_lst, cnt_lst = self.__toMessages(model, row_lst)
+        for message, cnt in zip(message_lst, cnt_lst):
+            ctx.append(message, cnt)
+
+        while not ctx.complete_f and sum(ctx.token_cnt_lst) < budget:
+            row_lst = self.__db.selectConvUnitAfter(id, ctx.from_seq, ctx.first_seq, self.__page_size)
+            ctx.complete_f = len(row_lst) < self.__page_size
+            if not row_lst:
+                break
+            ctx.first_seq = row_lst[0][0]
+            ctx.prepend(*self.__toMessages(model, row_lst))
+
+    def __toMessages(self, model, row_lst):
+        """
+        :return: (list of the messages, list of their token counts) of the units which are sent
+        """
+        row_lst = [row for row in row_lst if isContextUnit(row[1], row[2])]
+        # token counts are stored with the units, the ones which don't have it (imported before, estimated) are counted together
+        missing_idx_lst = [i for i, row in enumerate(row_lst) if not row[3]]
+        cnt_lst = getTokenizer(model).countBatch([row_lst[i][2] for i in missing_idx_lst])
+        cnt_dict = dict(zip(missing_idx_lst, cnt_lst))
+        message_lst = [{'role': 'user' if is_user else 'assistant', 'content': conv} for seq, is_user, conv, token_cnt in row_lst]
+        token_cnt_lst = [cnt_dict.get(i, token_cnt) + ContextBuilder.MESSAGE_TOKEN_CNT
+                         for i, (seq, is_user, conv, token_cnt) in enumerate(row_lst)]
+        return message_lst, token_cnt_lst
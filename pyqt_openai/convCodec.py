@@ -0,0 +1,133 @@
+import struct, threading, zlib
+
+# optional, zstd (and its trained dictionary) is only available if zstandard is installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ConvCodec:
+    """
+    storage codec of the conversation units
+
+    units shorter than ``threshold`` bytes (or which don't get smaller) are stored as they are (str),
+    the others are stored as bytes with a one byte header which tells how they were compressed
+    - b'z': zlib
+    - b'Z': zstd
+    - b'd' + 4 byte dictionary id: zstd with a trained dictionary
+
+    every format can always be decoded (zstd needs zstandard), whatever the current codec is.
+    zstd (de)compressors are not thread-safe, so every thread gets its own
+    """
+    ZLIB = 'zlib'
+    ZSTD = 'zstd'
+
+    def __init__(self, codec: str = ZLIB, threshold: int = 1024, level: int = 6):
+        """
+        :param codec: 'zlib', 'zstd' or None (store everything as it is)
+        """
+        super().__init__()
+        if codec == ConvCodec.ZSTD and zstandard is None:
+            print('zstandard is not installed, zlib is used instead')
+            codec = ConvCodec.ZLIB
+        self.__codec = codec
+        self.__threshold = threshold
+        self.__level = level
+
+        # dictionary id - zstandard.ZstdCompressionDict
+        self.__dict_dict = {}
+        self.__cur_dict_id = None
+        # compressor and decompressors of each thread
+        self.__local = threading.local()
+
+    def getCodec(self):
+        return self.__codec
+
+    def getHeader(self):
+        """
+        header of the units which are compressed with the current codec (and dictionary)
+        """
+        if self.__codec == ConvCodec.ZLIB:
+            return b'z'
+        elif self.__codec == ConvCodec.ZSTD:
+            return b'Z' if self.__cur_dict_id is None else b'd' + struct.pack('>I', self.__cur_dict_id)
+        return None
+
+    def getThreshold(self):
+        return self.__threshold
+
+    def getDictionaryId(self):
+        return self.__cur_dict_id
+
+    def addDictionary(self, dict_id: int, dict_data: bytes, current: bool = True):
+        """
+        :param current: compress with this dictionary from now on
+        """
+        if zstandard is None:
+            return
+        self.__dict_dict[dict_id] = zstandard.ZstdCompressionDict(dict_data)
+        if current:
+            self.__cur_dict_id = dict_id
+
+    def trainDictionary(self, sample_lst, dict_size: int = 112640):
+        """
+        :param sample_lst: list of str
+        :return: trained dictionary data, None if it can't be trained (zstd is not used or there are not enough samples)
+        """
+        if self.__codec != ConvCodec.ZSTD:
+            return None
+        try:
+            return zstandard.train_dictionary(dict_size, [sample.encode('utf-8') for sample in sample_lst]).as_bytes()
+        except zstandard.ZstdError as e:
+            print(f"Dictionary can't be trained: {e}")
+            return None
+
+    def encode(self, text):
+        if self.__codec is None or text is None:
+            return text
+        data = text.encode('utf-8')
+        if len(data) < self.__threshold:
+            return text
+        if self.__codec == ConvCodec.ZLIB:
+            value = b'z' + zlib.compress(data, self.__level)
+        else:
+            value = self.getHeader() + self.__getCompressor().compress(data)
+        # not worth it
+        if len(value) >= len(data) * 0.9:
+            return text
+        return value
+
+    def decode(self, value):
+        if not isinstance(value, bytes):
+            return value
+        header = value[:1]
+        if header == b'z':
+            return zlib.decompress(value[1:]).decode('utf-8')
+        if zstandard is None:
+            raise RuntimeError('zstandard is needed to read the units which were compressed with zstd')
+        if header == b'Z':
+            return self.__getDecompressor(None).decompress(value[1:]).decode('utf-8')
+        if header == b'd':
+            dict_id = struct.unpack('>I', value[1:5])[0]
+            return self.__getDecompressor(dict_id).decompress(value[5:]).decode('utf-8')
+        raise ValueError(f'Unknown header of the stored unit: {header}')
+
+    def __getCompressor(self):
+        # made again when the current dictionary changes
+        compressor_dict_id, compressor = getattr(self.__local, 'compressor', (None, None))
+        if compressor is None or compressor_dict_id != self.__cur_dict_id:
+            compressor = zstandard.ZstdCompressor(level=self.__level, dict_data=self.__dict_dict.get(self.__cur_dict_id))
+            self.__local.compressor = (self.__cur_dict_id, compressor)
+        return compressor
+
+    def __getDecompressor(self, dict_id):
+        decompressor_dict = getattr(self.__local, 'decompressor_dict', None)
+        if decompressor_dict is None:
+            decompressor_dict = self.__local.decompressor_dict = {}
+        if dict_id not in decompressor_dict:
+            if dict_id is None:
+                decompressor_dict[dict_id] = zstandard.ZstdDecompressor()
+            else:
+                decompressor_dict[dict_id] = zstandard.ZstdDecompressor(dict_data=self.__dict_dict[dict_id])
+        return decompressor_dict[dict_id]
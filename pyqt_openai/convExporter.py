@@ -0,0 +1,141 @@
+import gzip, html, json
+from functools import partial
+
+from pyqt_openai.sqlite import SqliteDatabase
+
+
+class ConvExporter:
+    """
+    base class of the streaming exporters
+
+    units are read one by one from the database and written through a buffered (or gzip) file,
+    so memory stays the same no matter how many conversations are exported.
+    subclasses write each part of the file with ``_writeBegin``, ``_writeConvBegin``, ``_writeUnit``,
+    ``_writeConvEnd`` and ``_writeEnd``
+    """
+    # write buffer of the uncompressed output
+    buffer_size = 1 << 20
+
+    def __init__(self, db: SqliteDatabase):
+        super().__init__()
+        self._db = db
+
+    def export(self, ids, filename, progress_callback=None, compress=None):
+        """
+        same arguments as SqliteDatabase.export, so the ui calls every format the same way
+
+        :param ids: ids of the conversations to export, every conversation if it is None
+        :param compress: write gzip, if it is None the file is compressed when its name ends with .gz
+        :param progress_callback: called with (done, total) count of conversations
+        """
+        if compress is None:
+            compress = filename.endswith('.gz')
+        total = len(ids) if ids is not None else self._db.selectConvCount()
+        if compress:
+            f = gzip.open(filename, 'wt', encoding='utf-8')
+        else:
+            f = open(filename, 'w', encoding='utf-8', buffering=self.buffer_size)
+        with f:
+            self._writeBegin(f)
+            cur_id = None
+            done = 0
+            i = 0
+            for id, title, is_user, conv in self._db.iterConvUnit(ids):
+                if id != cur_id:
+                    if cur_id is not None:
+                        self._writeConvEnd(f)
+                        done += 1
+                        if progress_callback:
+                            progress_callback(done, total)
+                    cur_id = id
+                    i = 0
+                    self._writeConvBegin(f, id, title)
+                self._writeUnit(f, i, 'user' if is_user else 'assistant', conv)
+                i += 1
+            if cur_id is not None:
+                self._writeConvEnd(f)
+                done += 1
+            self._writeEnd(f)
+        if progress_callback:
+            progress_callback(total, total)
+
+    def _writeBegin(self, f):
+        pass
+
+    def _writeConvBegin(self, f, id, title):
+        pass
+
+    def _writeUnit(self, f, i, role, content):
+        pass
+
+    def _writeConvEnd(self, f):
+        pass
+
+    def _writeEnd(self, f):
+        pass
+
+
+class JsonlConvExporter(ConvExporter):
+    """
+    one conversation per line, messages are in the format of the OpenAI chat API
+    {"id": 1, "title": "...", "messages": [{"role": "user", "content": "..."}, ...]}
+    """
+    def _writeConvBegin(self, f, id, title):
+        f.write(f'{{"id": {id}, "title": {json.dumps(title, ensure_ascii=False)}, "messages": [')
+
+    def _writeUnit(self, f, i, role, content):
+        if i > 0:
+            f.write(', ')
+        f.write(json.dumps({'role': role, 'content': content}, ensure_ascii=False))
+
+    def _writeConvEnd(self, f):
+        f.write(']}\n')
+
+
+class MarkdownConvExporter(ConvExporter):
+    def _writeConvBegin(self, f, id, title):
+        f.write(f'# {title}\n\n')
+
+    def _writeUnit(self, f, i, role, content):
+        f.write(f'**{role.capitalize()}**\n\n{content}\n\n')
+
+    def _writeConvEnd(self, f):
+        f.write('---\n\n')
+
+
+class HtmlConvExporter(ConvExporter):
+    def _writeBegin(self, f):
+        f.write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+                '<style>'
+                'body { font-family: Arial; max-width: 60em; margin: auto; } '
+                '.unit { padding: 1em; white-space: pre-wrap; } '
+                '.user { text-align: right; } '
+                '.assistant { background-color: #DDD; }'
+                '</style>\n</head>\n<body>\n')
+
+    def _writeConvBegin(self, f, id, title):
+        f.write(f'<section>\n<h1>{html.escape(title)}</h1>\n')
+
+    def _writeUnit(self, f, i, role, content):
+        f.write(f'<div class="unit {role}">{html.escape(content)}</div>\n')
+
+    def _writeConvEnd(self, f):
+        f.write('</section>\n')
+
+    def _writeEnd(self, f):
+        f.write('</body>\n</html>\n')
+
+
+def getExportDict(db: SqliteDatabase):
+    """
+    :return: name filter of the file dialog - function which writes that format,
+    every function is called as fn(ids, filename, progress_callback=...)
+    """
+    # the chosen filter decides the compression, not the name the user typed
+    return {
+        'SQLite DB file (*.db)': db.export,
+        'JSON Lines (*.jsonl)': partial(JsonlConvExporter(db).export, compress=False),
+        'JSON Lines, gzip (*.jsonl.gz)': partial(JsonlConvExporter(db).export, compress=True),
+        'Markdown (*.md)': MarkdownConvExporter(db).export,
+        'HTML (*.html)': HtmlConvExporter(db).export,
+    }
@@ -0,0 +1,181 @@
+import codecs, json, os
+from datetime import datetime, timezone
+
+from pyqt_openai.sqlite import SqliteDatabase
+from pyqt_openai.tokenizer import getTokenizer
+
+
+def iterJsonArray(f, chunk_size=1 << 20):
+    """
+    parse the items of the first json array in the binary file one by one, without loading the whole file
+
+    it works with a top-level array (ChatGPT conversations.json) and with an object which holds the array
+    (legacy conv_history.json, {"each_conv_lst": [...]})
+    :return: generator of (item, count of the bytes read so far)
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buf = ''
+    pos = 0
+    read_size = chunk_size
+    eof = False
+    bytes_read = 0
+
+    def read(size):
+        nonlocal buf, pos, eof, bytes_read
+        data = f.read(size)
+        bytes_read += len(data)
+        eof = not data
+        # drop what is already parsed, so the buffer only holds the current item
+        buf = buf[pos:] + text_decoder.decode(data, final=eof)
+        pos = 0
+
+    # skip to the beginning of the array
+    while True:
+        i = buf.find('[', pos)
+        if i >= 0:
+            pos = i + 1
+            break
+        pos = len(buf)
+        if eof:
+            return
+        read(chunk_size)
+
+    while True:
+        # skip whitespace and separators
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            read(chunk_size)
+        if pos >= len(buf) or buf[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # the item is not complete yet, read more (twice as much each time for very big items)
+            read(read_size)
+            read_size *= 2
+            continue
+        read_size = chunk_size
+        pos = end
+        yield item, bytes_read
+
+
+class ConvImporter:
+    """
+    bulk import of the conversation exports
+
+    supported formats
+    - legacy conv_history.json of this app, {"each_conv_lst": [{"id", "title", "conv_data": [...]}, ...]}
+    - conversations.json of the ChatGPT data export, [{"title", "create_time", "update_time", "mapping", "current_node"}, ...]
+
+    the file is parsed item by item and written in batches with executemany, one transaction per batch.
+    the count of the imported items is saved with each batch, so importing the same file again
+    resumes right after the last finished batch (and does nothing if it already finished).
+    """
+    def __init__(self, db: SqliteDatabase, batch_size: int = 5000):
+        """
+        :param batch_size: count of the units in one transaction
+        """
+        super().__init__()
+        self.__db = db
+        self.__batch_size = batch_size
+
+    def importFile(self, filename, progress_callback=None):
+        """
+        :param progress_callback: called with (done, total), per mille of the file size
+        :return: count of the imported conversations
+        """
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        import_id, item_cnt, finished = self.__db.selectImport(filename, stat.st_size, stat.st_mtime)
+        if finished:
+            return 0
+
+        imported_cnt = 0
+        conv_lst = []
+        unit_cnt = 0
+        future = None
+        with open(filename, 'rb') as f:
+            i = 0
+            for i, (item, bytes_read) in enumerate(iterJsonArray(f), 1):
+                # already imported before it was interrupted
+                if i <= item_cnt:
+                    continue
+                conv = self.__parseItem(item)
+                if conv:
+                    conv_lst.append(conv)
+                    unit_cnt += len(conv[3])
+                if unit_cnt >= self.__batch_size:
+                    # waiting for the previous batch only, so parsing and writing overlap
+                    if future:
+                        future.result()
+                    future = self.__db.insertConvBatch(self.__countTokens(conv_lst), import_id, i,
+                                                       token_exact=getTokenizer().isExact())
+                    imported_cnt += len(conv_lst)
+                    conv_lst = []
+                    unit_cnt = 0
+                    if progress_callback:
+                        progress_callback(bytes_read * 1000 // max(stat.st_size, 1), 1000)
+            future = self.__db.insertConvBatch(self.__countTokens(conv_lst), import_id, i, finished=True,
+                                               token_exact=getTokenizer().isExact())
+            imported_cnt += len(conv_lst)
+            future.result()
+        if progress_callback:
+            progress_callback(1000, 1000)
+        return imported_cnt
+
+    def __countTokens(self, conv_lst):
+        """
+        count the tokens of every unit of the batch at once, they are stored with the units
+
+        :return: list of (title, insert_dt, update_dt, [(is_user, conv, token_cnt), ...])
+        """
+        cnt_lst = getTokenizer().countBatch([conv for _, _, _, unit_lst in conv_lst for _, conv in unit_lst])
+        cnt_iter = iter(cnt_lst)
+        return [(title, insert_dt, update_dt, [(is_user, conv, next(cnt_iter)) for is_user, conv in unit_lst])
+                for title, insert_dt, update_dt, unit_lst in conv_lst]
+
+    def __parseItem(self, item):
+        """
+        :return: (title, insert_dt, update_dt, [(is_user, conv), ...]) or None if the item is not a conversation
+        """
+        if not isinstance(item, dict):
+            return None
+        if 'mapping' in item:
+            return self.__parseChatGPTItem(item)
+        if 'conv_data' in item:
+            # user and AI take turns, starting with the user
+            unit_lst = [(i % 2 == 0, conv) for i, conv in enumerate(item['conv_data'])]
+            return item.get('title', 'New Chat'), None, None, unit_lst
+        return None
+
+    def __parseChatGPTItem(self, item):
+        mapping = item['mapping'] or {}
+        # the conversation is a tree (every edited message is a branch), follow the current branch from its leaf
+        node_id = item.get('current_node')
+        node_id_lst = []
+        while node_id and node_id in mapping:
+            node_id_lst.append(node_id)
+            node_id = mapping[node_id].get('parent')
+
+        unit_lst = []
+        for node_id in reversed(node_id_lst):
+            message = mapping[node_id].get('message') or {}
+            role = (message.get('author') or {}).get('role')
+            if role not in ('user', 'assistant'):
+                continue
+            parts = (message.get('content') or {}).get('parts') or []
+            text = '\n'.join(part for part in parts if isinstance(part, str)).strip()
+            if text:
+                unit_lst.append((role == 'user', text))
+        return item.get('title') or 'New Chat', self.__toDt(item.get('create_time')), self.__toDt(item.get('update_time')), unit_lst
+
+    def __toDt(self, timestamp):
+        if timestamp is None:
+            return None
+        return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
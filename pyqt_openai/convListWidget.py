@@ -21,8 +21,22 @@ class ConvItemWidget(QWidget):
     def __initUi(self, text):
         self.__topicLbl = QLabel(text)
 
+        # matched part of the conversation, only visible while searching
+        self.__snippetLbl = QLabel()
+        self.__snippetLbl.setWordWrap(True)
+        self.__snippetLbl.setTextFormat(Qt.RichText)
+        self.__snippetLbl.setStyleSheet('QLabel { color: #666; }')
+        self.__snippetLbl.setVisible(False)
+
+        # count of the messages, tokens and cost
+        self.__statsLbl = QLabel()
+        self.__statsLbl.setStyleSheet('QLabel { color: #999; }')
+        self.__statsLbl.setVisible(False)
+
         lay = QVBoxLayout()
         lay.addWidget(self.__topicLbl)
+        lay.addWidget(self.__statsLbl)
+        lay.addWidget(self.__snippetLbl)
         lay.setContentsMargins(0, 0, 0, 0)
 
         leftWidget = QWidget()
@@ -64,6 +78,25 @@ class ConvItemWidget(QWidget):
     def text(self):
         return self.__topicLbl.text()
 
+    def snippet(self):
+        return self.__snippetLbl.text()
+
+    def setStats(self, msg_cnt: int, token_cnt: int, cost: float, model: str = None):
+        text = f'{msg_cnt} messages'
+        if token_cnt:
+            text += f' · {token_cnt / 1000:.1f}k tokens' if token_cnt >= 1000 else f' · {token_cnt} tokens'
+        if cost:
+            text += f' · ${cost:.2f}'
+        self.__statsLbl.setText(text)
+        self.__statsLbl.setToolTip(model or '')
+        self.__statsLbl.setVisible(True)
+        self.__item.setSizeHint(self.sizeHint())
+
+    def setSnippet(self, snippet: str):
+        self.__snippetLbl.setText(snippet)
+        self.__snippetLbl.setVisible(bool(snippet))
+        self.__item.setSizeHint(self.sizeHint())
+
     def enterEvent(self, e):
         self.__btnWidget.setVisible(True)
         return super().enterEvent(e)
@@ -92,17 +125,59 @@ class ConvListWidget(QListWidget):
         self.itemClicked.connect(self.__clicked)
         self.currentItemChanged.connect(self.changed)
 
-    def addConv(self, text: str, id: int):
+    def addConv(self, text: str, id: int, stats=None, append: bool = False):
+        """
+        :param stats: (msg_cnt, token_cnt, cost, model)
+        :param append: add it at the bottom (next page of the list) instead of the top (new one)
+        """
         item = QListWidgetItem()
         item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
         item.setCheckState(Qt.Unchecked)
-        widget = ConvItemWidget(text, item, id)
+        item.setData(Qt.UserRole, id)
+        if append:
+            self.addItem(item)
+        else:
+            self.insertItem(0, item)
+        self.__setConvWidget(item, text, stats)
+
+    def __setConvWidget(self, item, text, stats=None, snippet=''):
+        widget = ConvItemWidget(text, item, item.data(Qt.UserRole))
         widget.convUpdated.connect(self.convUpdated)
+        if stats:
+            widget.setStats(*stats)
+        widget.setSnippet(snippet)
         item.setSizeHint(widget.sizeHint())
-        item.setData(Qt.UserRole, id)
-        self.insertItem(0, item)
         self.setItemWidget(item, widget)
 
+    def moveConvToTop(self, item, stats=None):
+        """
+        move the conversation to the top, it is the latest updated one now.
+        its check state, visibility and snippet stay as they are, and so does the current conversation
+
+        :param stats: (msg_cnt, token_cnt, cost, model) to show
+        """
+        widget = self.itemWidget(item)
+        row = self.row(item)
+        if row <= 0:
+            if stats:
+                widget.setStats(*stats)
+            return
+        text, snippet = widget.text(), widget.snippet()
+        hidden_f = item.isHidden()
+        current_f = self.currentItem() is item
+        # taking the current item out would change the current conversation
+        self.blockSignals(True)
+        try:
+            self.takeItem(row)
+            self.insertItem(0, item)
+            # the item widget is deleted with the row it was in
+            self.__setConvWidget(item, text, stats, snippet)
+            item.setHidden(hidden_f)
+            if current_f:
+                self.setCurrentItem(item)
+        finally:
+            self.blockSignals(False)
+
     def __clicked(self, item):
         potentialChkBoxWidgetInItem = QApplication.widgetAt(self.cursor().pos())
         if isinstance(potentialChkBoxWidgetInItem, QWidget) and potentialChkBoxWidgetInItem.children():
@@ -119,6 +194,9 @@ class ConvListWidget(QListWidget):
             if item.checkState() != state:
                 item.setCheckState(state)
 
+    def getItemsById(self):
+        return {self.item(i).data(Qt.UserRole): self.item(i) for i in range(self.count())}
+
     def getCheckedRowsIds(self):
         return self.__getFlagRows(Qt.Checked, is_id=True)
 
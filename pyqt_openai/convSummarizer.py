@@ -0,0 +1,98 @@
+import openai
+
+from pyqt_openai.apiData import getModelContextWindow
+from pyqt_openai.contextBuilder import isContextUnit
+from pyqt_openai.rateLimiter import RateLimiter, getRateLimiter
+from pyqt_openai.sqlite import SqliteDatabase
+from pyqt_openai.tokenizer import getTokenizer
+
+
+class ConvSummarizer:
+    """
+    compact the long conversations, the older units are summarized into a checkpoint (conv_summary_tb)
+    which is sent instead of them from then on (ContextBuilder), the units themselves are kept as they are
+
+    each summary covers the previous summary and the units after it (rolling), so a unit is never summarized twice
+    """
+    def __init__(self, db: SqliteDatabase, model: str = 'gpt-3.5-turbo', threshold_ratio: float = 0.5, keep_ratio: float = 0.25):
+        """
+        :param model: model which writes the summary
+        :param threshold_ratio: summarize when the units after the latest summary take this part of the context window
+        :param keep_ratio: newest units which take this part of the context window are left as they are
+        """
+        super().__init__()
+        self.__db = db
+        self.__model = model
+        self.__threshold_ratio = threshold_ratio
+        self.__keep_ratio = keep_ratio
+
+    def needsSummary(self, id, model):
+        """
+        :param model: model of the conversation, its context window decides the threshold
+        """
+        summary_row = self.__db.selectConvSummary(id)
+        token_cnt = self.__db.selectConvTokenCnt(id, summary_row[0] if summary_row else 0)
+        return token_cnt > getModelContextWindow(model) * self.__threshold_ratio
+
+    def summarize(self, id, model, progress_callback=None):
+        """
+        summarize the units of the conversation except for the newest ones, runs in a worker thread
+
+        :return: seq of the last summarized unit, None if there is nothing to summarize
+        """
+        summary_row = self.__db.selectConvSummary(id)
+        summary = summary_row[1] if summary_row else ''
+        row_lst = self.__db.selectConvUnitAfter(id, summary_row[0] if summary_row else 0)
+        # the failure messages, the images and the stopped replies are not sent, so they are not summarized either
+        row_lst = [row for row in row_lst if isContextUnit(row[1], row[2])]
+
+        # leave the newest units
+        keep_budget = getModelContextWindow(model) * self.__keep_ratio
+        tokenizer = getTokenizer(self.__model)
+        cnt_lst = [token_cnt or tokenizer.count(conv) for seq, is_user, conv, token_cnt in row_lst]
+        kept_cnt = 0
+        i = len(row_lst)
+        while i > 0 and kept_cnt + cnt_lst[i-1] <= keep_budget:
+            i -= 1
+            kept_cnt += cnt_lst[i]
+        row_lst, cnt_lst = row_lst[:i], cnt_lst[:i]
+        if not row_lst:
+            return None
+
+        # the units which don't fit into the context window of the summarizer at once are summarized in several rounds
+        budget = getModelContextWindow(self.__model) // 2
+        chunk_lst = []
+        chunk_cnt = 0
+        for idx, (row, cnt) in enumerate(zip(row_lst, cnt_lst)):
+            # some room is left for the role of each unit
+            if chunk_lst and chunk_cnt + cnt > budget * 0.9 - tokenizer.count(summary):
+                summary = self.__summarize(summary, chunk_lst, budget)
+                if progress_callback:
+                    progress_callback(idx, len(row_lst))
+                chunk_lst = []
+                chunk_cnt = 0
+            chunk_lst.append(row)
+            chunk_cnt += cnt
+        summary = self.__summarize(summary, chunk_lst, budget)
+        if progress_callback:
+            progress_callback(len(row_lst), len(row_lst))
+
+        until_seq = row_lst[-1][0]
+        self.__db.insertConvSummary(id, until_seq, summary, tokenizer.count(summary), self.__model).result()
+        return until_seq
+
+    def __summarize(self, summary, row_lst, budget):
+        transcript = '\n\n'.join(f'{"User" if is_user else "Assistant"}: {conv}' for seq, is_user, conv, token_cnt in row_lst)
+        content = f'Summary so far:\n{summary}\n\nConversation:\n{transcript}' if summary else transcript
+        # a single unit can be longer than the whole budget
+        content = getTokenizer(self.__model).truncate(content, budget)
+        messages = [
+            {'role': 'system', 'content': 'Summarize the conversation below (and the summary so far, if there is one) '
+                                          'concisely. Keep the facts, decisions, names, numbers and code which '
+                                          'the rest of the conversation may refer to.'},
+            {'role': 'user', 'content': content},
+        ]
+        # after the interactive prompts
+        response = getRateLimiter().call(lambda: openai.ChatCompletion.create(model=self.__model, messages=messages),
+                                         self.__model, budget, RateLimiter.BATCH)
+        return response['choices'][0]['message']['content'].strip()
@@ -0,0 +1,195 @@
+import asyncio, threading
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+# optional, only needed for the async requests
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+API_BASE_URL = 'https://api.openai.com'
+# key of the settings (pyqt_openai.ini) - (argument of HttpClient, its type)
+SETTINGS_ARG_DICT = {
+    'HTTP_POOL_SIZE': ('pool_maxsize', int),
+    'HTTP_TIMEOUT': ('read_timeout', float),
+}
+
+
+class HttpClient:
+    """
+    keep-alive http client shared by the whole application (chat, completion, image download, key validation),
+    so the TCP/TLS connection to the API is made once and reused by every request
+
+    the sync session is also given to openai (openai.requestssession), the async one (aiohttp) is made for each event loop.
+    neither requests nor aiohttp speaks HTTP/2, so it is HTTP/1.1 with keep-alive
+    """
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 16, connect_timeout: float = 5, read_timeout: float = 600,
+                 max_retries: int = 2):
+        """
+        :param pool_connections: count of the hosts to keep the connections of
+        :param pool_maxsize: count of the connections kept for each host (the count of the concurrent requests)
+        :param read_timeout: seconds to wait for the next bytes of the response, long since the streaming can be slow
+        :param max_retries: retries of the failed connections (not of the failed requests)
+        """
+        super().__init__()
+        self.__initVal(pool_connections, pool_maxsize, connect_timeout, read_timeout, max_retries)
+        self.__initSession()
+
+    def __initVal(self, pool_connections, pool_maxsize, connect_timeout, read_timeout, max_retries):
+        self.__pool_connections = pool_connections
+        self.__pool_maxsize = pool_maxsize
+        self.__timeout = (connect_timeout, read_timeout)
+        self.__max_retries = max_retries
+        # event loop - aiohttp.ClientSession
+        self.__async_session_dict = {}
+        # functions which get the headers of every response
+        self.__response_hook_lst = []
+        self.__lock = threading.Lock()
+
+    def __initSession(self):
+        self.__session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.__pool_connections, pool_maxsize=self.__pool_maxsize,
+                              max_retries=self.__max_retries)
+        self.__session.mount('https://', adapter)
+        self.__session.mount('http://', adapter)
+        self.__session.hooks['response'].append(self.__onResponse)
+        # every request of openai goes through this session from now on
+        openai.requestssession = self.__session
+
+    def getSession(self):
+        return self.__session
+
+    def addResponseHook(self, fn):
+        """
+        :param fn: called with the headers of every response (of both sessions), in the thread of the request
+        """
+        self.__response_hook_lst.append(fn)
+
+    def __onResponse(self, response, *args, **kwargs):
+        for fn in self.__response_hook_lst:
+            fn(response.headers)
+
+    async def __onAsyncResponse(self, session, ctx, params):
+        for fn in self.__response_hook_lst:
+            fn(params.response.headers)
+
+    def getTimeout(self):
+        """
+        :return: (connect timeout, read timeout)
+        """
+        return self.__timeout
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.__timeout)
+        return self.__session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.__timeout)
+        return self.__session.post(url, **kwargs)
+
+    def getAsyncSession(self, loop):
+        """
+        get the aiohttp session of the event loop, it is made on the first call (which should be in that loop)
+
+        it is also set as openai.aiosession, so openai's async functions (acreate) called in that loop use it
+        """
+        if aiohttp is None:
+            raise RuntimeError('aiohttp is needed for the async requests')
+        with self.__lock:
+            session = self.__async_session_dict.get(loop)
+            if session is None or session.closed:
+                connector = aiohttp.TCPConnector(limit_per_host=self.__pool_maxsize)
+                timeout = aiohttp.ClientTimeout(sock_connect=self.__timeout[0], sock_read=self.__timeout[1])
+                trace_config = aiohttp.TraceConfig()
+                trace_config.on_request_end.append(self.__onAsyncResponse)
+                session = self.__async_session_dict[loop] = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                                                  trace_configs=[trace_config])
+        if hasattr(openai, 'aiosession'):
+            openai.aiosession.set(session)
+        return session
+
+    async def closeAsyncSession(self, loop):
+        """
+        close the aiohttp session of the event loop, in that loop
+        """
+        with self.__lock:
+            session = self.__async_session_dict.pop(loop, None)
+        if session:
+            await session.close()
+
+    def warmup(self, url=API_BASE_URL):
+        """
+        connect to the API in the background before the first request, so the first token comes sooner
+
+        the response doesn't matter (it is 401 without the key), only the connection which is left in the pool
+        """
+        def fn():
+            try:
+                self.__session.head(url, timeout=self.__timeout)
+            except requests.RequestException as e:
+                print(f"An error occurred while connecting to {url}: {e}")
+        threading.Thread(target=fn, daemon=True).start()
+
+    async def warmupAsync(self, loop, url=API_BASE_URL):
+        """
+        the same as ``warmup`` for the aiohttp session of the event loop (the one of the chat requests), in that loop
+        """
+        if aiohttp is None:
+            return
+        try:
+            async with self.getAsyncSession(loop).head(url) as response:
+                await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"An error occurred while connecting to {url}: {e}")
+
+    def close(self):
+        self.__session.close()
+        if getattr(openai, 'requestssession', None) is self.__session:
+            openai.requestssession = None
+
+
+def getSettingsArgs(value_fn):
+    """
+    :param value_fn: returns the value of the key of the settings (e.g. QSettings.value), None if it is not set
+    :return: arguments of HttpClient which are set in the settings
+    """
+    kwargs = {}
+    for key, (arg, type_) in SETTINGS_ARG_DICT.items():
+        value = value_fn(key)
+        if value not in (None, ''):
+            kwargs[arg] = type_(value)
+    return kwargs
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def getHttpClient(**kwargs):
+    """
+    get the http client shared by the whole application, it is made on the first call
+
+    :param kwargs: arguments of HttpClient, only for the first call
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(**kwargs)
+        elif kwargs:
+            raise RuntimeError('The http client is already made')
+        return _client
+
+
+def closeHttpClient():
+    """
+    close the shared http client (if it is made), the next getHttpClient makes it again
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -1,45 +1,105 @@
 import json
 
-from qtpy.QtCore import Signal
+from qtpy.QtCore import Signal, QThread, QTimer, Qt
 from qtpy.QtWidgets import QWidget, QCheckBox, QListWidget, QVBoxLayout, QHBoxLayout, QSpacerItem, QSizePolicy, QListWidgetItem, \
-    QLabel
+    QLabel, QProgressBar, QComboBox
 
 from pyqt_openai.convListWidget import ConvListWidget
 from pyqt_openai.searchBar import SearchBar
 from pyqt_openai.svgButton import SvgButton
 
 
+class ConvSearchThread(QThread):
+    """
+    == found Signal ==
+    First: id of the conversation
+    Second: snippet of the matched unit (html), empty if the title matched
+    """
+    found = Signal(int, str)
+
+    def __init__(self, db, text, archived=False, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__db = db
+        self.__text = text
+        self.__archived = archived
+        self.__stopped = False
+
+    def stop(self):
+        self.__stopped = True
+
+    def run(self):
+        try:
+            for id, snippet in self.__db.searchConv(self.__text, archived=self.__archived):
+                if self.__stopped:
+                    break
+                self.found.emit(id, snippet)
+        except Exception as e:
+            print(e)
+
+
 class LeftSideBar(QWidget):
     added = Signal()
     changed = Signal(QListWidgetItem)
     deleted = Signal(list)
     convUpdated = Signal(int, str)
     export = Signal(list)
+    importRequested = Signal()
 
     def __init__(self):
         super().__init__()
+        self.__initVal()
         self.__initUi()
 
+    def __initVal(self):
+        self.__db = None
+        self.__searchText = ''
+        self.__searchThread = None
+        self.__searchItemDict = {}
+
+        # conversations are loaded page by page, the latest updated ones first
+        self.__model = None
+        self.__page_size = 100
+        self.__last_row_key = None
+        self.__has_more_page = False
+        self.__loaded_id_set = set()
+        # conv id - update_dt shown, the item goes to the top when it changes
+        self.__update_dt_dict = {}
+
     def __initUi(self):
+        # search runs after the user stopped typing for a moment, not on every keystroke
+        self.__searchTimer = QTimer(self)
+        self.__searchTimer.setSingleShot(True)
+        self.__searchTimer.setInterval(150)
+        self.__searchTimer.timeout.connect(self.__startSearch)
+
         searchBar = SearchBar()
         searchBar.searched.connect(self.__search)
         searchBar.setPlaceHolder('Search the Conversation...')
 
+        # archived units are not indexed, they are only searched on demand
+        self.__archivedCheckBox = QCheckBox('Search Archived')
+        self.__archivedCheckBox.setToolTip('Search the units of the archived conversations too (slow)')
+        self.__archivedCheckBox.toggled.connect(lambda _: self.__searchTimer.start())
+
         self.__addBtn = SvgButton()
         self.__delBtn = SvgButton()
         self.__saveBtn = SvgButton()
+        self.__importBtn = SvgButton()
 
         self.__addBtn.setIcon('ico/add.svg')
         self.__delBtn.setIcon('ico/delete.svg')
         self.__saveBtn.setIcon('ico/download.svg')
+        self.__importBtn.setIcon('ico/upload.svg')
 
         self.__addBtn.setToolTip('Add')
         self.__delBtn.setToolTip('Delete')
         self.__saveBtn.setToolTip('Save')
+        self.__importBtn.setToolTip('Import (conv_history.json, ChatGPT conversations.json)')
 
         self.__addBtn.clicked.connect(self.__addClicked)
         self.__delBtn.clicked.connect(self.__deleteClicked)
         self.__saveBtn.clicked.connect(self.__saveClicked)
+        self.__importBtn.clicked.connect(self.importRequested)
 
         self.__allCheckBox = QCheckBox('Check All')
         self.__allCheckBox.stateChanged.connect(self.__stateChanged)
@@ -50,6 +110,7 @@ class LeftSideBar(QWidget):
         lay.addWidget(self.__addBtn)
         lay.addWidget(self.__delBtn)
         lay.addWidget(self.__saveBtn)
+        lay.addWidget(self.__importBtn)
         lay.setContentsMargins(0, 0, 0, 0)
 
         navWidget = QWidget()
@@ -58,6 +119,13 @@ class LeftSideBar(QWidget):
         lay = QVBoxLayout()
         lay.addWidget(navWidget)
         lay.addWidget(searchBar)
+        lay.addWidget(self.__archivedCheckBox)
+
+        # filter by the model of the latest message
+        self.__modelCmbBox = QComboBox()
+        self.__modelCmbBox.addItem('All Models')
+        self.__modelCmbBox.currentIndexChanged.connect(self.__modelChanged)
+        lay.addWidget(self.__modelCmbBox)
 
         topWidget = QWidget()
         topWidget.setLayout(lay)
@@ -66,10 +134,16 @@ class LeftSideBar(QWidget):
         self.__convListWidget = ConvListWidget()
         self.__convListWidget.changed.connect(self.changed)
         self.__convListWidget.convUpdated.connect(self.convUpdated)
+        self.__convListWidget.verticalScrollBar().valueChanged.connect(self.__scrolled)
+
+        # progress of saving and importing
+        self.__progressBar = QProgressBar()
+        self.__progressBar.setVisible(False)
 
         lay = QVBoxLayout()
         lay.addWidget(topWidget)
         lay.addWidget(self.__convListWidget)
+        lay.addWidget(self.__progressBar)
 
         self.setLayout(lay)
 
@@ -77,7 +151,9 @@ class LeftSideBar(QWidget):
         self.added.emit()
 
     def addToList(self, id):
-        self.__convListWidget.addConv('New Chat', id)
+        self.__convListWidget.addConv('New Chat', id, stats=(0, 0, 0, None))
+        self.__loaded_id_set.add(id)
+        self.__update_dt_dict[id] = None
         self.__convListWidget.setCurrentRow(0)
 
     def isCurrentConvExists(self):
@@ -91,22 +167,144 @@ class LeftSideBar(QWidget):
         self.__allCheckBox.setChecked(False)
 
     def __saveClicked(self):
-        self.export.emit(self.__convListWidget.getUncheckedRowsIds())
+        # save the checked conversations, or every conversation if nothing is checked
+        ids = self.__convListWidget.getCheckedRowsIds()
+        if not ids:
+            # the ones which are not loaded yet too
+            ids = self.__db.selectConvIds(self.__model)
+        self.export.emit(ids)
+
+    def setExportProgress(self, done, total):
+        self.__saveBtn.setEnabled(False)
+        self.__setProgress('Saving... %p%', done, total)
+
+    def exportFinished(self):
+        self.__saveBtn.setEnabled(True)
+        self.__progressBar.setVisible(False)
+
+    def setImportProgress(self, done, total):
+        self.__importBtn.setEnabled(False)
+        self.__setProgress('Importing... %p%', done, total)
+
+    def importFinished(self):
+        self.__importBtn.setEnabled(True)
+        self.__progressBar.setVisible(False)
+
+    def __setProgress(self, format, done, total):
+        self.__progressBar.setFormat(format)
+        self.__progressBar.setVisible(True)
+        self.__progressBar.setRange(0, total)
+        self.__progressBar.setValue(done)
 
     def __stateChanged(self, f):
         self.__convListWidget.toggleState(f)
 
     def __search(self, text):
-        for i in range(self.__convListWidget.count()):
-            item = self.__convListWidget.item(i)
-            widget = self.__convListWidget.itemWidget(item)
-            item.setHidden(False if text.lower() in widget.text().lower() else True)
+        self.__searchText = text.strip()
+        self.__searchTimer.start()
+
+    def __startSearch(self):
+        if self.__searchThread:
+            self.__searchThread.found.disconnect(self.__found)
+            self.__searchThread.stop()
+            self.__searchThread = None
+
+        text = self.__searchText
+        self.__searchItemDict = self.__convListWidget.getItemsById()
+        # every item is hidden and shown again as soon as it is found
+        for item in self.__searchItemDict.values():
+            item.setHidden(bool(text))
+            self.__convListWidget.itemWidget(item).setSnippet('')
+        if not text or not self.__db:
+            return
+
+        self.__searchThread = ConvSearchThread(self.__db, text, self.__archivedCheckBox.isChecked(), self)
+        self.__searchThread.found.connect(self.__found)
+        self.__searchThread.finished.connect(self.__searchFinished)
+        self.__searchThread.finished.connect(self.__searchThread.deleteLater)
+        self.__searchThread.start()
+
+    def __searchFinished(self):
+        if self.sender() is self.__searchThread:
+            self.__searchThread = None
+
+    def __found(self, id, snippet):
+        item = self.__searchItemDict.get(id)
+        if item is None:
+            # found in the page which is not loaded yet
+            row = self.__db.selectConvStats(id)
+            if row and (self.__model is None or row[7] == self.__model):
+                self.__addConv(row)
+                item = self.__searchItemDict[id] = self.__convListWidget.item(self.__convListWidget.count()-1)
+        if item:
+            item.setHidden(False)
+            self.__convListWidget.itemWidget(item).setSnippet(snippet)
+
+    def refreshHistory(self):
+        self.__convListWidget.clear()
+        self.initHistory(self.__db)
 
     def initHistory(self, db):
+        self.__db = db
+        self.__last_row_key = None
+        self.__has_more_page = True
+        self.__loaded_id_set = set()
+        self.__update_dt_dict = {}
         try:
-            conv_lst = db.selectAllConv()
-            for conv in conv_lst:
-                id, title = conv[0], conv[1]
-                self.__convListWidget.addConv(title, id)
+            self.__modelCmbBox.blockSignals(True)
+            self.__modelCmbBox.clear()
+            self.__modelCmbBox.addItem('All Models')
+            self.__modelCmbBox.addItems(db.selectConvModels())
+            self.__modelCmbBox.setCurrentIndex(max(self.__modelCmbBox.findText(self.__model), 0) if self.__model else 0)
+            self.__modelCmbBox.blockSignals(False)
+            self.__loadPage()
         except Exception as e:
-            print(e)
\ No newline at end of file
+            print(e)
+
+    def __loadPage(self):
+        rows = self.__db.selectConvPage(self.__model, self.__last_row_key, self.__page_size)
+        for row in rows:
+            # already added by the search
+            if row[0] not in self.__loaded_id_set:
+                self.__addConv(row)
+        if rows:
+            self.__last_row_key = (rows[-1][2], rows[-1][0])
+        self.__has_more_page = len(rows) == self.__page_size
+
+    def __addConv(self, row):
+        id, title, update_dt, archived, msg_cnt, token_cnt, cost, model = row
+        self.__convListWidget.addConv(title, id, stats=(msg_cnt, token_cnt, cost, model), append=True)
+        self.__loaded_id_set.add(id)
+        self.__update_dt_dict[id] = update_dt
+
+    def __scrolled(self, value):
+        # next page when it is scrolled to the bottom
+        if self.__has_more_page and value >= self.__convListWidget.verticalScrollBar().maximum():
+            self.__loadPage()
+
+    def __modelChanged(self, idx):
+        self.__model = self.__modelCmbBox.itemText(idx) if idx > 0 else None
+        self.refreshHistory()
+
+    def updateConvStats(self, id):
+        """
+        show the stats of the conversation again after a message is stored in it,
+        and move it to the top since the list is sorted by the last activity
+        """
+        row = self.__db.selectConvStats(id)
+        if not row:
+            return
+        id, title, update_dt, archived, msg_cnt, token_cnt, cost, model = row
+        item = self.__convListWidget.getItemsById().get(id)
+        if item:
+            if update_dt != self.__update_dt_dict.get(id):
+                self.__convListWidget.moveConvToTop(item, row[4:])
+            else:
+                self.__convListWidget.itemWidget(item).setStats(*row[4:])
+        elif self.__model is None or model == self.__model:
+            # in the page which is not loaded yet
+            self.__convListWidget.addConv(title, id, stats=row[4:])
+            self.__loaded_id_set.add(id)
+        self.__update_dt_dict[id] = update_dt
+        if model and self.__modelCmbBox.findText(model) < 0:
+            self.__modelCmbBox.addItem(model)
\ No newline at end of file
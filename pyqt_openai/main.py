@@ -1,27 +1,40 @@
-import inspect
 import json, webbrowser
 
-import openai, requests, os
+import openai, os
 
 from chatWidget import Prompt, ChatBrowser
 
 from notifier import NotifierWidget
 
-from qtpy.QtCore import Qt, QCoreApplication, QThread, QSettings, QEvent, Signal
+from qtpy.QtCore import Qt, QCoreApplication, QSettings, QEvent, Signal
 from qtpy.QtGui import QGuiApplication, QFont, QIcon, QColor, QCursor
 from qtpy.QtWidgets import QMainWindow, QApplication, QVBoxLayout, QWidget, QSplitter, QDialog, QSpinBox, \
     QFileDialog, QToolBar, QWidgetAction, QHBoxLayout, QAction, QMenu, \
     QSystemTrayIcon, QMessageBox, QSizePolicy, QLabel, QListWidgetItem, QLineEdit, QPushButton
 
-from pyqt_openai.apiData import getModelEndpoint
+from pyqt_openai.apiData import getModelEndpoint, getModelCost
 from pyqt_openai.clickableTooltip import ClickableTooltip
+from pyqt_openai.convExporter import getExportDict
+from pyqt_openai.compareDialog import CompareDialog
+from pyqt_openai.contextBuilder import ContextBuilder, TRUNCATED_MARK
+from pyqt_openai.convImporter import ConvImporter
+from pyqt_openai.convSummarizer import ConvSummarizer
 from pyqt_openai.customizeDialog import CustomizeDialog
+from pyqt_openai.httpClient import getHttpClient, closeHttpClient, getSettingsArgs
 from pyqt_openai.leftSideBar import LeftSideBar
 from pyqt_openai.apiData import ModelData
+from pyqt_openai.rateLimiter import getRateLimiter
+from pyqt_openai.requestBridge import RequestBridge
+from pyqt_openai.requestEngine import RequestEngine
+from pyqt_openai.responseCache import ResponseCache
+from pyqt_openai.semanticCache import SemanticCache
 from pyqt_openai.prompt.promptGeneratorWidget import PromptGeneratorWidget
 from pyqt_openai.right_sidebar.aiPlaygroundWidget import AIPlaygroundWidget
 from pyqt_openai.svgButton import SvgButton
-from pyqt_openai.sqlite import SqliteDatabase
+from pyqt_openai.tokenizer import getTokenizer
+from pyqt_openai.sqlite import getDatabase, closeDatabase
+from pyqt_openai.maintenanceScheduler import MaintenanceScheduler
+from pyqt_openai.workerThread import WorkerThread
 
 QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
 QCoreApplication.setAttribute(Qt.AA_UseHighDpiPixmaps)  # HighDPI support
@@ -33,90 +46,99 @@ if os.environ['QT_API'] == 'pyqt5' or os.environ['QT_API'] != 'pyside6':
 QApplication.setFont(QFont('Arial', 12))
 
 
-class OpenAIThread(QThread):
-    """
-    == replyGenerated Signal ==
-    First: response
-    Second: user or AI
-    Third: streaming a chat completion or not
-    Forth: Image generation with DALL-E or not
-    """
-    replyGenerated = Signal(str, bool, bool, bool)
-    streamFinished = Signal()
-
-    def __init__(self, model, openai_arg, is_img, remember_f, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.__model = model
-        self.__endpoint = getModelEndpoint(model)
-        self.__openai_arg = openai_arg
-        self.__remember_f = remember_f
-        self.__is_img = is_img
-
-    def run(self):
-        try:
-            if self.__is_img:
-                response = openai.Image.create(
-                    **self.__openai_arg
-                )
-
-                # TODO get a lot of images
-                image_url = response['data'][0]['url']
-
-                self.replyGenerated.emit(image_url, False, False, True)
-            else:
-                if self.__endpoint == '/v1/chat/completions':
-                    response = openai.ChatCompletion.create(
-                           **self.__openai_arg
-                    )
-                    # if it is streaming, type will be generator
-                    if inspect.isgenerator(response):
-                        for chunk in response:
-                            delta = chunk['choices'][0]['delta']
-                            response_text = delta.get('content', '')
-                            if response_text:
-                                self.replyGenerated.emit(response_text, False, True, False)
-                            else:
-                                finish_reason = chunk['choices'][0].get('finish_reason', '')
-                                if finish_reason:
-                                    self.streamFinished.emit()
-                    else:
-                        response_text = response['choices'][0]['message']['content']
-                        self.replyGenerated.emit(response_text, False, False, False)
-                elif self.__endpoint == '/v1/completions':
-                    openai_object = openai.Completion.create(
-                        **self.__openai_arg
-                    )
-
-                    response_text = openai_object['choices'][0]['text'].strip()
-
-                    # this doesn't store any data, so we manually do that every time
-                    if self.__remember_f:
-                        conv = {
-                            'prompt': self.__openai_arg['prompt'],
-                            'response': response_text,
-                        }
-
-                        with open('conv.json', 'a') as f:
-                            f.write(json.dumps(conv) + '\n')
-
-                    self.replyGenerated.emit(response_text, False, False, False)
-        except openai.error.InvalidRequestError as e:
-            print(e)
-            self.replyGenerated.emit('<p style="color:red">Your request was rejected as a result of our safety system.<br/>'
-                                     'Your prompt may contain text that is not allowed by our safety system.</p>', False, False, False)
-        except openai.error.RateLimitError as e:
-            self.replyGenerated.emit(f'<p style="color:red">{e}<br/>Check the usage: https://platform.openai.com/account/usage<br/>Update to paid account: https://platform.openai.com/account/billing/overview', False, False, False)
-
-
 class OpenAIChatBot(QMainWindow):
+    # emitted in the writer thread when a unit is committed, handled in the gui thread (queued connection)
+    # conv id, model, user or not
+    convUnitStored = Signal(int, str, bool)
+
     def __init__(self):
         super().__init__()
         self.__initVal()
         self.__initUi()
 
     def __initVal(self):
+        self.__settings_struct = QSettings('pyqt_openai.ini', QSettings.IniFormat)
+
+        # storage codec of the conversation units (zlib, zstd or none)
+        if not self.__settings_struct.contains('STORAGE_CODEC'):
+            self.__settings_struct.setValue('STORAGE_CODEC', 'zlib')
+        codec = self.__settings_struct.value('STORAGE_CODEC')
+
+        # path of the database, empty means the default one (conv.db of the data directory)
+        if not self.__settings_struct.contains('DB_PATH'):
+            self.__settings_struct.setValue('DB_PATH', '')
+
         # db
-        self.__db = SqliteDatabase()
+        self.__db = getDatabase(db_filename=self.__settings_struct.value('DB_PATH') or None,
+                                codec=None if codec == 'none' else codec)
+        # keep-alive connections shared by every request, connected before the first prompt
+        if not self.__settings_struct.contains('HTTP_POOL_SIZE'):
+            self.__settings_struct.setValue('HTTP_POOL_SIZE', '16')
+        if not self.__settings_struct.contains('HTTP_TIMEOUT'):
+            self.__settings_struct.setValue('HTTP_TIMEOUT', '600')
+        self.__httpClient = getHttpClient(**getSettingsArgs(self.__settings_struct.value))
+        self.__httpClient.warmup()
+        # buckets of the rate limiter follow the x-ratelimit-* headers of every response
+        self.__httpClient.addResponseHook(getRateLimiter().updateFromHeaders)
+        # requests to the API run concurrently in the event loop of one thread, results come back as signals
+        self.__requestBridge = RequestBridge()
+        self.__requestBridge.chunkGenerated.connect(self.__chunkGenerated)
+        self.__requestBridge.replyGenerated.connect(self.__replyGenerated)
+        self.__requestBridge.streamFinished.connect(self.__streamFinished)
+        self.__requestBridge.failed.connect(self.__requestFailed)
+        self.__requestBridge.cancelled.connect(self.__requestCancelled)
+        self.__requestBridge.similarFound.connect(self.__similarFound)
+        self.__requestBridge.done.connect(self.__afterGenerated)
+        # replies of the same requests are taken from the database, only the deterministic ones unless it is opted in
+        # (the chat doesn't send the temperature, so it is only cached with the opt in)
+        if not self.__settings_struct.contains('RESPONSE_CACHE_ALWAYS'):
+            self.__settings_struct.setValue('RESPONSE_CACHE_ALWAYS', '0')
+        self.__responseCache = ResponseCache(self.__db, always_f=self.__settings_struct.value('RESPONSE_CACHE_ALWAYS') == '1')
+        # replies of the similar prompts (off, offer or serve), it needs numpy
+        if not self.__settings_struct.contains('SEMANTIC_CACHE'):
+            self.__settings_struct.setValue('SEMANTIC_CACHE', 'off')
+        if not self.__settings_struct.contains('SEMANTIC_CACHE_THRESHOLD'):
+            self.__settings_struct.setValue('SEMANTIC_CACHE_THRESHOLD', '0.95')
+        self.__semanticCache = None
+        semantic_cache_mode = self.__settings_struct.value('SEMANTIC_CACHE')
+        if semantic_cache_mode in (SemanticCache.OFFER, SemanticCache.SERVE) and SemanticCache.isAvailable():
+            self.__semanticCache = SemanticCache(self.__db, mode=semantic_cache_mode,
+                                                 threshold=float(self.__settings_struct.value('SEMANTIC_CACHE_THRESHOLD')))
+        # streamed chunks are shown at most once per frame (milliseconds)
+        if not self.__settings_struct.contains('STREAM_FRAME_MS'):
+            self.__settings_struct.setValue('STREAM_FRAME_MS', '16')
+        self.__requestEngine = RequestEngine(self.__requestBridge, response_cache=self.__responseCache,
+                                             semantic_cache=self.__semanticCache,
+                                             frame_interval=float(self.__settings_struct.value('STREAM_FRAME_MS')) / 1000)
+        self.__requestEngine.start()
+        # the chat requests go through the aiohttp session of the engine, not the one warmed up above
+        self.__requestEngine.warmup()
+        # handle id - handle of the requests in flight
+        self.__handle_dict = {}
+        # ids of the handles whose reply is shown in the browser as it comes,
+        # the others (the conversation was changed in the meantime) are stored only
+        self.__shown_handle_id_set = set()
+        # conv id - future of the unit which is stored last, the stats are read again once it is committed
+        self.__unit_future_dict = {}
+        self.convUnitStored.connect(self.__convUnitStored)
+        # messages of the chat completion, from the stored units of the conversation
+        self.__contextBuilder = ContextBuilder(self.__db)
+        # summarize the older units of the long conversations in the background, off by default
+        if not self.__settings_struct.contains('SUMMARIZE_CONV'):
+            self.__settings_struct.setValue('SUMMARIZE_CONV', '0')
+        if not self.__settings_struct.contains('SUMMARY_MODEL'):
+            self.__settings_struct.setValue('SUMMARY_MODEL', 'gpt-3.5-turbo')
+        self.__summarize_conv = self.__settings_struct.value('SUMMARIZE_CONV') == '1'
+        self.__convSummarizer = ConvSummarizer(self.__db, model=self.__settings_struct.value('SUMMARY_MODEL'))
+        self.__summaryThread = None
+        # conversations not updated for this many days are archived, 0 means never
+        if not self.__settings_struct.contains('ARCHIVE_DAYS'):
+            self.__settings_struct.setValue('ARCHIVE_DAYS', '90')
+        # cleaning, archiving, recompressing, vacuum and optimize run while the user is idle
+        self.__maintenanceScheduler = MaintenanceScheduler(self.__db, archive_days=int(self.__settings_struct.value('ARCHIVE_DAYS')),
+                                                           parent=self)
+        # the threads which use the database are stopped before it is closed
+        app.aboutToQuit.connect(self.__quit)
 
         # managing with ini file or something else
         self.__ini_etc_dict = {}
@@ -129,8 +151,6 @@ class OpenAIChatBot(QMainWindow):
         self.__ini_etc_dict['finishReason'] = self.__finishReason
         self.__ini_etc_dict['modelData'] = self.__modelData
 
-        self.__settings_struct = QSettings('pyqt_openai.ini', QSettings.IniFormat)
-
         # make it compatible with version which was used json file as a database
         if self.__isConvHistoryJsonExists():
             self.__migrateJsonToSqlite()
@@ -170,10 +190,12 @@ class OpenAIChatBot(QMainWindow):
         self.__leftSideBarWidget.deleted.connect(self.__deleteConv)
         self.__leftSideBarWidget.convUpdated.connect(self.__updateConv)
         self.__leftSideBarWidget.export.connect(self.__export)
+        self.__leftSideBarWidget.importRequested.connect(self.__import)
 
         self.__lineEdit.returnPressed.connect(self.__chat)
+        self.__prompt.stopClicked.connect(self.__stop)
 
-        self.__browser.convUnitUpdated.connect(self.__updateConvUnit)
+        self.__browser.olderConvUnitRequested.connect(self.__loadOlderConvUnit)
 
         lay = QHBoxLayout()
         lay.addWidget(self.__prompt)
@@ -311,6 +333,13 @@ class OpenAIChatBot(QMainWindow):
         self.__promptBtn.setChecked(True)
         self.__promptBtn.setChecked(False)
 
+        self.__compareAction = QWidgetAction(self)
+        self.__compareBtn = SvgButton()
+        self.__compareBtn.setIcon('ico/compare.svg')
+        self.__compareBtn.clicked.connect(self.__executeCompareDialog)
+        self.__compareAction.setDefaultWidget(self.__compareBtn)
+        self.__compareBtn.setToolTip('Compare Models')
+
         self.__transparentAction = QWidgetAction(self)
         self.__transparentSpinBox = QSpinBox()
         self.__transparentSpinBox.setRange(0, 100)
@@ -362,6 +391,7 @@ class OpenAIChatBot(QMainWindow):
         toolbar.addAction(self.__settingAction)
         toolbar.addAction(self.__promptAction)
         toolbar.addAction(self.__customizeAction)
+        toolbar.addAction(self.__compareAction)
         toolbar.addAction(self.__transparentAction)
         toolbar.addAction(self.__apiAction)
         toolbar.setLayout(lay)
@@ -399,7 +429,7 @@ class OpenAIChatBot(QMainWindow):
     def __setApi(self):
         try:
             api_key = self.__apiLineEdit.text()
-            response = requests.get('https://api.openai.com/v1/engines', headers={'Authorization': f'Bearer {api_key}'})
+            response = self.__httpClient.get('https://api.openai.com/v1/engines', headers={'Authorization': f'Bearer {api_key}'})
             f = response.status_code == 200
             self.__lineEdit.setEnabled(f)
             if f:
@@ -421,6 +451,11 @@ class OpenAIChatBot(QMainWindow):
             self.__apiCheckPreviewLbl.show()
 
     def __chat(self):
+        if self.__leftSideBarWidget.isCurrentConvExists():
+            pass
+        else:
+            self.__addConv()
+
         info_dict = self.__db.selectInfo()
         is_img = info_dict['engine'] in ['DALL-E', 'midjourney', 'stable_diffusion']
         openai_arg = ''
@@ -439,14 +474,13 @@ class OpenAIChatBot(QMainWindow):
                         convs.append(conv)
             # TODO refactoring
             if info_dict['engine'] in ['gpt-3.5-turbo', 'gpt-3.5-turbo-0301', 'gpt-4']:
-                # "assistant" below is for making the AI remember the last question
+                # the reply stored right before has to be in the context
+                self.__waitConvUnit(self.__browser.getCurId())
+                # previous turns of the conversation, as many as the context window of the model allows
                 openai_arg = {
                     'model': info_dict['engine'],
-                    'messages': [
-                        {"role": "system", "content": info_dict['system']},
-                        {"role": "assistant", "content": self.__browser.getAllText()},
-                        {"role": "user", "content": self.__prompt.getContent()},
-                    ],
+                    'messages': self.__contextBuilder.build(self.__browser.getCurId(), info_dict['engine'],
+                                                            info_dict['system'], self.__prompt.getContent()),
                     # 'temperature': info_dict['temperature'],
 
                     # won't use max_tokens, this is set to infinite by default
@@ -462,26 +496,87 @@ class OpenAIChatBot(QMainWindow):
                 }
             else:
                 openai_arg = info_dict
-        if self.__leftSideBarWidget.isCurrentConvExists():
-            pass
-        else:
-            self.__addConv()
 
+        # other conversations can be chosen (and sent to) while waiting for this one
         self.__lineEdit.setEnabled(False)
-        self.__leftSideBarWidget.setEnabled(False)
 
-        self.__browser.showLabel(self.__prompt.getContent(), True, False, False)
+        self.__browser.showLabel(self.__prompt.getContent(), True, False)
 
-        self.__t = OpenAIThread(info_dict['engine'], openai_arg, is_img, self.__remember_past_conv)
-        self.__t.replyGenerated.connect(self.__browser.showLabel)
-        self.__t.streamFinished.connect(self.__browser.streamFinished)
+        handle = self.__requestEngine.submit(self.__browser.getCurId(), info_dict['engine'], openai_arg, is_img)
+        self.__handle_dict[handle.getId()] = handle
+        # stored before the reply, which comes back as a queued signal
+        self.__updateConvUnit(handle, 1, self.__prompt.getContent())
+        self.__shown_handle_id_set.add(handle.getId())
+        self.__prompt.setStopVisible(True)
         self.__lineEdit.clear()
-        self.__t.start()
-        self.__t.finished.connect(self.__afterGenerated)
 
-    def __afterGenerated(self):
-        self.__lineEdit.setEnabled(True)
-        self.__leftSideBarWidget.setEnabled(True)
+    def __stop(self):
+        # the input is enabled when the cancelled request is done (__afterGenerated), right after this,
+        # so the partial reply is stored before the next prompt
+        self.__requestEngine.cancel(self.__browser.getCurId())
+        self.__prompt.setStopVisible(False)
+
+    def __isConvWaiting(self, id):
+        return any(handle.getConvId() == id for handle in self.__handle_dict.values())
+
+    def __chunkGenerated(self, handle_id, conv_id, text):
+        if handle_id in self.__shown_handle_id_set:
+            self.__browser.appendStream(handle_id, text)
+
+    def __replyGenerated(self, handle_id, conv_id, text, image_f):
+        self.__showReply(handle_id, conv_id, text, image_f)
+        handle = self.__handle_dict[handle_id]
+        # this doesn't store any data, so we manually do that every time
+        if self.__remember_past_conv and not image_f and getModelEndpoint(handle.getModel()) == '/v1/completions':
+            conv = {
+                'prompt': handle.getOpenAIArg()['prompt'],
+                'response': text,
+            }
+            with open('conv.json', 'a') as f:
+                f.write(json.dumps(conv) + '\n')
+
+    def __streamFinished(self, handle_id, conv_id, text):
+        if handle_id in self.__shown_handle_id_set:
+            self.__browser.finishStream(handle_id, text)
+        self.__updateConvUnit(self.__handle_dict[handle_id], 0, text)
+
+    def __requestFailed(self, handle_id, conv_id, message):
+        self.__showReply(handle_id, conv_id, message, False, True)
+
+    def __similarFound(self, handle_id, conv_id, prompt, text, similarity):
+        if handle_id in self.__shown_handle_id_set:
+            self.__browser.showNote(f'A similar question was answered before ({similarity:.0%} similar): {prompt}\n\n{text}')
+
+    def __requestCancelled(self, handle_id, conv_id, text):
+        # what is streamed before the stop is kept, marked as cut off
+        shown_f = handle_id in self.__shown_handle_id_set
+        if not text:
+            if shown_f:
+                self.__browser.showNote('Stopped')
+            return
+        if shown_f:
+            self.__browser.finishStream(handle_id, text + TRUNCATED_MARK)
+        self.__updateConvUnit(self.__handle_dict[handle_id], 0, text + TRUNCATED_MARK)
+
+    def __showReply(self, handle_id, conv_id, text, image_f, failed_f=False):
+        if handle_id in self.__shown_handle_id_set:
+            self.__browser.showLabel(text, False, image_f)
+        self.__updateConvUnit(self.__handle_dict[handle_id], 0, text, failed_f)
+
+    def __afterGenerated(self, handle_id, conv_id):
+        self.__handle_dict.pop(handle_id, None)
+        shown_f = handle_id in self.__shown_handle_id_set
+        self.__shown_handle_id_set.discard(handle_id)
+        if conv_id != self.__browser.getCurId():
+            return
+        if not shown_f:
+            # the conversation was chosen again while waiting, show what is stored in the meantime
+            self.__waitConvUnit(conv_id)
+            self.__browser.replaceConv(conv_id, self.__db.selectConvUnitPage(conv_id))
+        # another request of the conversation may be still running
+        waiting_f = self.__isConvWaiting(conv_id)
+        self.__prompt.setStopVisible(waiting_f)
+        self.__lineEdit.setEnabled(not waiting_f)
         self.__lineEdit.setFocus()
         if not self.isVisible():
             self.__notifierWidget = NotifierWidget(informative_text='Response 👌', detailed_text='Click this!')
@@ -495,6 +590,10 @@ class OpenAIChatBot(QMainWindow):
             self.setWindowFlags(self.windowFlags() & ~Qt.WindowStaysOnTopHint)
         self.show()
 
+    def __executeCompareDialog(self):
+        dialog = CompareDialog(self.__requestEngine, self.__db.selectInfo()['system'], self)
+        dialog.exec()
+
     def __executeCustomizeDialog(self):
         dialog = CustomizeDialog(self)
         reply = dialog.exec()
@@ -519,19 +618,37 @@ class OpenAIChatBot(QMainWindow):
             app.quit()
         return super().closeEvent(e)
 
+    def __quit(self):
+        # the requests in flight are cancelled, nothing is queued to the writer after this
+        self.__requestEngine.stop()
+        if self.__summaryThread:
+            self.__summaryThread.wait()
+        self.__maintenanceScheduler.stop()
+        closeHttpClient()
+        # every queued write is flushed
+        closeDatabase()
+
     def __changeConv(self, item: QListWidgetItem):
         # If a 'change' event occurs but there are no items, it should mean that list is empty
         # so reset conv_history.json
         if item:
             id = item.data(Qt.UserRole)
-            conv = self.__db.selectConvUnit(id)
+            # only the newest page, older ones are loaded when scrolling up
+            self.__waitConvUnit(id)
+            conv = self.__db.selectConvUnitPage(id)
             self.__browser.replaceConv(id, conv)
+            self.__lineEdit.setEnabled(not self.__isConvWaiting(id))
+            self.__prompt.setStopVisible(self.__isConvWaiting(id))
         else:
             self.__browser.resetChatWidget(0)
+        # the replies in flight are not shown in the browser anymore, they are stored when they are done
+        self.__shown_handle_id_set.clear()
+
+    def __loadOlderConvUnit(self, id, before_seq):
+        self.__browser.prependConv(id, self.__db.selectConvUnitPage(id, before_seq))
 
     def __addConv(self):
-        self.__db.insertConv('New Chat')
-        cur_id = self.__db.getCursor().lastrowid
+        cur_id = self.__db.insertConv('New Chat').result()
         self.__browser.resetChatWidget(cur_id)
         self.__leftSideBarWidget.addToList(cur_id)
         self.__lineEdit.setFocus()
@@ -542,17 +659,80 @@ class OpenAIChatBot(QMainWindow):
 
     def __deleteConv(self, id_lst):
         for id in id_lst:
+            self.__requestEngine.cancel(id)
             self.__db.deleteConv(id)
+            self.__contextBuilder.invalidate(id)
 
     def __export(self, ids):
-        filename = QFileDialog.getSaveFileName(self, 'Save', os.path.expanduser('~'), 'SQLite DB file (*.db)')
+        # name filter of the file dialog - function which writes that format
+        export_dict = getExportDict(self.__db)
+        filename = QFileDialog.getSaveFileName(self, 'Save', os.path.expanduser('~'), ';;'.join(export_dict.keys()))
+        if filename[0]:
+            filename, name_filter = filename
+            # writing runs in a worker thread, the sidebar shows the progress
+            self.__leftSideBarWidget.setExportProgress(0, len(ids))
+            self.__exportThread = WorkerThread(export_dict.get(name_filter, self.__db.export), ids, filename)
+            self.__exportThread.progressChanged.connect(self.__leftSideBarWidget.setExportProgress)
+            self.__exportThread.finished.connect(self.__leftSideBarWidget.exportFinished)
+            self.__exportThread.start()
+
+    def __import(self):
+        filename = QFileDialog.getOpenFileName(self, 'Import', os.path.expanduser('~'), 'JSON Files (*.json)')
         if filename[0]:
             filename = filename[0]
-            self.__db.export(ids, filename)
-
-    def __updateConvUnit(self, id, user_f, conv_unit=None):
+            self.__leftSideBarWidget.setImportProgress(0, 1000)
+            self.__importThread = WorkerThread(ConvImporter(self.__db).importFile, filename)
+            self.__importThread.progressChanged.connect(self.__leftSideBarWidget.setImportProgress)
+            self.__importThread.finished.connect(self.__leftSideBarWidget.importFinished)
+            self.__importThread.succeeded.connect(self.__leftSideBarWidget.refreshHistory)
+            self.__importThread.start()
+
+    def __updateConvUnit(self, handle, user_f, conv_unit, failed_f=False):
+        """
+        store the unit with the model of its request (the selected one may be changed in the meantime)
+
+        the cost of the user unit is the one of the whole prompt which was sent (system message, summary, previous turns),
+        the failure message costs nothing
+        """
         if conv_unit:
-            self.__db.insertConvUnit(id, user_f, conv_unit)
+            id = handle.getConvId()
+            model = handle.getModel()
+            # stored with the unit, the estimated count is recounted by the maintenance once tiktoken is there
+            tokenizer = getTokenizer(model)
+            token_cnt = 0 if failed_f else tokenizer.count(conv_unit)
+            cost_token_cnt = token_cnt
+            if user_f and 'messages' in handle.getOpenAIArg():
+                cost_token_cnt = self.__contextBuilder.countMessages(handle.getOpenAIArg()['messages'], model)
+            future = self.__db.insertConvUnit(id, user_f, conv_unit, model=model, token_cnt=token_cnt,
+                                              cost=getModelCost(model, cost_token_cnt, user_f), token_exact=tokenizer.isExact())
+            self.__unit_future_dict[id] = future
+            # the gui thread doesn't wait for the commit, the writer thread tells when it is done
+            future.add_done_callback(lambda f: self.convUnitStored.emit(id, model, bool(user_f)))
+
+    def __convUnitStored(self, id, model, user_f):
+        future = self.__unit_future_dict.get(id)
+        if future and future.done():
+            del self.__unit_future_dict[id]
+        self.__leftSideBarWidget.updateConvStats(id)
+        if not user_f:
+            self.__summarizeConv(id, model)
+
+    def __waitConvUnit(self, id):
+        """
+        wait for the commit of the units of the conversation before they are read back,
+        it returns at once unless one of them is still queued
+        """
+        future = self.__unit_future_dict.get(id)
+        if future and not future.done():
+            # the flush window of the writer is closed right away instead of waiting for it
+            self.__db.flush()
+
+    def __summarizeConv(self, id, model):
+        if not self.__summarize_conv or (self.__summaryThread and self.__summaryThread.isRunning()):
+            return
+        if self.__convSummarizer.needsSummary(id, model):
+            self.__summaryThread = WorkerThread(self.__convSummarizer.summarize, id, model)
+            self.__summaryThread.start()
 
 
 if __name__ == "__main__":
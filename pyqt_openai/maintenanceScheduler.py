@@ -0,0 +1,64 @@
+import time
+
+from qtpy.QtCore import QObject, QTimer, QEvent
+from qtpy.QtWidgets import QApplication
+
+from pyqt_openai.apiData import getModelCost
+from pyqt_openai.sqlite import SqliteDatabase
+from pyqt_openai.tokenizer import countExact
+from pyqt_openai.workerThread import WorkerThread
+
+
+class MaintenanceScheduler(QObject):
+    """
+    run the maintenance of the database (``SqliteDatabase.runMaintenance``) in a worker thread
+    once the user has been idle for ``idle_sec`` seconds, at most once per ``interval_sec`` seconds
+
+    every key, mouse and wheel event of the application restarts the idle timer
+    """
+    def __init__(self, db: SqliteDatabase, archive_days: int = 90, idle_sec: int = 60, interval_sec: int = 3600, parent=None):
+        super().__init__(parent)
+        self.__initVal(db, archive_days, interval_sec)
+        self.__initTimer(idle_sec)
+
+    def __initVal(self, db, archive_days, interval_sec):
+        self.__db = db
+        self.__archive_days = archive_days
+        self.__interval_sec = interval_sec
+        self.__last_run_time = None
+        self.__thread = None
+        self.__input_event_type_set = {QEvent.KeyPress, QEvent.MouseButtonPress, QEvent.MouseMove, QEvent.Wheel}
+
+    def __initTimer(self, idle_sec):
+        self.__idleTimer = QTimer(self)
+        self.__idleTimer.setSingleShot(True)
+        self.__idleTimer.setInterval(idle_sec * 1000)
+        self.__idleTimer.timeout.connect(self.__run)
+        self.__idleTimer.start()
+        QApplication.instance().installEventFilter(self)
+
+    def eventFilter(self, obj, e):
+        if e.type() in self.__input_event_type_set:
+            self.__idleTimer.start()
+        return False
+
+    def stop(self):
+        """
+        don't run again and wait for the running maintenance to finish, before the database is closed
+        """
+        self.__idleTimer.stop()
+        QApplication.instance().removeEventFilter(self)
+        if self.__thread:
+            self.__thread.wait()
+
+    def __run(self):
+        if self.__thread and self.__thread.isRunning():
+            return
+        if self.__last_run_time and time.monotonic() - self.__last_run_time < self.__interval_sec:
+            # check again later, if the user is still idle by then
+            self.__idleTimer.start()
+            return
+        self.__last_run_time = time.monotonic()
+        self.__thread = WorkerThread(self.__db.runMaintenance, archive_days=self.__archive_days,
+                                     count_fn=countExact, cost_fn=getModelCost)
+        self.__thread.start()
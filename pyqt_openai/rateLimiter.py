@@ -0,0 +1,254 @@
+import asyncio, heapq, itertools, random, re, threading, time
+
+import openai
+
+
+# requests per minute, tokens per minute until the response headers tell the real ones (None means no limit)
+# https://platform.openai.com/docs/guides/rate-limits
+MODEL_RATE_LIMIT_DICT = {
+    'gpt-4': (200, 40000),
+    'gpt-4-32k': (200, 80000),
+    'gpt-3.5-turbo': (3500, 90000),
+    'text-davinci-003': (3500, 350000),
+    'DALL-E': (50, None),
+    'text-embedding-ada-002': (3000, 1000000),
+}
+DEFAULT_RATE_LIMIT = (60, 40000)
+
+
+def parseResetTime(value):
+    """
+    :param value: x-ratelimit-reset-* header, e.g. '1s', '6m0s', '20ms'
+    :return: seconds
+    """
+    sec = 0.0
+    for num, unit in re.findall(r'([\d.]+)(ms|h|m|s)', value or ''):
+        sec += float(num) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+    return sec
+
+
+class TokenBucket:
+    """
+    bucket which is refilled with ``capacity`` per minute, not thread-safe (RateLimiter locks it)
+    """
+    def __init__(self, capacity):
+        super().__init__()
+        self.__capacity = capacity
+        self.__level = capacity
+        self.__refill_per_sec = capacity / 60
+        self.__last_time = time.monotonic()
+
+    def __refill(self):
+        now = time.monotonic()
+        self.__level = min(self.__capacity, self.__level + (now - self.__last_time) * self.__refill_per_sec)
+        self.__last_time = now
+
+    def getWaitTime(self, amount):
+        """
+        :return: seconds until ``amount`` can be taken, 0 if it can be taken now
+        """
+        self.__refill()
+        # more than the capacity can't be taken ever, it is taken when the bucket is full
+        amount = min(amount, self.__capacity)
+        if self.__level >= amount:
+            return 0
+        return (amount - self.__level) / self.__refill_per_sec
+
+    def take(self, amount):
+        self.__refill()
+        self.__level -= min(amount, self.__capacity)
+
+    def update(self, capacity=None, remaining=None, reset_sec=None):
+        """
+        correct the bucket with what the server says
+        """
+        self.__refill()
+        if capacity:
+            self.__capacity = capacity
+            self.__refill_per_sec = capacity / 60
+        if remaining is not None:
+            self.__level = min(remaining, self.__capacity)
+            # the server refills it this fast
+            if reset_sec and remaining < self.__capacity:
+                self.__refill_per_sec = max(self.__refill_per_sec, (self.__capacity - remaining) / reset_sec)
+
+
+class RateLimiter:
+    """
+    scheduler in front of every API call, so bursts of requests wait for their turn instead of failing
+
+    - requests-per-minute and tokens-per-minute buckets of each model, corrected by the x-ratelimit-* response headers
+    - the waiting request with the higher priority (lower number) goes first, interactive prompts before batch jobs
+    - rate limit errors (and the temporary ones) are retried with exponential backoff and full jitter
+    """
+    INTERACTIVE = 0
+    BATCH = 10
+
+    def __init__(self, max_retries: int = 5, base_delay: float = 1, max_delay: float = 60, poll_interval: float = 0.1):
+        """
+        :param poll_interval: longest sleep of the waiting request before it checks its turn again
+        """
+        super().__init__()
+        self.__max_retries = max_retries
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__poll_interval = poll_interval
+        # model - (requests bucket, tokens bucket or None)
+        self.__bucket_dict = {}
+        # model - heap of (priority, seq) of the waiting requests
+        self.__waiting_dict = {}
+        self.__seq_iter = itertools.count()
+        self.__lock = threading.Lock()
+        self.__retry_error_tuple = (openai.error.RateLimitError, openai.error.ServiceUnavailableError, openai.error.TryAgain)
+
+    def __getBuckets(self, model):
+        if model not in self.__bucket_dict:
+            rpm, tpm = DEFAULT_RATE_LIMIT
+            for prefix, limit in MODEL_RATE_LIMIT_DICT.items():
+                if model and model.startswith(prefix):
+                    rpm, tpm = limit
+            self.__bucket_dict[model] = (TokenBucket(rpm), TokenBucket(tpm) if tpm else None)
+        return self.__bucket_dict[model]
+
+    def __enqueue(self, model, priority):
+        ticket = (priority, next(self.__seq_iter))
+        with self.__lock:
+            heapq.heappush(self.__waiting_dict.setdefault(model, []), ticket)
+        return ticket
+
+    def __tryAcquire(self, model, token_cnt, ticket):
+        """
+        :return: 0 if it is taken, otherwise seconds to wait before trying again
+        """
+        with self.__lock:
+            waiting_lst = self.__waiting_dict[model]
+            if waiting_lst[0] != ticket:
+                return self.__poll_interval
+            request_bucket, token_bucket = self.__getBuckets(model)
+            wait_time = max(request_bucket.getWaitTime(1), token_bucket.getWaitTime(token_cnt) if token_bucket else 0)
+            if wait_time:
+                return min(wait_time, self.__poll_interval)
+            request_bucket.take(1)
+            if token_bucket:
+                token_bucket.take(token_cnt)
+            heapq.heappop(waiting_lst)
+            return 0
+
+    def acquireSync(self, model, token_cnt=0, priority=BATCH):
+        """
+        wait for the turn of the request, in the calling thread
+        """
+        ticket = self.__enqueue(model, priority)
+        while True:
+            wait_time = self.__tryAcquire(model, token_cnt, ticket)
+            if not wait_time:
+                return
+            time.sleep(wait_time)
+
+    async def acquire(self, model, token_cnt=0, priority=INTERACTIVE):
+        """
+        wait for the turn of the request, in the event loop
+        """
+        ticket = self.__enqueue(model, priority)
+        try:
+            while True:
+                wait_time = self.__tryAcquire(model, token_cnt, ticket)
+                if not wait_time:
+                    return
+                await asyncio.sleep(wait_time)
+        except asyncio.CancelledError:
+            self.__dequeue(model, ticket)
+            raise
+
+    def __dequeue(self, model, ticket):
+        with self.__lock:
+            waiting_lst = self.__waiting_dict[model]
+            if ticket in waiting_lst:
+                waiting_lst.remove(ticket)
+                heapq.heapify(waiting_lst)
+
+    def __getBackoff(self, attempt, e):
+        # the server may tell when to retry
+        retry_after = (getattr(e, 'headers', None) or {}).get('retry-after')
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.__max_delay, self.__base_delay * 2 ** attempt))
+
+    def call(self, fn, model, token_cnt=0, priority=BATCH):
+        """
+        call ``fn`` (which calls the API) in its turn, retrying it with backoff if the rate limit is hit
+        """
+        for attempt in itertools.count():
+            self.acquireSync(model, token_cnt, priority)
+            try:
+                return fn()
+            except self.__retry_error_tuple as e:
+                if attempt >= self.__max_retries:
+                    raise
+                self.updateFromHeaders(getattr(e, 'headers', None), model)
+                time.sleep(self.__getBackoff(attempt, e))
+
+    async def run(self, coro_fn, model, token_cnt=0, priority=INTERACTIVE):
+        """
+        await ``coro_fn()`` (which calls the API) in its turn, retrying it with backoff if the rate limit is hit
+        """
+        for attempt in itertools.count():
+            await self.acquire(model, token_cnt, priority)
+            try:
+                return await coro_fn()
+            except self.__retry_error_tuple as e:
+                if attempt >= self.__max_retries:
+                    raise
+                self.updateFromHeaders(getattr(e, 'headers', None), model)
+                await asyncio.sleep(self.__getBackoff(attempt, e))
+
+    def updateFromHeaders(self, headers, model=None):
+        """
+        correct the buckets of the model with the x-ratelimit-* headers of the response
+
+        :param model: model of the request, openai-model header is used if it is None
+        """
+        if not headers:
+            return
+        if 'x-ratelimit-limit-requests' not in headers:
+            return
+
+        def toInt(name):
+            value = headers.get(name)
+            return int(value) if value and value.isdigit() else None
+
+        with self.__lock:
+            if model is None:
+                # the header has the versioned name (gpt-3.5-turbo-0613), the buckets are of the requested name
+                header_model = headers.get('openai-model') or ''
+                model = max([m for m in self.__bucket_dict if m and header_model.startswith(m)], key=len, default=None)
+                if model is None:
+                    return
+            request_bucket, token_bucket = self.__getBuckets(model)
+            request_bucket.update(toInt('x-ratelimit-limit-requests'), toInt('x-ratelimit-remaining-requests'),
+                                  parseResetTime(headers.get('x-ratelimit-reset-requests')))
+            if token_bucket:
+                token_bucket.update(toInt('x-ratelimit-limit-tokens'), toInt('x-ratelimit-remaining-tokens'),
+                                    parseResetTime(headers.get('x-ratelimit-reset-tokens')))
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def getRateLimiter(**kwargs):
+    """
+    get the rate limiter shared by the whole application, it is made on the first call
+
+    :param kwargs: arguments of RateLimiter, only for the first call
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(**kwargs)
+        elif kwargs:
+            raise RuntimeError('The rate limiter is already made')
+        return _limiter
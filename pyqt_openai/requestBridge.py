@@ -0,0 +1,42 @@
+from qtpy.QtCore import QObject, Signal
+
+from pyqt_openai.requestEngine import RequestListener
+
+
+class RequestBridge(QObject, RequestListener):
+    """
+    RequestListener which gives the results of RequestEngine as Qt signals,
+    they are emitted in the thread of the event loop and queued to the receivers in the ui thread
+
+    First argument of every signal is the id of the request handle, second one is the id of the conversation
+    """
+    chunkGenerated = Signal(int, int, str)
+    # third: reply, forth: image url or not
+    replyGenerated = Signal(int, int, str, bool)
+    streamFinished = Signal(int, int, str)
+    failed = Signal(int, int, str)
+    cancelled = Signal(int, int, str)
+    # third: similar prompt, forth: its reply, fifth: similarity
+    similarFound = Signal(int, int, str, str, float)
+    done = Signal(int, int)
+
+    def onChunk(self, handle, text):
+        self.chunkGenerated.emit(handle.getId(), handle.getConvId(), text)
+
+    def onReply(self, handle, text, image_f):
+        self.replyGenerated.emit(handle.getId(), handle.getConvId(), text, image_f)
+
+    def onStreamFinished(self, handle, text):
+        self.streamFinished.emit(handle.getId(), handle.getConvId(), text)
+
+    def onFailed(self, handle, message):
+        self.failed.emit(handle.getId(), handle.getConvId(), message)
+
+    def onCancelled(self, handle, text):
+        self.cancelled.emit(handle.getId(), handle.getConvId(), text)
+
+    def onSimilarFound(self, handle, prompt, text, similarity):
+        self.similarFound.emit(handle.getId(), handle.getConvId(), prompt, text, similarity)
+
+    def onDone(self, handle):
+        self.done.emit(handle.getId(), handle.getConvId())
@@ -0,0 +1,469 @@
+import asyncio, itertools, threading, time
+from concurrent.futures import Future
+
+import openai
+
+from pyqt_openai.apiData import getModelEndpoint
+from pyqt_openai.httpClient import API_BASE_URL, getHttpClient
+from pyqt_openai.rateLimiter import RateLimiter, getRateLimiter
+from pyqt_openai.responseCache import ResponseCache
+from pyqt_openai.semanticCache import SemanticCache
+from pyqt_openai.tokenizer import getTokenizer
+
+
+class RequestListener:
+    """
+    gets the results of the requests of RequestEngine, every method is called in the thread of the event loop
+
+    for each request, one of onReply, onStreamFinished, onFailed and onCancelled is called, then onDone
+    """
+    def onChunk(self, handle, text):
+        pass
+
+    def onReply(self, handle, text, image_f):
+        """
+        :param image_f: text is the url of the generated image
+        """
+        pass
+
+    def onStreamFinished(self, handle, text):
+        """
+        :param text: whole text of the streamed reply
+        """
+        pass
+
+    def onFailed(self, handle, message):
+        pass
+
+    def onCancelled(self, handle, text):
+        """
+        :param text: what is streamed before it is cancelled
+        """
+        pass
+
+    def onSimilarFound(self, handle, prompt, text, similarity):
+        """
+        the reply of a similar prompt is found (SemanticCache.OFFER), the request goes on.
+        it is looked up alongside the request, so this can come before or after the reply
+
+        :param prompt: the similar prompt
+        :param text: its reply
+        """
+        pass
+
+    def onDone(self, handle):
+        pass
+
+
+class ChunkBuffer:
+    """
+    chunks of a stream which are given to the listener together, at most once per ``interval``,
+    so the ui is updated once per frame instead of once per token. used in the thread of the event loop
+
+    it is flushed at once if it holds ``max_size`` characters or more
+    """
+    def __init__(self, loop, flush_fn, interval: float = 0.016, max_size: int = 4096):
+        """
+        :param flush_fn: called with the text of the buffered chunks
+        """
+        super().__init__()
+        self.__loop = loop
+        self.__flush_fn = flush_fn
+        self.__interval = interval
+        self.__max_size = max_size
+        self.__text_lst = []
+        self.__size = 0
+        self.__timer = None
+
+    def append(self, text):
+        self.__text_lst.append(text)
+        self.__size += len(text)
+        if self.__size >= self.__max_size or self.__interval <= 0:
+            self.flush()
+        elif self.__timer is None:
+            self.__timer = self.__loop.call_later(self.__interval, self.flush)
+
+    def flush(self):
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+        if self.__text_lst:
+            text = ''.join(self.__text_lst)
+            self.__text_lst = []
+            self.__size = 0
+            self.__flush_fn(text)
+
+
+class RequestHandle:
+    """
+    one request of RequestEngine, to cancel it or wait for it (from any thread)
+    """
+    def __init__(self, id, conv_id, model, openai_arg, image_f, priority, loop, listener, cache_f=True):
+        super().__init__()
+        self.__id = id
+        self.__conv_id = conv_id
+        self.__model = model
+        self.__openai_arg = openai_arg
+        self.__image_f = image_f
+        self.__priority = priority
+        self.__loop = loop
+        self.__listener = listener
+        self.__cache_f = cache_f
+        # task in the event loop, and the future which the other threads wait for
+        self.__task = None
+        self.__future = Future()
+        # streamed text so far
+        self.__text_lst = []
+        # monotonic times of the submit, the first streamed chunk and the end of the request
+        self.__submit_time = time.monotonic()
+        self.__first_chunk_time = None
+        self.__done_time = None
+
+    def getId(self):
+        return self.__id
+
+    def getConvId(self):
+        return self.__conv_id
+
+    def getModel(self):
+        return self.__model
+
+    def getOpenAIArg(self):
+        return self.__openai_arg
+
+    def isImage(self):
+        return self.__image_f
+
+    def getPriority(self):
+        return self.__priority
+
+    def getListener(self):
+        return self.__listener
+
+    def isCacheUsed(self):
+        return self.__cache_f
+
+    def getFuture(self):
+        return self.__future
+
+    def setTask(self, task):
+        self.__task = task
+
+    def appendText(self, text):
+        if self.__first_chunk_time is None:
+            self.__first_chunk_time = time.monotonic()
+        self.__text_lst.append(text)
+
+    def getText(self):
+        return ''.join(self.__text_lst)
+
+    def cancel(self):
+        """
+        cancel the request, the listener gets onCancelled (if it is not done yet)
+        """
+        if self.__future.done():
+            return False
+        # the task is made in the event loop before this is called there, they are called in order
+        self.__loop.call_soon_threadsafe(lambda: self.__task.cancel())
+        return True
+
+    def setDone(self):
+        self.__done_time = time.monotonic()
+
+    def isDone(self):
+        return self.__future.done()
+
+    def getTimeToFirstToken(self):
+        """
+        :return: seconds from the submit to the first chunk (to the end if it is not streamed), None if neither came yet
+        """
+        first_time = self.__first_chunk_time or self.__done_time
+        return None if first_time is None else first_time - self.__submit_time
+
+    def getLatency(self):
+        """
+        :return: seconds from the submit to the end (including the wait in the rate limiter), None if it is not done
+        """
+        return None if self.__done_time is None else self.__done_time - self.__submit_time
+
+    def result(self, timeout=None):
+        """
+        wait for the request
+
+        :return: the reply (the url for the image)
+        """
+        return self.__future.result(timeout)
+
+
+class RequestEngine:
+    """
+    run the requests to the API concurrently in an asyncio event loop of a single background thread,
+    instead of a thread for each request
+
+    every request gets a handle with the id of its conversation, so the results can be routed back to it
+    (a request can have a listener of its own, e.g. of another window).
+    every call waits for its turn in the rate limiter first.
+    the cached replies (if response_cache is given) are replayed through the listener as if they were generated,
+    so are the replies of the similar prompts if semantic_cache is given in SemanticCache.SERVE mode.
+    the streamed chunks are given to the listener at most once per ``frame_interval`` seconds (ChunkBuffer).
+    it doesn't depend on Qt, RequestBridge gives the results as Qt signals
+    """
+    def __init__(self, listener: RequestListener = None, rate_limiter: RateLimiter = None, response_cache: ResponseCache = None,
+                 semantic_cache: SemanticCache = None, frame_interval: float = 0.016):
+        """
+        :param rate_limiter: None means the shared one (getRateLimiter)
+        """
+        super().__init__()
+        self.__listener = listener or RequestListener()
+        self.__rate_limiter = rate_limiter or getRateLimiter()
+        self.__response_cache = response_cache
+        self.__semantic_cache = semantic_cache
+        self.__frame_interval = frame_interval
+        self.__loop = None
+        self.__thread = None
+        self.__id_iter = itertools.count(1)
+        # handle id - handle, of the requests which are not done yet
+        self.__handle_dict = {}
+        # lookups of the semantic cache which run alongside their requests (SemanticCache.OFFER)
+        self.__offer_task_set = set()
+        self.__lock = threading.Lock()
+
+    def start(self):
+        if self.__thread:
+            return
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__runLoop, name='RequestEngine', daemon=True)
+        self.__thread.start()
+
+    def warmup(self, url=API_BASE_URL):
+        """
+        connect the aiohttp session of the event loop to the API in the background, after ``start``
+
+        :return: concurrent.futures.Future which is done once it is connected (or failed)
+        """
+        return asyncio.run_coroutine_threadsafe(getHttpClient().warmupAsync(self.__loop, url), self.__loop)
+
+    def __runLoop(self):
+        asyncio.set_event_loop(self.__loop)
+        self.__loop.run_forever()
+
+    def stop(self):
+        """
+        cancel every request which is not done yet and stop the event loop
+        """
+        if not self.__thread:
+            return
+        for handle in self.getHandles():
+            handle.cancel()
+        self.__loop.call_soon_threadsafe(lambda: [task.cancel() for task in list(self.__offer_task_set)])
+        asyncio.run_coroutine_threadsafe(getHttpClient().closeAsyncSession(self.__loop), self.__loop).result()
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__loop.close()
+        self.__loop = None
+        self.__thread = None
+
+    def submit(self, conv_id, model, openai_arg, image_f=False, priority=RateLimiter.INTERACTIVE, listener=None, cache_f=True):
+        """
+        :param openai_arg: arguments of the openai function of the model's endpoint (of Image.create if image_f is True)
+        :param priority: RateLimiter.INTERACTIVE or RateLimiter.BATCH (lower goes first)
+        :param listener: listener of this request instead of the one of the engine, e.g. for another window
+        :param cache_f: replay (and keep) the cached replies, False to always generate it
+        :return: RequestHandle
+        """
+        handle = RequestHandle(next(self.__id_iter), conv_id, model, openai_arg, image_f, priority, self.__loop,
+                               listener or self.__listener, cache_f)
+        with self.__lock:
+            self.__handle_dict[handle.getId()] = handle
+        self.__loop.call_soon_threadsafe(self.__startTask, handle)
+        return handle
+
+    def __startTask(self, handle):
+        task = self.__loop.create_task(self.__run(handle))
+        handle.setTask(task)
+        task.add_done_callback(lambda t: self.__taskDone(handle, t))
+
+    def __taskDone(self, handle, task):
+        # called even if it is cancelled before it starts
+        handle.setDone()
+        with self.__lock:
+            self.__handle_dict.pop(handle.getId(), None)
+        if task.cancelled():
+            handle.getListener().onCancelled(handle, handle.getText())
+            handle.getFuture().cancel()
+        elif task.exception():
+            handle.getFuture().set_exception(task.exception())
+        else:
+            handle.getFuture().set_result(task.result())
+        handle.getListener().onDone(handle)
+
+    def getHandle(self, id):
+        with self.__lock:
+            return self.__handle_dict.get(id)
+
+    def getHandles(self, conv_id=None):
+        """
+        :return: handles of the requests which are not done yet (of the conversation if conv_id is given)
+        """
+        with self.__lock:
+            return [handle for handle in self.__handle_dict.values() if conv_id is None or handle.getConvId() == conv_id]
+
+    def cancel(self, conv_id):
+        """
+        cancel every request of the conversation
+        """
+        for handle in self.getHandles(conv_id):
+            handle.cancel()
+
+    async def __call(self, handle, fn):
+        """
+        await the openai function in the turn of the request, retried if the rate limit is hit
+        (only the first response of the stream is retried)
+        """
+        return await self.__rate_limiter.run(lambda: fn(**handle.getOpenAIArg()), handle.getModel(),
+                                             self.__countTokens(handle), handle.getPriority())
+
+    def __countTokens(self, handle):
+        # tokens of the prompt, what the reply takes is corrected by the response headers
+        if handle.isImage():
+            return 0
+        openai_arg = handle.getOpenAIArg()
+        text_lst = [message['content'] for message in openai_arg.get('messages', [])]
+        if isinstance(openai_arg.get('prompt'), str):
+            text_lst.append(openai_arg['prompt'])
+        return sum(getTokenizer(handle.getModel()).countBatch(text_lst))
+
+    async def __replayCache(self, handle):
+        """
+        :return: True if the reply is cached, it is given to the listener the same way as the generated one
+        """
+        if not handle.isCacheUsed() or self.__response_cache is None or not self.__response_cache.isCacheable(handle.getOpenAIArg()):
+            return False
+        # the database is read in the executor, not in the event loop
+        text = await self.__loop.run_in_executor(None, self.__response_cache.get, getModelEndpoint(handle.getModel()),
+                                                 handle.getOpenAIArg())
+        if text is None:
+            return False
+        handle.appendText(text)
+        if handle.getOpenAIArg().get('stream'):
+            handle.getListener().onChunk(handle, text)
+            handle.getListener().onStreamFinished(handle, text)
+        else:
+            handle.getListener().onReply(handle, text, False)
+        return True
+
+    async def __lookupSemanticCache(self, handle):
+        """
+        :return: (response, prompt, similarity) of SemanticCache.lookup, None if it failed
+        """
+        try:
+            return await self.__semantic_cache.lookup(handle.getModel(), handle.getOpenAIArg()['messages'], handle.getPriority())
+        except Exception as e:
+            # the request goes on without the cache
+            print(f"An error occurred: {e}")
+            return None
+
+    def __offerSemanticCache(self, handle):
+        """
+        look up the similar prompt alongside the request (SemanticCache.OFFER), so the reply doesn't wait for the embedding.
+        it is offered (onSimilarFound) whenever it is found, unless the request is cancelled
+        """
+        async def offer():
+            found = await self.__lookupSemanticCache(handle)
+            if found is not None:
+                text, prompt, similarity = found
+                handle.getListener().onSimilarFound(handle, prompt, text, similarity)
+
+        task = self.__loop.create_task(offer())
+        self.__offer_task_set.add(task)
+        task.add_done_callback(self.__offer_task_set.discard)
+        # the future is cancelled in __taskDone, in the event loop
+        handle.getFuture().add_done_callback(lambda f: task.cancel() if f.cancelled() else None)
+
+    async def __replaySemanticCache(self, handle):
+        """
+        :return: True if the reply of a similar prompt is served (SemanticCache.SERVE), the request waits for the lookup
+        """
+        if not handle.isCacheUsed() or self.__semantic_cache is None:
+            return False
+        if self.__semantic_cache.getMode() == SemanticCache.OFFER:
+            self.__offerSemanticCache(handle)
+            return False
+        found = await self.__lookupSemanticCache(handle)
+        if found is None:
+            return False
+        text, prompt, similarity = found
+        handle.appendText(text)
+        if handle.getOpenAIArg().get('stream'):
+            handle.getListener().onChunk(handle, text)
+            handle.getListener().onStreamFinished(handle, text)
+        else:
+            handle.getListener().onReply(handle, text, False)
+        return True
+
+    async def __putCache(self, handle, text):
+        if not handle.isCacheUsed():
+            return
+        if self.__response_cache is not None:
+            self.__response_cache.put(getModelEndpoint(handle.getModel()), handle.getOpenAIArg(), text)
+        if self.__semantic_cache is not None and 'messages' in handle.getOpenAIArg():
+            try:
+                await self.__semantic_cache.add(handle.getModel(), handle.getOpenAIArg()['messages'], text)
+            except Exception as e:
+                print(f"An error occurred: {e}")
+
+    async def __run(self, handle):
+        try:
+            # openai.aiosession is a context variable, so it is set in the task of each request
+            getHttpClient().getAsyncSession(self.__loop)
+            if handle.isImage():
+                response = await self.__call(handle, openai.Image.acreate)
+                text = response['data'][0]['url']
+                handle.getListener().onReply(handle, text, True)
+            elif await self.__replayCache(handle):
+                text = handle.getText()
+            elif getModelEndpoint(handle.getModel()) == '/v1/chat/completions':
+                if await self.__replaySemanticCache(handle):
+                    return handle.getText()
+                response = await self.__call(handle, openai.ChatCompletion.acreate)
+                if handle.getOpenAIArg().get('stream'):
+                    buffer = ChunkBuffer(self.__loop, lambda text: handle.getListener().onChunk(handle, text), self.__frame_interval)
+                    try:
+                        async for chunk in response:
+                            choice = chunk['choices'][0]
+                            response_text = choice['delta'].get('content', '')
+                            if response_text:
+                                handle.appendText(response_text)
+                                buffer.append(response_text)
+                            elif choice.get('finish_reason'):
+                                break
+                    finally:
+                        # what is buffered comes before the end (or the failure, the cancellation) of the stream
+                        buffer.flush()
+                        # the http response is closed now instead of when the generator is collected,
+                        # so the cancelled stream doesn't keep the connection (and its tokens) going
+                        if hasattr(response, 'aclose'):
+                            await response.aclose()
+                    text = handle.getText()
+                    handle.getListener().onStreamFinished(handle, text)
+                else:
+                    text = response['choices'][0]['message']['content']
+                    handle.getListener().onReply(handle, text, False)
+                await self.__putCache(handle, text)
+            else:
+                response = await self.__call(handle, openai.Completion.acreate)
+                text = response['choices'][0]['text'].strip()
+                handle.getListener().onReply(handle, text, False)
+                await self.__putCache(handle, text)
+            return text
+        except openai.error.InvalidRequestError as e:
+            print(e)
+            handle.getListener().onFailed(handle, '<p style="color:red">Your request was rejected as a result of our safety system.<br/>'
+                                             'Your prompt may contain text that is not allowed by our safety system.</p>')
+        except openai.error.RateLimitError as e:
+            handle.getListener().onFailed(handle, f'<p style="color:red">{e}<br/>Check the usage: https://platform.openai.com/account/usage<br/>'
+                                             f'Update to paid account: https://platform.openai.com/account/billing/overview')
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            handle.getListener().onFailed(handle, f'<p style="color:red">{e}</p>')
+        return None
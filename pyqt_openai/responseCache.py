@@ -0,0 +1,70 @@
+import hashlib, json, threading
+
+from pyqt_openai.sqlite import SqliteDatabase
+
+
+class ResponseCache:
+    """
+    exact-match cache of the replies of the chat and completion calls, stored in the database (response_cache_tb)
+
+    the key is the hash of the canonical json of the endpoint, the model, the messages (or the prompt)
+    and the sampling parameters. streaming or not doesn't change the key, the cached reply is replayed either way.
+    only the deterministic requests (temperature 0) are cached, unless every request is (opt in).
+    the request without temperature has the default one of the API (1), so it is not deterministic.
+    the chat of this app doesn't send the temperature, so its replies are only cached with the opt in
+    (RESPONSE_CACHE_ALWAYS)
+    """
+    # temperature of the API when it is not given
+    DEFAULT_TEMPERATURE = 1
+    # arguments which change the reply
+    KEY_ARG_LST = ['model', 'messages', 'prompt', 'suffix', 'temperature', 'top_p', 'n', 'max_tokens', 'stop',
+                   'presence_penalty', 'frequency_penalty', 'logit_bias', 'best_of', 'echo', 'functions', 'function_call']
+
+    def __init__(self, db: SqliteDatabase, always_f: bool = False, max_bytes: int = 50 * 1024 * 1024, max_days: int = 30,
+                 evict_interval: int = 100):
+        """
+        :param always_f: cache the requests which are not deterministic too
+        :param max_bytes: the least recently used replies are removed beyond this size
+        :param max_days: replies not used for this many days are removed
+        :param evict_interval: evict once every this many inserted replies
+        """
+        super().__init__()
+        self.__db = db
+        self.__always_f = always_f
+        self.__max_bytes = max_bytes
+        self.__max_days = max_days
+        self.__evict_interval = evict_interval
+        self.__insert_cnt = 0
+        self.__lock = threading.Lock()
+
+    def isCacheable(self, openai_arg):
+        # more than one choice can't be replayed as a single reply
+        if openai_arg.get('n', 1) != 1:
+            return False
+        return self.__always_f or openai_arg.get('temperature', ResponseCache.DEFAULT_TEMPERATURE) == 0
+
+    def getKey(self, endpoint, openai_arg):
+        key_dict = {k: openai_arg[k] for k in ResponseCache.KEY_ARG_LST if k in openai_arg}
+        key_dict['endpoint'] = endpoint
+        canonical = json.dumps(key_dict, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, endpoint, openai_arg):
+        """
+        :return: the cached reply, None if it is not cached (or not cacheable)
+
+        it reads the database, so it is called in a thread which can block (the executor of RequestEngine)
+        """
+        if not self.isCacheable(openai_arg):
+            return None
+        return self.__db.selectResponseCache(self.getKey(endpoint, openai_arg))
+
+    def put(self, endpoint, openai_arg, response):
+        if not self.isCacheable(openai_arg) or not response:
+            return
+        self.__db.insertResponseCache(self.getKey(endpoint, openai_arg), endpoint, openai_arg.get('model'), response)
+        with self.__lock:
+            self.__insert_cnt += 1
+            evict_f = (self.__insert_cnt - 1) % self.__evict_interval == 0
+        if evict_f:
+            self.__db.evictResponseCache(self.__max_bytes, self.__max_days)
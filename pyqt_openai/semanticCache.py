@@ -0,0 +1,245 @@
+import asyncio, hashlib, os, threading
+from collections import OrderedDict
+
+import openai
+
+# optional, the semantic cache is only available if numpy is installed
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from pyqt_openai.rateLimiter import RateLimiter, getRateLimiter
+from pyqt_openai.sqlite import SqliteDatabase
+from pyqt_openai.tokenizer import getTokenizer
+
+
+# dimension of the vectors of each embedding model
+EMBEDDING_DIM_DICT = {
+    'text-embedding-ada-002': 1536,
+}
+
+
+class VectorIndex:
+    """
+    normalized float32 vectors appended to a file without a header (rows x dim), searched through a memory map,
+    so the index is never loaded into memory as a whole and appending doesn't rewrite it
+    """
+    def __init__(self, filename, dim, chunk_rows: int = 65536):
+        """
+        :param chunk_rows: count of the rows multiplied at once while searching
+        """
+        super().__init__()
+        self.__filename = filename
+        self.__dim = dim
+        self.__chunk_rows = chunk_rows
+        self.__row_size = dim * 4
+        self.__mm = None
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        if not os.path.exists(self.__filename):
+            return 0
+        return os.path.getsize(self.__filename) // self.__row_size
+
+    def truncate(self, cnt):
+        """
+        remove the rows from ``cnt`` (and what is left of an interrupted append)
+        """
+        with self.__lock:
+            if os.path.exists(self.__filename) and os.path.getsize(self.__filename) != cnt * self.__row_size:
+                self.__mm = None
+                with open(self.__filename, 'r+b') as f:
+                    f.truncate(cnt * self.__row_size)
+
+    def append(self, vectors):
+        """
+        :param vectors: array of (n, dim), normalized
+        :return: row of the first appended vector
+        """
+        with self.__lock:
+            first = len(self)
+            with open(self.__filename, 'ab') as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            # mapped again with the new size on the next search
+            self.__mm = None
+            return first
+
+    def search(self, vector, k=5):
+        """
+        :return: list of (row, cosine similarity) of the ``k`` nearest rows, the nearest first
+        """
+        with self.__lock:
+            cnt = len(self)
+            if not cnt:
+                return []
+            if self.__mm is None or self.__mm.shape[0] != cnt:
+                self.__mm = np.memmap(self.__filename, dtype=np.float32, mode='r', shape=(cnt, self.__dim))
+            mm = self.__mm
+        row_lst = []
+        sim_lst = []
+        for start in range(0, cnt, self.__chunk_rows):
+            sims = mm[start:start+self.__chunk_rows] @ vector
+            top = np.argpartition(-sims, min(k, len(sims)) - 1)[:k]
+            row_lst.extend(top + start)
+            sim_lst.extend(sims[top])
+        order = np.argsort(sim_lst)[::-1][:k]
+        return [(int(row_lst[i]), float(sim_lst[i])) for i in order]
+
+
+class SemanticCache:
+    """
+    cache of the replies looked up by the meaning of the prompt, for the near-duplicate questions
+
+    every prompt which starts a conversation (a follow-up depends on what came before) is embedded
+    and its reply is kept with its vector (VectorIndex next to the database, semantic_cache_tb).
+    a new prompt of the same model and system message whose vector is similar enough gets the stored reply,
+    offered next to the request (OFFER) or served instead of it (SERVE).
+
+    the prompts to add are embedded together with the next lookup (or every ``batch_size`` of them), in one call
+    """
+    OFFER = 'offer'
+    SERVE = 'serve'
+
+    def __init__(self, db: SqliteDatabase, mode: str = OFFER, threshold: float = 0.95,
+                 embedding_model: str = 'text-embedding-ada-002', batch_size: int = 16, top_k: int = 5):
+        """
+        :param threshold: cosine similarity which is regarded as the same question
+        :param top_k: count of the nearest prompts checked for the same model and system message
+        """
+        super().__init__()
+        self.__initVal(db, mode, threshold, embedding_model, batch_size, top_k)
+        self.__initIndex()
+
+    @staticmethod
+    def isAvailable():
+        return np is not None
+
+    def __initVal(self, db, mode, threshold, embedding_model, batch_size, top_k):
+        self.__db = db
+        self.__mode = mode
+        self.__threshold = threshold
+        self.__embedding_model = embedding_model
+        self.__batch_size = batch_size
+        self.__top_k = top_k
+        # (model, system hash, prompt, response) which are not embedded yet
+        self.__pending_lst = []
+        # prompt - vector of the recent lookups, so the reply of the prompt is added without embedding it again
+        self.__vector_dict = OrderedDict()
+        self.__vector_dict_size = 256
+        self.__flush_lock = None
+
+    def __initIndex(self):
+        filename = os.path.join(os.path.dirname(os.path.abspath(self.__db.getDbFilename())), 'semantic_index.f32')
+        self.__index = VectorIndex(filename, EMBEDDING_DIM_DICT.get(self.__embedding_model, 1536))
+        # what is left of the interrupted append, in the file or in the table
+        cnt = min(len(self.__index), self.__db.selectSemanticCacheCount())
+        self.__index.truncate(cnt)
+        self.__db.deleteSemanticCache(cnt)
+
+    def getMode(self):
+        return self.__mode
+
+    def __getQuery(self, model, messages):
+        """
+        :return: (system hash, prompt), None if it doesn't start a conversation
+        """
+        if any(message['role'] == 'assistant' for message in messages):
+            return None
+        user_lst = [message['content'] for message in messages if message['role'] == 'user']
+        if len(user_lst) != 1 or not user_lst[0].strip():
+            return None
+        system = '\n'.join(message['content'] for message in messages if message['role'] == 'system')
+        return hashlib.sha256(system.encode('utf-8')).hexdigest(), user_lst[0]
+
+    async def __embed(self, text_lst, priority):
+        """
+        :return: normalized vectors of (len(text_lst), dim)
+        """
+        token_cnt = sum(getTokenizer(self.__embedding_model).countBatch(text_lst))
+        response = await getRateLimiter().run(lambda: openai.Embedding.acreate(input=text_lst, model=self.__embedding_model),
+                                              self.__embedding_model, token_cnt, priority)
+        vectors = np.array([data['embedding'] for data in sorted(response['data'], key=lambda data: data['index'])],
+                           dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    async def lookup(self, model, messages, priority=RateLimiter.INTERACTIVE):
+        """
+        :param messages: messages of the chat completion
+        :return: (response, prompt, similarity) of the most similar prompt, None if there is nothing similar enough
+        """
+        query = self.__getQuery(model, messages)
+        if query is None:
+            return None
+        system_hash, prompt = query
+        vector = self.__vector_dict.get(prompt)
+        if vector is None:
+            # embedded together with the pending prompts
+            pending_lst, self.__pending_lst = self.__pending_lst, []
+            try:
+                vectors = await self.__embed([prompt] + [row[2] for row in pending_lst], priority)
+            except BaseException:
+                self.__pending_lst[:0] = pending_lst
+                raise
+            vector = vectors[0]
+            self.__setVector(prompt, vector)
+            if pending_lst:
+                await self.__append(pending_lst, vectors[1:])
+
+        # the index and the database are read in the executor, not in the event loop of the requests
+        return await asyncio.get_running_loop().run_in_executor(None, self.__search, model, system_hash, vector)
+
+    def __search(self, model, system_hash, vector):
+        nearest_lst = self.__index.search(vector, self.__top_k)
+        # the rows which are still in the writer are not read, they are missed this time
+        row_dict = self.__db.selectSemanticCache([row for row, sim in nearest_lst])
+        for row, sim in nearest_lst:
+            if sim < self.__threshold:
+                break
+            if row in row_dict and row_dict[row][:2] == (model, system_hash):
+                return row_dict[row][3], row_dict[row][2], sim
+        return None
+
+    async def add(self, model, messages, response):
+        """
+        keep the reply of the prompt, it is embedded later if it wasn't looked up
+        """
+        query = self.__getQuery(model, messages)
+        if query is None or not response:
+            return
+        system_hash, prompt = query
+        vector = self.__vector_dict.pop(prompt, None)
+        if vector is not None:
+            await self.__append([(model, system_hash, prompt, response)], vector[None, :])
+            return
+        self.__pending_lst.append((model, system_hash, prompt, response))
+        if len(self.__pending_lst) >= self.__batch_size:
+            await self.flush()
+
+    async def flush(self, priority=RateLimiter.BATCH):
+        """
+        embed the pending prompts in one call and add them to the index
+        """
+        if self.__flush_lock is None:
+            self.__flush_lock = asyncio.Lock()
+        async with self.__flush_lock:
+            pending_lst, self.__pending_lst = self.__pending_lst, []
+            if not pending_lst:
+                return
+            try:
+                vectors = await self.__embed([row[2] for row in pending_lst], priority)
+            except BaseException:
+                self.__pending_lst[:0] = pending_lst
+                raise
+            await self.__append(pending_lst, vectors)
+
+    def __setVector(self, prompt, vector):
+        self.__vector_dict[prompt] = vector
+        while len(self.__vector_dict) > self.__vector_dict_size:
+            self.__vector_dict.popitem(last=False)
+
+    async def __append(self, row_lst, vectors):
+        # the file is written in the executor, not in the event loop of the requests.
+        # the rows of the table follow the ones of the file
+        first = await asyncio.get_running_loop().run_in_executor(None, self.__index.append, vectors)
+        self.__db.insertSemanticCache([(first + i, *row) for i, row in enumerate(row_lst)])
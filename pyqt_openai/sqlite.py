@@ -1,26 +1,137 @@
-import sqlite3, json, shutil
+import sqlite3, os, re, html, json, threading, weakref
+
+from pyqt_openai.convCodec import ConvCodec
+from pyqt_openai.sqliteWriter import SqliteWriter
+
+
+def getDataDir():
+    """
+    directory of the data files, $XDG_DATA_HOME/pyqt_openai (~/.local/share/pyqt_openai by default), %APPDATA%/pyqt_openai on windows
+    """
+    if os.name == 'nt':
+        base_dir = os.environ.get('APPDATA') or os.path.expanduser('~')
+    else:
+        base_dir = os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(base_dir, 'pyqt_openai')
+
+
+def getDefaultDbFilename():
+    """
+    conv.db of the current directory if it is there (the older version made it there), the one of the data directory otherwise
+    """
+    if os.path.exists('conv.db'):
+        return 'conv.db'
+    return os.path.join(getDataDir(), 'conv.db')
+
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def getDatabase(**kwargs):
+    """
+    get the database shared by the whole application, it is opened on the first call
+
+    :param kwargs: arguments of SqliteDatabase, only for the first call
+    """
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = SqliteDatabase(**kwargs)
+        elif kwargs:
+            raise RuntimeError('The database is already opened')
+        return _db
+
+
+def closeDatabase():
+    """
+    close the shared database (if it is opened), the next getDatabase opens it again
+    """
+    global _db
+    with _db_lock:
+        if _db is not None:
+            _db.close()
+            _db = None
+
+
+class _ThreadConnection:
+    """
+    read connection of one thread, closed when the thread (and its thread-local storage) is gone
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __del__(self):
+        self.conn.close()
 
 
 class SqliteDatabase:
     """
     functions which only meant to be used frequently are defined.
 
-    if there is no functions you want to use, use ``getCursor`` instead
+    if there is no functions you want to use, use ``getCursor`` instead (read only)
+
+    writes (insert, update, delete) are queued to the background writer thread and return a future,
+    reads see what is committed. the ones which are meant to see everything (export, search, maintenance) flush
+    the queued writes first, the other callers which need their own writes wait for the future or call ``flush``
+
+    reads can run in any thread, every thread reads with its own connection (``getConnection``)
+
+    units can be stored compressed (``codec``), they are decoded transparently when they are read
+
+    units of the conversations which are not touched for a long time can be moved into the archive database
+    (``archiveConv``), the conversation itself stays in conv_tb with its archived flag set.
+    they are read from the archive as they are, and moved back as soon as a new unit is inserted
+
+    the schema is upgraded by the migration steps (``__migrate``), startup does no schema work when it is up to date
     """
-    def __init__(self):
+    def __init__(self, db_filename: str = None, codec: str = None, compress_threshold: int = 1024):
+        """
+        :param db_filename: None means the default one (``getDefaultDbFilename``), the archive is made next to it
+        :param codec: storage codec of the units, 'zlib', 'zstd' or None (stored as they are)
+        :param compress_threshold: units smaller than this (in bytes) are stored as they are
+        """
         super().__init__()
-        self.__initVal()
+        self.__initVal(db_filename, codec, compress_threshold)
         self.__initDb()
-        self.__createConv()
+        self.__initWriter()
 
-    def __initVal(self):
+    def __initVal(self, db_filename, codec, compress_threshold):
         # db names
-        self.__db_filename = 'conv.db'
+        self.__db_filename = db_filename or getDefaultDbFilename()
+        self.__archive_db_filename = os.path.join(os.path.dirname(os.path.abspath(self.__db_filename)), 'archive.db')
+        # name of the attached archive database in every connection
+        self.__archive_db_nm = 'archive'
 
         # conv table names
         self.__conv_tb_nm = 'conv_tb'
         self.__conv_tb_tr_nm = 'conv_tr'
-        self.__conv_unit_tb_nm = 'conv_unit_tb'
+        # every message of every conversation lives in this single table, keyed by (conv_id, seq)
+        self.__conv_unit_tb_nm = 'messages'
+        # prefix of the old per-conversation tables (conv_unit_tb1, conv_unit_tb2, ...), only used for the migration
+        self.__legacy_conv_unit_tb_nm = 'conv_unit_tb'
+        # full-text index over the conv column of the messages table
+        self.__conv_unit_fts_nm = 'messages_fts'
+        # view of the messages table with the decoded conv, content of the full-text index
+        self.__conv_unit_text_vw_nm = 'messages_text_vw'
+        # trained zstd dictionaries, every dictionary is kept so the units compressed with it can be read
+        self.__codec_dict_tb_nm = 'codec_dict_tb'
+        # progress of each imported file, so an interrupted import can be resumed
+        self.__import_tb_nm = 'import_tb'
+        # count of the units, tokens and cost of each conversation, kept up to date by triggers
+        self.__conv_stats_tb_nm = 'conv_stats'
+        # columns added to the messages table (and the one of the archive) for the stats
+        self.__conv_unit_stats_column_dict = {'token_cnt': 'INTEGER DEFAULT 0',
+                                              'cost': 'REAL DEFAULT 0',
+                                              'model': 'TEXT',
+                                              # 0 if token_cnt (and cost) is only estimated, recounted by recountConvUnit
+                                              'token_exact': 'INTEGER DEFAULT 1'}
+        # summaries of the older units of the long conversations (checkpoints), the units themselves are kept
+        self.__conv_summary_tb_nm = 'conv_summary_tb'
+        # replies of the API keyed by the hash of the request, not exported
+        self.__response_cache_tb_nm = 'response_cache_tb'
+        # prompts of the semantic cache and their replies, id is the row of the prompt's vector in the index file
+        self.__semantic_cache_tb_nm = 'semantic_cache_tb'
 
         # info table names
         self.__info_tb_nm = 'info_tb'
@@ -30,6 +141,8 @@ class SqliteDatabase:
         # model type (chat, image, etc.)
         self.__model_type = 1
 
+        self.__codec = ConvCodec(codec, compress_threshold)
+
         # default value of each properties based on https://platform.openai.com/docs/api-reference/chat/create
         # GPT-3.5(ChatGPT), GPT-4
         self.__chat_default_value = {
@@ -67,33 +180,136 @@ class SqliteDatabase:
                                  2: [self.__completion_info_tb_nm, self.__completion_default_value],
                                  3: [self.__image_info_tb_nm, self.__image_default_value], }
 
+        # in-memory copy of each info row (key is the same as __each_info_dict), loaded once
+        self.__info_cache_dict = {}
+        # BOOL columns of each info table, PRAGMA table_info only runs once per table
+        self.__bool_column_dict = {}
+        # changed fields which are not written yet, flushed together after __info_flush_delay seconds
+        self.__info_pending_dict = {}
+        self.__info_flush_delay = 0.5
+        self.__info_flush_timer = None
+        self.__info_lock = threading.Lock()
+
+        # tables whose rows are exported, value is the column holding the conv id (None means every row),
+        # every other table is exported without rows
+        self.__export_tb_dict = {self.__info_tb_nm: None,
+                                 self.__completion_info_tb_nm: None,
+                                 self.__image_info_tb_nm: None,
+                                 self.__conv_tb_nm: 'id',
+                                 self.__conv_unit_tb_nm: 'conv_id',
+                                 self.__codec_dict_tb_nm: None,
+                                 self.__conv_stats_tb_nm: 'conv_id',
+                                 self.__conv_summary_tb_nm: 'conv_id', }
+
+        # schema migration steps of each database, PRAGMA user_version is the count of the steps already applied.
+        # steps are only appended (never changed or reordered), and each one is idempotent,
+        # since the databases made before the versioning (version 0) can be in any state
+        self.__migration_lst = [self.__createInfo,
+                                self.__addChatColumns,
+                                self.__createConv,
+                                self.__createCodecDict,
+                                self.__createConvUnit,
+                                self.__createConvUnitFts,
+                                self.__createImport,
+                                self.__createConvStats,
+                                self.__createConvSummary,
+                                self.__createResponseCache,
+                                self.__createSemanticCache,
+                                self.__addTokenExactColumn]
+        self.__archive_migration_lst = [self.__createArchive,
+                                        self.__addArchiveStatsColumns,
+                                        # token_exact is added to the stats columns
+                                        self.__addArchiveStatsColumns]
+
     def __initDb(self):
         try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.__db_filename)), exist_ok=True)
             # Connect to the database (create a new file if it doesn't exist)
             self.__conn = sqlite3.connect(self.__db_filename)
+            # only works for the new files, the existing ones are switched once by vacuum()
+            self.__conn.execute('PRAGMA auto_vacuum = INCREMENTAL;')
+            self.__initConnection(self.__conn)
+            self.__conn.execute(f'PRAGMA {self.__archive_db_nm}.auto_vacuum = INCREMENTAL;')
             self.__conn.execute('PRAGMA foreign_keys = ON;')
+            # readers and the writer thread don't block each other in WAL mode
+            self.__conn.execute('PRAGMA journal_mode = WAL;')
+            self.__conn.execute(f'PRAGMA {self.__archive_db_nm}.journal_mode = WAL;')
+            self.__conn.execute('PRAGMA synchronous = NORMAL;')
             self.__conn.commit()
 
             self.__c = self.__conn.cursor()
-            self.__createInfo()
+            self.__decode_f = self.__isDecodeNeeded()
+            self.__migrate('main', self.__migration_lst)
+            # the archive is upgraded after the main one, its tables follow the ones of the main database
+            self.__migrate(self.__archive_db_nm, self.__archive_migration_lst)
+            self.__syncDecodeSchema()
+            self.__loadCodecDict()
+
+            # read connections of the other threads
+            self.__local = threading.local()
+            self.__thread_conn_set = weakref.WeakSet()
+            self.__conn_thread = threading.current_thread()
         except sqlite3.Error as e:
             print(f"An error occurred while connecting to the database: {e}")
             raise
 
+    def getConnection(self):
+        """
+        get the read connection of the calling thread (the one which created this object uses the main connection)
+
+        connections are opened on the first call of each thread and they can't write, writes go through the writer
+        """
+        if threading.current_thread() is self.__conn_thread:
+            return self.__conn
+        thread_conn = getattr(self.__local, 'thread_conn', None)
+        if thread_conn is None:
+            # it is only used by its own thread, but it is closed by the other one in close()
+            conn = sqlite3.connect(self.__db_filename, check_same_thread=False)
+            self.__initConnection(conn)
+            conn.execute('PRAGMA foreign_keys = ON;')
+            conn.execute('PRAGMA query_only = ON;')
+            thread_conn = _ThreadConnection(conn)
+            self.__local.thread_conn = thread_conn
+            self.__thread_conn_set.add(thread_conn)
+        return thread_conn.conn
+
+    def __initConnection(self, conn):
+        """
+        register decode_conv(conv), the triggers and the view of the full-text index decode the units with it,
+        and attach the archive database
+        """
+        conn.create_function('decode_conv', 1, self.__codec.decode, deterministic=True)
+        conn.execute(f'ATTACH DATABASE ? AS {self.__archive_db_nm}', (self.__archive_db_filename,))
+
+    def __initWriter(self):
+        self.__writer = SqliteWriter(self.__db_filename, init_fn=self.__initConnection)
+        self.__writer.start()
+
+    def __migrate(self, db_nm, migration_lst):
+        """
+        apply the steps which are not applied to the database yet, in one transaction
+        """
+        version = self.__c.execute(f'PRAGMA {db_nm}.user_version').fetchone()[0]
+        # up to date (or made by the newer version)
+        if version >= len(migration_lst):
+            return
+        try:
+            self.__c.execute('BEGIN')
+            for migration in migration_lst[version:]:
+                migration()
+            # pragma doesn't take parameters
+            self.__c.execute(f'PRAGMA {db_nm}.user_version = {len(migration_lst)}')
+            self.__conn.commit()
+        except sqlite3.Error as e:
+            self.__conn.rollback()
+            print(f"An error occurred while migrating the database: {e}")
+            raise
+
     def __createChat(self):
         # Check if the table exists
         self.__c.execute(f"SELECT count(*) FROM sqlite_master WHERE type='table' AND name='{self.__info_tb_nm}'")
         if self.__c.fetchone()[0] == 1:
-            # Check if each column already exists in the table
-            existing_columns = [row[1] for row in self.__c.execute(f"PRAGMA table_info({self.__info_tb_nm});")]
-            new_columns = [col for col in self.__chat_default_value.keys() if col not in existing_columns]
-            # Add the new columns if they don't already exist
-            # TODO specify the type
-            for col in new_columns:
-                d_value = self.__chat_default_value[col]
-                if isinstance(self.__chat_default_value[col], str):
-                    d_value = f'"{d_value}"' if len(self.__chat_default_value[col].split()) > 0 else d_value
-                self.__c.execute(f"ALTER TABLE {self.__info_tb_nm} ADD COLUMN {col} DEFAULT {d_value}")
+            pass
         else:
             self.__c.execute(f'''CREATE TABLE {self.__info_tb_nm}
                                      (id INTEGER PRIMARY KEY,
@@ -109,9 +325,6 @@ class SqliteDatabase:
                                       update_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
                                       insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP)''')
 
-            # Commit the transaction
-            self.__conn.commit()
-
             # insert default record
             self.__c.execute(f'''INSERT INTO {self.__info_tb_nm}
                                             (
@@ -147,9 +360,6 @@ class SqliteDatabase:
                                               update_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
                                               insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP)''')
 
-            # Commit the transaction
-            self.__conn.commit()
-
             # insert default record
             self.__c.execute(f'''INSERT INTO {self.__completion_info_tb_nm}
                                                     (
@@ -181,9 +391,6 @@ class SqliteDatabase:
                                               update_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
                                               insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP)''')
 
-            # Commit the transaction
-            self.__conn.commit()
-
             # insert default record
             self.__c.execute(f'''INSERT INTO {self.__image_info_tb_nm}
                                                     (
@@ -198,44 +405,421 @@ class SqliteDatabase:
                                                  ''', tuple(self.__image_default_value.values()))
 
     def __createInfo(self):
+        self.__createChat()
+        self.__createCompletion()
+        self.__createImage()
+
+    def __addChatColumns(self):
+        """
+        add the columns which were added to the chat info table later (the table made by the older version lacks them)
+        """
+        existing_columns = [row[1] for row in self.__c.execute(f"PRAGMA table_info({self.__info_tb_nm});")]
+        new_columns = [col for col in self.__chat_default_value.keys() if col not in existing_columns]
+        # TODO specify the type
+        for col in new_columns:
+            d_value = self.__chat_default_value[col]
+            if isinstance(self.__chat_default_value[col], str):
+                d_value = f'"{d_value}"' if len(self.__chat_default_value[col].split()) > 0 else d_value
+            self.__c.execute(f"ALTER TABLE {self.__info_tb_nm} ADD COLUMN {col} DEFAULT {d_value}")
+
+    def __createConv(self):
+        # Create a table with update_dt and insert_dt columns
+        self.__c.execute(f'''CREATE TABLE IF NOT EXISTS {self.__conv_tb_nm}
+                     (id INTEGER PRIMARY KEY,
+                      name TEXT,
+                      update_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
+                      insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
+                      archived BOOL DEFAULT 0)''')
+        if 'archived' not in [row[1] for row in self.__c.execute(f'PRAGMA table_info({self.__conv_tb_nm})')]:
+            self.__c.execute(f'ALTER TABLE {self.__conv_tb_nm} ADD COLUMN archived BOOL DEFAULT 0')
+        # Create a trigger to update the update_dt column with the current timestamp,
+        # only renaming counts (archiving the conversation doesn't)
+        self.__c.execute(f'DROP TRIGGER IF EXISTS {self.__conv_tb_tr_nm}')
+        self.__c.execute(f'''CREATE TRIGGER {self.__conv_tb_tr_nm}
+                     AFTER UPDATE OF name ON {self.__conv_tb_nm}
+                     FOR EACH ROW
+                     BEGIN
+                       UPDATE {self.__conv_tb_nm}
+                       SET update_dt=CURRENT_TIMESTAMP
+                       WHERE id=OLD.id;
+                     END;''')
+
+    def __createConvUnit(self):
+        """
+        create the messages table which holds the units of every conversation
+        """
+        self.__c.execute(f'''CREATE TABLE IF NOT EXISTS {self.__conv_unit_tb_nm}
+                                 (id INTEGER PRIMARY KEY,
+                                  conv_id INTEGER NOT NULL,
+                                  seq INTEGER NOT NULL,
+                                  is_user INTEGER,
+                                  conv TEXT,
+                                  update_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
+                                  insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
+                                  FOREIGN KEY (conv_id) REFERENCES {self.__conv_tb_nm}(id) ON DELETE CASCADE)''')
+        # ordered reads of a conversation and the next seq lookup (MAX(seq)) are both answered by this index alone
+        self.__c.execute(f'''CREATE UNIQUE INDEX IF NOT EXISTS {self.__conv_unit_tb_nm}_conv_seq_idx
+                             ON {self.__conv_unit_tb_nm} (conv_id, seq)''')
+
+        # move the old conv_unit_tbN tables over before the triggers exist,
+        # otherwise every moved row would bump update_dt of its conversation
+        self.__migrateLegacyConvUnit()
+
+        # triggers made by the older version are replaced
+        for tr_nm in ('inserted_tr', 'updated_tr', 'deleted_tr'):
+            self.__c.execute(f'DROP TRIGGER IF EXISTS conv_tb_updated_by_unit_{tr_nm}')
+
+        # insert trigger, units moved from/into the archive don't change the conversation
+        self.__c.execute(f'''
+            CREATE TRIGGER conv_tb_updated_by_unit_inserted_tr
+            AFTER INSERT ON {self.__conv_unit_tb_nm}
+            WHEN NOT IFNULL((SELECT archived FROM {self.__conv_tb_nm} WHERE id = NEW.conv_id), 0)
+            BEGIN
+              UPDATE {self.__conv_tb_nm} SET update_dt = CURRENT_TIMESTAMP WHERE id = NEW.conv_id;
+            END
+        ''')
+
+        self.__createConvUnitUpdatedTrigger()
+
+        # delete trigger
+        self.__c.execute(f'''
+            CREATE TRIGGER conv_tb_updated_by_unit_deleted_tr
+            AFTER DELETE ON {self.__conv_unit_tb_nm}
+            WHEN NOT IFNULL((SELECT archived FROM {self.__conv_tb_nm} WHERE id = OLD.conv_id), 0)
+            BEGIN
+              UPDATE {self.__conv_tb_nm} SET update_dt = CURRENT_TIMESTAMP WHERE id = OLD.conv_id;
+            END
+        ''')
+
+    def __createConvUnitFts(self):
+        """
+        create the FTS5 index of the messages table, it is kept in sync by triggers
+        """
+        fts_sql = self.__getSql(self.__conv_unit_fts_nm)
+        if self.__conv_unit_text_vw_nm in fts_sql:
+            return
+        if fts_sql:
+            # the old index reads the conv column as it is stored, it can't read the compressed units
+            self.__c.execute(f'DROP TABLE {self.__conv_unit_fts_nm}')
+            for tr_nm in ('inserted_tr', 'updated_tr', 'deleted_tr'):
+                self.__c.execute(f'DROP TRIGGER IF EXISTS {self.__conv_unit_fts_nm}_{tr_nm}')
+        self.__createConvUnitTextView()
+        # external content table, the text itself is not stored twice
+        self.__c.execute(f'''CREATE VIRTUAL TABLE {self.__conv_unit_fts_nm} USING fts5
+                             (conv, content='{self.__conv_unit_text_vw_nm}', content_rowid='id',
+                              tokenize='unicode61 remove_diacritics 2')''')
+        self.__createConvUnitFtsTriggers()
+        # index the rows which already exist
+        self.__c.execute(f"INSERT INTO {self.__conv_unit_fts_nm} ({self.__conv_unit_fts_nm}) VALUES ('rebuild')")
+
+    def __decodeSql(self, column):
+        """
+        :return: sql of the text of the unit column, decode_conv(column) only if there can be compressed units
+        """
+        return f'decode_conv({column})' if self.__decode_f else column
+
+    def __isDecodeNeeded(self):
+        """
+        the triggers and the view of the full-text index decode the units (decode_conv, which only the connections
+        of this class have) only if some of them can be compressed,
+        so the database of the uncompressed units stays readable and writable by any sqlite3 connection
+        """
+        if self.__codec.getCodec() is not None:
+            return True
+        # every unit was stored as it is since the schema became plain
+        if 'decode_conv(' not in self.__getSql('conv_tb_updated_by_unit_updated_tr'):
+            return False
+        # the codec was turned off, the schema becomes plain once no compressed unit is left
+        for db_nm in ('main', self.__archive_db_nm):
+            if self.__c.execute(f'SELECT 1 FROM {db_nm}.sqlite_master WHERE name=?', (self.__conv_unit_tb_nm,)).fetchone() \
+                    and self.__c.execute(f"SELECT 1 FROM {db_nm}.{self.__conv_unit_tb_nm} "
+                                         f"WHERE typeof(conv) = 'blob' LIMIT 1").fetchone():
+                return True
+        return False
+
+    def __syncDecodeSchema(self):
+        """
+        make the triggers and the view which read the units again if they don't decode as __decode_f says
+        (the codec is turned on or off), the text of the units doesn't change so the index is kept as it is
+        """
+        if ('decode_conv(' in self.__getSql('conv_tb_updated_by_unit_updated_tr')) == self.__decode_f:
+            return
         try:
-            self.__createChat()
-            self.__createCompletion()
-            self.__createImage()
-            # Commit the transaction
+            self.__c.execute('BEGIN')
+            self.__c.execute('DROP TRIGGER IF EXISTS conv_tb_updated_by_unit_updated_tr')
+            self.__createConvUnitUpdatedTrigger()
+            for tr_nm in ('inserted_tr', 'updated_tr', 'deleted_tr'):
+                self.__c.execute(f'DROP TRIGGER IF EXISTS {self.__conv_unit_fts_nm}_{tr_nm}')
+            self.__c.execute(f'DROP VIEW IF EXISTS {self.__conv_unit_text_vw_nm}')
+            self.__createConvUnitTextView()
+            self.__createConvUnitFtsTriggers()
             self.__conn.commit()
         except sqlite3.Error as e:
-            print(f"An error occurred while creating the table: {e}")
+            self.__conn.rollback()
+            print(f"An error occurred while migrating the database: {e}")
             raise
 
-    def __createConv(self):
-        try:
-            # Check if the table exists
-            self.__c.execute(f"SELECT count(*) FROM sqlite_master WHERE type='table' AND name='{self.__conv_tb_nm}'")
-            if self.__c.fetchone()[0] == 1:
-                # each conv table already exists
-                pass
-            else:
-                # Create a table with update_dt and insert_dt columns
-                self.__c.execute(f'''CREATE TABLE {self.__conv_tb_nm}
+    def __createConvUnitUpdatedTrigger(self):
+        # update trigger, recompressing a unit doesn't change it
+        self.__c.execute(f'''
+            CREATE TRIGGER conv_tb_updated_by_unit_updated_tr
+            AFTER UPDATE ON {self.__conv_unit_tb_nm}
+            WHEN OLD.conv_id IS NOT NEW.conv_id OR OLD.is_user IS NOT NEW.is_user
+              OR {self.__decodeSql('OLD.conv')} IS NOT {self.__decodeSql('NEW.conv')}
+            BEGIN
+              UPDATE {self.__conv_tb_nm} SET update_dt = CURRENT_TIMESTAMP WHERE id = NEW.conv_id;
+            END
+        ''')
+
+    def __createConvUnitTextView(self):
+        self.__c.execute(f'''CREATE VIEW IF NOT EXISTS {self.__conv_unit_text_vw_nm} AS
+                             SELECT id, {self.__decodeSql('conv')} AS conv FROM {self.__conv_unit_tb_nm}''')
+
+    def __createConvUnitFtsTriggers(self):
+        self.__c.execute(f'''
+            CREATE TRIGGER {self.__conv_unit_fts_nm}_inserted_tr
+            AFTER INSERT ON {self.__conv_unit_tb_nm}
+            BEGIN
+              INSERT INTO {self.__conv_unit_fts_nm} (rowid, conv) VALUES (NEW.id, {self.__decodeSql('NEW.conv')});
+            END
+        ''')
+        # the text doesn't change when the unit is only recompressed, so it is not indexed again
+        self.__c.execute(f'''
+            CREATE TRIGGER {self.__conv_unit_fts_nm}_updated_tr
+            AFTER UPDATE OF conv ON {self.__conv_unit_tb_nm}
+            WHEN {self.__decodeSql('OLD.conv')} IS NOT {self.__decodeSql('NEW.conv')}
+            BEGIN
+              INSERT INTO {self.__conv_unit_fts_nm} ({self.__conv_unit_fts_nm}, rowid, conv) VALUES ('delete', OLD.id, {self.__decodeSql('OLD.conv')});
+              INSERT INTO {self.__conv_unit_fts_nm} (rowid, conv) VALUES (NEW.id, {self.__decodeSql('NEW.conv')});
+            END
+        ''')
+        self.__c.execute(f'''
+            CREATE TRIGGER {self.__conv_unit_fts_nm}_deleted_tr
+            AFTER DELETE ON {self.__conv_unit_tb_nm}
+            BEGIN
+              INSERT INTO {self.__conv_unit_fts_nm} ({self.__conv_unit_fts_nm}, rowid, conv) VALUES ('delete', OLD.id, {self.__decodeSql('OLD.conv')});
+            END
+        ''')
+
+    def __createCodecDict(self):
+        self.__c.execute(f'''CREATE TABLE IF NOT EXISTS {self.__codec_dict_tb_nm}
                              (id INTEGER PRIMARY KEY,
-                              name TEXT,
+                              dict BLOB,
+                              insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+
+    def __loadCodecDict(self):
+        # the latest one is used to compress from now on
+        for id, dict_data in self.__c.execute(f'SELECT id, dict FROM {self.__codec_dict_tb_nm} ORDER BY id').fetchall():
+            self.__codec.addDictionary(id, dict_data)
+
+    def __createArchive(self):
+        """
+        create the messages table of the archive database, it has the same columns as the one of the main database
+        (without the triggers and the full-text index, archived units are searched by scanning them)
+        """
+        column_lst = [f'{row[1]} {row[2]}{" PRIMARY KEY" if row[5] else ""}'
+                      for row in self.__c.execute(f'PRAGMA main.table_info({self.__conv_unit_tb_nm})')]
+        self.__c.execute(f'''CREATE TABLE IF NOT EXISTS {self.__archive_db_nm}.{self.__conv_unit_tb_nm}
+                             ({", ".join(column_lst)})''')
+        self.__c.execute(f'''CREATE UNIQUE INDEX IF NOT EXISTS {self.__archive_db_nm}.{self.__conv_unit_tb_nm}_conv_seq_idx
+                             ON {self.__conv_unit_tb_nm} (conv_id, seq)''')
+
+    def __getSql(self, name):
+        """
+        :return: sql which created the table, index, trigger or view, empty string if it doesn't exist
+        """
+        row = self.__c.execute('SELECT sql FROM sqlite_master WHERE name=?', (name,)).fetchone()
+        return row[0] if row and row[0] else ''
+
+    def __createImport(self):
+        self.__c.execute(f'''CREATE TABLE IF NOT EXISTS {self.__import_tb_nm}
+                             (id INTEGER PRIMARY KEY,
+                              filename TEXT,
+                              size INTEGER,
+                              mtime REAL,
+                              item_cnt INTEGER DEFAULT 0,
+                              finished BOOL DEFAULT 0,
                               update_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
+                              insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
+                              UNIQUE (filename, size, mtime))''')
+
+    def __addColumns(self, tb_nm, column_dict):
+        """
+        add the columns which don't exist yet
+        :param tb_nm: table name, with the database name
+        :param column_dict: column name - type (with the default value)
+        """
+        db_nm, tb_nm = tb_nm.split('.')
+        existing_columns = [row[1] for row in self.__c.execute(f'PRAGMA {db_nm}.table_info({tb_nm})')]
+        for column, type in column_dict.items():
+            if column not in existing_columns:
+                self.__c.execute(f'ALTER TABLE {db_nm}.{tb_nm} ADD COLUMN {column} {type}')
+
+    def __createConvStats(self):
+        """
+        create the stats table of the conversations and the triggers which keep it up to date,
+        so the sidebar can be ordered and filtered by an index instead of aggregating the units
+
+        units moved from/into the archive don't change the stats, the archived conversations keep theirs
+        """
+        self.__addColumns(f'main.{self.__conv_unit_tb_nm}', self.__conv_unit_stats_column_dict)
+        self.__c.execute(f'''CREATE TABLE IF NOT EXISTS {self.__conv_stats_tb_nm}
+                             (conv_id INTEGER PRIMARY KEY,
+                              msg_cnt INTEGER DEFAULT 0,
+                              token_cnt INTEGER DEFAULT 0,
+                              cost REAL DEFAULT 0,
+                              -- model of the latest unit
+                              model TEXT,
+                              -- same as update_dt of conv_tb, copied so ordering within a model is one index scan
+                              update_dt DATETIME,
+                              FOREIGN KEY (conv_id) REFERENCES {self.__conv_tb_nm}(id) ON DELETE CASCADE)''')
+        self.__c.execute(f'''CREATE INDEX IF NOT EXISTS {self.__conv_stats_tb_nm}_update_dt_idx
+                             ON {self.__conv_stats_tb_nm} (update_dt)''')
+        self.__c.execute(f'''CREATE INDEX IF NOT EXISTS {self.__conv_stats_tb_nm}_model_update_dt_idx
+                             ON {self.__conv_stats_tb_nm} (model, update_dt)''')
+        # for archiveConv
+        self.__c.execute(f'''CREATE INDEX IF NOT EXISTS {self.__conv_tb_nm}_update_dt_idx
+                             ON {self.__conv_tb_nm} (update_dt)''')
+
+        archived_where = f'NOT IFNULL((SELECT archived FROM {self.__conv_tb_nm} WHERE id = {{}}.conv_id), 0)'
+        self.__c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {self.__conv_stats_tb_nm}_conv_inserted_tr
+            AFTER INSERT ON {self.__conv_tb_nm}
+            BEGIN
+              INSERT INTO {self.__conv_stats_tb_nm} (conv_id, update_dt) VALUES (NEW.id, NEW.update_dt);
+            END
+        ''')
+        self.__c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {self.__conv_stats_tb_nm}_conv_updated_tr
+            AFTER UPDATE OF update_dt ON {self.__conv_tb_nm}
+            BEGIN
+              UPDATE {self.__conv_stats_tb_nm} SET update_dt = NEW.update_dt WHERE conv_id = NEW.id;
+            END
+        ''')
+        self.__c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {self.__conv_stats_tb_nm}_unit_inserted_tr
+            AFTER INSERT ON {self.__conv_unit_tb_nm}
+            WHEN {archived_where.format('NEW')}
+            BEGIN
+              UPDATE {self.__conv_stats_tb_nm}
+              SET msg_cnt = msg_cnt + 1, token_cnt = token_cnt + IFNULL(NEW.token_cnt, 0),
+                  cost = cost + IFNULL(NEW.cost, 0), model = IFNULL(NEW.model, model)
+              WHERE conv_id = NEW.conv_id;
+            END
+        ''')
+        self.__c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {self.__conv_stats_tb_nm}_unit_updated_tr
+            AFTER UPDATE OF token_cnt, cost ON {self.__conv_unit_tb_nm}
+            WHEN {archived_where.format('NEW')}
+            BEGIN
+              UPDATE {self.__conv_stats_tb_nm}
+              SET token_cnt = token_cnt - IFNULL(OLD.token_cnt, 0) + IFNULL(NEW.token_cnt, 0),
+                  cost = cost - IFNULL(OLD.cost, 0) + IFNULL(NEW.cost, 0)
+              WHERE conv_id = NEW.conv_id;
+            END
+        ''')
+        self.__c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {self.__conv_stats_tb_nm}_unit_deleted_tr
+            AFTER DELETE ON {self.__conv_unit_tb_nm}
+            WHEN {archived_where.format('OLD')}
+            BEGIN
+              UPDATE {self.__conv_stats_tb_nm}
+              SET msg_cnt = msg_cnt - 1, token_cnt = token_cnt - IFNULL(OLD.token_cnt, 0),
+                  cost = cost - IFNULL(OLD.cost, 0)
+              WHERE conv_id = OLD.conv_id;
+            END
+        ''')
+
+        # stats of the conversations which already exist, the archived ones are counted from the archive
+        unit_tb_nm = f'main.{self.__conv_unit_tb_nm}'
+        if self.__c.execute(f"SELECT 1 FROM {self.__archive_db_nm}.sqlite_master "
+                            f"WHERE type='table' AND name='{self.__conv_unit_tb_nm}'").fetchone():
+            unit_tb_nm = f'''(SELECT conv_id FROM main.{self.__conv_unit_tb_nm}
+                              UNION ALL SELECT conv_id FROM {self.__archive_db_nm}.{self.__conv_unit_tb_nm})'''
+        self.__c.execute(f'''INSERT OR REPLACE INTO {self.__conv_stats_tb_nm} (conv_id, msg_cnt, update_dt)
+                             SELECT c.id, IFNULL(u.cnt, 0), c.update_dt FROM {self.__conv_tb_nm} c LEFT JOIN
+                             (SELECT conv_id, count(*) AS cnt FROM {unit_tb_nm} GROUP BY conv_id) u ON u.conv_id = c.id''')
+
+    def __createConvSummary(self):
+        self.__c.execute(f'''CREATE TABLE IF NOT EXISTS {self.__conv_summary_tb_nm}
+                             (id INTEGER PRIMARY KEY,
+                              conv_id INTEGER,
+                              -- seq of the last unit which is summarized
+                              until_seq INTEGER,
+                              summary TEXT,
+                              token_cnt INTEGER DEFAULT 0,
+                              model TEXT,
+                              insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
+                              FOREIGN KEY (conv_id) REFERENCES {self.__conv_tb_nm}(id) ON DELETE CASCADE)''')
+        self.__c.execute(f'''CREATE INDEX IF NOT EXISTS {self.__conv_summary_tb_nm}_conv_seq_idx
+                             ON {self.__conv_summary_tb_nm} (conv_id, until_seq)''')
+
+    def __createResponseCache(self):
+        self.__c.execute(f'''CREATE TABLE IF NOT EXISTS {self.__response_cache_tb_nm}
+                             (key TEXT PRIMARY KEY,
+                              endpoint TEXT,
+                              model TEXT,
+                              response,
+                              -- length of the stored response in bytes, for the eviction by size
+                              size INTEGER,
+                              hit_cnt INTEGER DEFAULT 0,
+                              access_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
                               insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-                # Create a trigger to update the update_dt column with the current timestamp
-                self.__c.execute(f'''CREATE TRIGGER {self.__conv_tb_tr_nm}
-                             AFTER UPDATE ON {self.__conv_tb_nm}
-                             FOR EACH ROW
-                             BEGIN
-                               UPDATE {self.__conv_tb_nm}
-                               SET update_dt=CURRENT_TIMESTAMP
-                               WHERE id=OLD.id;
-                             END;''')
-                # Commit the transaction
-                self.__conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred while creating the table: {e}")
-            raise
+        self.__c.execute(f'''CREATE INDEX IF NOT EXISTS {self.__response_cache_tb_nm}_access_dt_idx
+                             ON {self.__response_cache_tb_nm} (access_dt)''')
+
+    def __createSemanticCache(self):
+        self.__c.execute(f'''CREATE TABLE IF NOT EXISTS {self.__semantic_cache_tb_nm}
+                             (id INTEGER PRIMARY KEY,
+                              model TEXT,
+                              -- hash of the system message, the reply is only reused under the same one
+                              system_hash TEXT,
+                              prompt TEXT,
+                              response,
+                              insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+
+    def __addTokenExactColumn(self):
+        self.__addColumns(f'main.{self.__conv_unit_tb_nm}', self.__conv_unit_stats_column_dict)
+        # only the estimated units are in the index, it is empty once everything is counted exactly
+        self.__c.execute(f'''CREATE INDEX IF NOT EXISTS {self.__conv_unit_tb_nm}_token_estimated_idx
+                             ON {self.__conv_unit_tb_nm} (id) WHERE NOT token_exact''')
+
+    def __addArchiveStatsColumns(self):
+        # in the same order as the main one, units are moved with SELECT *
+        self.__addColumns(f'{self.__archive_db_nm}.{self.__conv_unit_tb_nm}', self.__conv_unit_stats_column_dict)
+
+    def __migrateLegacyConvUnit(self):
+        """
+        copy the rows of every conv_unit_tbN table into the messages table and drop the old tables (with their triggers)
+
+        tables which belong to already deleted conversations are just dropped
+        """
+        legacy_tb_nm_lst = [row[0] for row in self.__c.execute(f"SELECT name FROM sqlite_master WHERE type='table' "
+                                                               f"AND name GLOB '{self.__legacy_conv_unit_tb_nm}[0-9]*'").fetchall()]
+        for tb_nm in legacy_tb_nm_lst:
+            id_fk = int(tb_nm[len(self.__legacy_conv_unit_tb_nm):])
+            # old row id is already in insertion order, so it can be used as seq as it is
+            self.__c.execute(f'''INSERT INTO {self.__conv_unit_tb_nm} (conv_id, seq, is_user, conv, update_dt, insert_dt)
+                                 SELECT {id_fk}, id, is_user, conv, update_dt, insert_dt FROM {tb_nm}
+                                 WHERE EXISTS (SELECT 1 FROM {self.__conv_tb_nm} WHERE id = {id_fk})''')
+            self.__c.execute(f'DROP TABLE {tb_nm}')
+
+    def __getBoolColumns(self, tb_nm):
+        if tb_nm not in self.__bool_column_dict:
+            self.__bool_column_dict[tb_nm] = [row[1] for row in self.getConnection().execute(f'PRAGMA table_info({tb_nm})')
+                                              if row[2] == 'BOOL']
+        return self.__bool_column_dict[tb_nm]
+
+    def __castInfoValue(self, id, field, value):
+        """
+        make the value the same type as its default value (e.g. width and height come as str from the combobox)
+        """
+        default_value = self.__each_info_dict[id][1].get(field)
+        if isinstance(default_value, bool):
+            return bool(value)
+        if isinstance(default_value, (int, float)) and isinstance(value, str):
+            return float(value) if '.' in value else int(value)
+        return value
 
     def selectAllInfo(self):
         """
@@ -243,16 +827,19 @@ class SqliteDatabase:
         FIXME
         """
         try:
+            self.__flushInfo()
+            self.__writer.flush()
+
             # filter bool type fields
-            bool_type_column = [row[1] for row in self.__c.execute(f'PRAGMA table_info({self.__info_tb_nm})').fetchall() if row[2] == 'BOOL']
+            bool_type_column = self.__getBoolColumns(self.__info_tb_nm)
 
             # Execute the SELECT statement
-            self.__c.execute(f'SELECT {",".join(list(self.__chat_default_value.keys()))} FROM {self.__info_tb_nm}')
+            c = self.getConnection().execute(f'SELECT {",".join(list(self.__chat_default_value.keys()))} FROM {self.__info_tb_nm}')
 
             # Get the column names
-            column_names = [description[0] for description in self.__c.description]
+            column_names = [description[0] for description in c.description]
 
-            rows = self.__c.fetchall()
+            rows = c.fetchall()
 
             info_dict_arr = []
 
@@ -274,27 +861,36 @@ class SqliteDatabase:
         """
         select specific info
         default value is 1 (chat - gpt3.5, gpt4, etc.)
+
+        it is read from the database only once, after that from the in-memory copy
         """
+        # default value is 1 (chat - gpt3.5, gpt4, etc.)
+        id = id if id else self.__model_type
+        with self.__info_lock:
+            if id not in self.__info_cache_dict:
+                self.__info_cache_dict[id] = self.__loadInfo(id)
+            return dict(self.__info_cache_dict[id])
+
+    def __loadInfo(self, id):
         try:
-            # default value is 1 (chat - gpt3.5, gpt4, etc.)
-            id = id if id else self.__model_type
+            tb_nm, default_value = self.__each_info_dict[id]
 
             # filter bool type fields
-            bool_type_column = [row[1] for row in self.__c.execute(f'PRAGMA table_info({self.__each_info_dict[id][0]})').fetchall() if row[2] == 'BOOL']
+            bool_type_column = self.__getBoolColumns(tb_nm)
 
             # Execute the SELECT statement
-            self.__c.execute(f'SELECT {",".join(list(self.__each_info_dict[id][1].keys()))} FROM {self.__each_info_dict[id][0]}')
+            c = self.getConnection().execute(f'SELECT {",".join(list(default_value.keys()))} FROM {tb_nm}')
 
             # Get the column names
-            column_names = [description[0] for description in self.__c.description]
+            column_names = [description[0] for description in c.description]
 
-            row = self.__c.fetchone()
+            row = c.fetchone()
 
             info_dict = {}
             for i, value in enumerate(row):
                 if column_names[i] in bool_type_column:
                     value = True if value == 1 else False
-                info_dict[column_names[i]] = value
+                info_dict[column_names[i]] = self.__castInfoValue(id, column_names[i], value)
 
             return info_dict
         except sqlite3.Error as e:
@@ -302,20 +898,42 @@ class SqliteDatabase:
             raise
 
     def updateInfo(self, id, field, value):
-        try:
-            self.__c.execute(f'UPDATE {self.__each_info_dict[id][0]} SET {field}=(?) WHERE id=1', (value,))
-            self.__conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+        """
+        update the in-memory copy right away, the database is updated later together with the other changed fields
+        (spin boxes call this on every tick)
+        """
+        value = self.__castInfoValue(id, field, value)
+        self.selectInfo(id)
+        with self.__info_lock:
+            self.__info_cache_dict[id][field] = value
+            self.__info_pending_dict.setdefault(id, {})[field] = value
+            if self.__info_flush_timer is None:
+                self.__info_flush_timer = threading.Timer(self.__info_flush_delay, self.__flushInfo)
+                self.__info_flush_timer.daemon = True
+                self.__info_flush_timer.start()
+
+    def __flushInfo(self):
+        """
+        queue one UPDATE per info table with every field changed since the last flush
+        """
+        with self.__info_lock:
+            if self.__info_flush_timer:
+                self.__info_flush_timer.cancel()
+                self.__info_flush_timer = None
+            pending_dict, self.__info_pending_dict = self.__info_pending_dict, {}
+
+        for id, field_dict in pending_dict.items():
+            self.__writer.submit(lambda conn, id=id, field_dict=field_dict: conn.execute(
+                f'UPDATE {self.__each_info_dict[id][0]} SET {",".join(f"{field}=?" for field in field_dict)} WHERE id=1',
+                tuple(field_dict.values())))
 
     def selectAllConv(self):
         """
         select all conv
         """
         try:
-            self.__c.execute(f'SELECT * FROM {self.__conv_tb_nm}')
-            return self.__c.fetchall()
+            self.__writer.flush()
+            return self.getConnection().execute(f'SELECT * FROM {self.__conv_tb_nm}').fetchall()
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
             raise
@@ -325,104 +943,558 @@ class SqliteDatabase:
         select specific conv
         """
         try:
-            self.__c.execute(f'SELECT * FROM {self.__conv_tb_nm} WHERE id={id}')
-            return self.__c.fetchone()
+            self.__writer.flush()
+            return self.getConnection().execute(f'SELECT * FROM {self.__conv_tb_nm} WHERE id=?', (id,)).fetchone()
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
             raise
 
+    def selectConvPage(self, model=None, before=None, limit=100):
+        """
+        select one page of conversations with their stats, the latest updated ones first
+
+        keyset pagination on (update_dt, id) of conv_stats, one index scan whether it is filtered by the model or not
+        :param model: only the conversations whose latest unit is of this model, None means every conversation
+        :param before: (update_dt, id) of the last row of the previous page, None for the first page
+        :return: list of (id, name, update_dt, archived, msg_cnt, token_cnt, cost, model)
+        """
+        where_lst = []
+        arg = []
+        if model is not None:
+            where_lst.append('s.model = ?')
+            arg.append(model)
+        if before is not None:
+            where_lst.append('(s.update_dt, s.conv_id) < (?, ?)')
+            arg.extend(before)
+        where = f'WHERE {" AND ".join(where_lst)}' if where_lst else ''
+        return self.getConnection().execute(f'''SELECT c.id, c.name, s.update_dt, c.archived, s.msg_cnt, s.token_cnt, s.cost, s.model
+                                                FROM {self.__conv_stats_tb_nm} s JOIN {self.__conv_tb_nm} c ON c.id = s.conv_id
+                                                {where} ORDER BY s.update_dt DESC, s.conv_id DESC LIMIT ?''',
+                                            (*arg, limit)).fetchall()
+
+    def selectConvStats(self, id):
+        """
+        :return: (id, name, update_dt, archived, msg_cnt, token_cnt, cost, model), same as the row of ``selectConvPage``
+        """
+        return self.getConnection().execute(f'''SELECT c.id, c.name, s.update_dt, c.archived, s.msg_cnt, s.token_cnt, s.cost, s.model
+                                                FROM {self.__conv_stats_tb_nm} s JOIN {self.__conv_tb_nm} c ON c.id = s.conv_id
+                                                WHERE s.conv_id = ?''', (id,)).fetchone()
+
+    def selectConvIds(self, model=None):
+        """
+        ids of every conversation (of the model), in the same order as ``selectConvPage``
+        """
+        where = 'WHERE model = ?' if model is not None else ''
+        return [id for id, in self.getConnection().execute(f'SELECT conv_id FROM {self.__conv_stats_tb_nm} {where} '
+                                                           f'ORDER BY update_dt DESC, conv_id DESC',
+                                                           () if model is None else (model,))]
+
+    def selectConvModels(self):
+        """
+        models of the conversations, for the filter of the sidebar
+        """
+        return [model for model, in self.getConnection().execute(f'SELECT DISTINCT model FROM {self.__conv_stats_tb_nm} '
+                                                                 f'WHERE model IS NOT NULL ORDER BY model')]
+
+    def selectConvCount(self):
+        self.__writer.flush()
+        return self.getConnection().execute(f'SELECT count(*) FROM {self.__conv_tb_nm}').fetchone()[0]
+
     def insertConv(self, name):
-        try:
-            # Insert a row into the table
-            self.__c.execute(f'INSERT INTO {self.__conv_tb_nm} (name) VALUES (?)', (name,))
-            new_id = self.__c.lastrowid
-            # Commit the transaction
-            self.__conn.commit()
-            self.__createConvUnit(new_id)
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+        """
+        :return: future of the new conv id, the flush window is closed right away since the caller usually waits for it
+        """
+        # Insert a row into the table
+        return self.__writer.submit(
+            lambda conn: conn.execute(f'INSERT INTO {self.__conv_tb_nm} (name) VALUES (?)', (name,)).lastrowid,
+            urgent=True)
 
     def updateConv(self, id, name):
-        try:
-            self.__c.execute(f'UPDATE {self.__conv_tb_nm} SET name=(?) WHERE id={id}', (name,))
-            self.__conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+        return self.__writer.submit(
+            lambda conn: conn.execute(f'UPDATE {self.__conv_tb_nm} SET name=(?) WHERE id=?', (name, id)))
 
     def deleteConv(self, id):
-        try:
-            self.__c.execute(f'DELETE FROM {self.__conv_tb_nm} WHERE id={id}')
-            self.__conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+        def fn(conn):
+            conn.execute(f'DELETE FROM {self.__archive_db_nm}.{self.__conv_unit_tb_nm} WHERE conv_id=?', (id,))
+            return conn.execute(f'DELETE FROM {self.__conv_tb_nm} WHERE id=?', (id,))
+        return self.__writer.submit(fn)
 
-    def __createConvUnit(self, id_fk):
-        try:
-            # Check if the table exists
-            self.__c.execute(f"SELECT count(*) FROM sqlite_master WHERE type='table' AND name='{self.__conv_unit_tb_nm}{id_fk}'")
-            if self.__c.fetchone()[0] == 1:
-                # each conv table already exists
-                pass
-            else:
-                self.__c.execute(f'''CREATE TABLE {self.__conv_unit_tb_nm}{id_fk}
-                                         (id INTEGER PRIMARY KEY,
-                                          id_fk INTEGER,
-                                          is_user INTEGER,
-                                          conv TEXT,
-                                          update_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
-                                          insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
-                                          FOREIGN KEY (id_fk) REFERENCES {self.__conv_tb_nm}(id) ON DELETE CASCADE)''')
-
-                # insert trigger
-                self.__c.execute(f'''
-                    CREATE TRIGGER conv_tb_updated_by_unit_inserted_tr{id_fk}
-                    AFTER INSERT ON {self.__conv_unit_tb_nm}{id_fk}
-                    BEGIN
-                      UPDATE {self.__conv_tb_nm} SET update_dt = CURRENT_TIMESTAMP WHERE id = NEW.id_fk;
-                    END
-                ''')
-
-                # update trigger
-                self.__c.execute(f'''
-                    CREATE TRIGGER conv_tb_updated_by_unit_updated_tr{id_fk}
-                    AFTER UPDATE ON {self.__conv_unit_tb_nm}{id_fk}
-                    BEGIN
-                      UPDATE {self.__conv_tb_nm} SET update_dt = CURRENT_TIMESTAMP WHERE id = NEW.id_fk;
-                    END
-                ''')
-
-                # delete trigger
-                self.__c.execute(f'''
-                    CREATE TRIGGER conv_tb_updated_by_unit_deleted_tr{id_fk}
-                    AFTER DELETE ON {self.__conv_unit_tb_nm}{id_fk}
-                    BEGIN
-                      UPDATE {self.__conv_tb_nm} SET update_dt = CURRENT_TIMESTAMP WHERE id = OLD.id_fk;
-                    END
-                ''')
-                # Commit the transaction
-                self.__conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+    def isConvArchived(self, id):
+        row = self.getConnection().execute(f'SELECT archived FROM {self.__conv_tb_nm} WHERE id=?', (id,)).fetchone()
+        return bool(row and row[0])
+
+    def __getUnitTableName(self, archived):
+        """
+        :return: messages table which holds the units of the conversation, with the database name
+        """
+        return f'{self.__archive_db_nm if archived else "main"}.{self.__conv_unit_tb_nm}'
 
     def selectConvUnit(self, id):
-        self.__c.execute(f'SELECT * FROM {self.getConvUnitTableName()}{id}')
-        return [elem[3] for elem in self.__c.fetchall()]
+        tb_nm = self.__getUnitTableName(self.isConvArchived(id))
+        c = self.getConnection().execute(f'SELECT conv FROM {tb_nm} WHERE conv_id=? ORDER BY seq', (id,))
+        return [self.__codec.decode(elem[0]) for elem in c.fetchall()]
 
-    def insertConvUnit(self, id, user_f, conv):
-        try:
-            # Insert a row into the table
-            self.__c.execute(
-                f'INSERT INTO {self.__conv_unit_tb_nm}{id} (id_fk, is_user, conv) VALUES (?, ?, ?)',
-                (id, user_f, conv,))
-            # Commit the transaction
-            self.__conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+    def iterConvUnit(self, ids=None):
+        """
+        iterate over the units of the given conversations (every conversation if ids is None),
+        ordered by conversation and seq, without loading them into memory
+
+        :return: generator of (conv id, title, is_user, conv)
+        """
+        self.__writer.flush()
+        conn = self.getConnection()
+        where = ''
+        arg = ()
+        if ids is not None:
+            where = 'WHERE id IN (SELECT value FROM json_each(?))'
+            arg = (json.dumps(list(ids)),)
+        # one query per conversation, its units are either in the main database or in the archive
+        conv_lst = conn.execute(f'SELECT id, name, archived FROM {self.__conv_tb_nm} {where} ORDER BY id', arg).fetchall()
+        for id, title, archived in conv_lst:
+            for is_user, conv in conn.execute(f'SELECT is_user, conv FROM {self.__getUnitTableName(archived)} '
+                                              f'WHERE conv_id=? ORDER BY seq', (id,)):
+                yield id, title, is_user, self.__codec.decode(conv)
+
+    def selectConvUnitPage(self, id, before_seq=None, limit=50):
+        """
+        select one page of units, the newest ``limit`` units older than ``before_seq`` (the newest ones if it is None)
+
+        keyset pagination on (conv_id, seq), so every page costs the same no matter how long the conversation is
+        :return: list of (seq, is_user, conv) in ascending order
+        """
+        tb_nm = self.__getUnitTableName(self.isConvArchived(id))
+        conn = self.getConnection()
+        if before_seq is None:
+            c = conn.execute(f'SELECT seq, is_user, conv FROM {tb_nm} WHERE conv_id=? '
+                             f'ORDER BY seq DESC LIMIT ?', (id, limit))
+        else:
+            c = conn.execute(f'SELECT seq, is_user, conv FROM {tb_nm} WHERE conv_id=? AND seq<? '
+                             f'ORDER BY seq DESC LIMIT ?', (id, before_seq, limit))
+        return [(seq, is_user, self.__codec.decode(conv)) for seq, is_user, conv in c.fetchall()[::-1]]
+
+    def selectConvUnitAfter(self, id, after_seq=0, before_seq=None, limit=None):
+        """
+        select the units newer than ``after_seq``, to get only what is added since the last time
+
+        :param before_seq: only the units older than this
+        :param limit: only the newest ``limit`` units, so the older ones can be read page by page (keyset pagination)
+        :return: list of (seq, is_user, conv, token_cnt) in ascending order, token_cnt is None if it is only estimated
+        """
+        tb_nm = self.__getUnitTableName(self.isConvArchived(id))
+        # LIMIT -1 is no limit
+        c = self.getConnection().execute(f'SELECT seq, is_user, conv, CASE WHEN token_exact THEN token_cnt END '
+                                         f'FROM {tb_nm} WHERE conv_id=? AND seq>? AND seq<IFNULL(?, seq+1) '
+                                         f'ORDER BY seq DESC LIMIT ?', (id, after_seq, before_seq, -1 if limit is None else limit))
+        return [(seq, is_user, self.__codec.decode(conv), token_cnt) for seq, is_user, conv, token_cnt in c.fetchall()[::-1]]
+
+    def selectConvTokenCnt(self, id, after_seq=0):
+        """
+        :return: count of the tokens of the units newer than ``after_seq``
+        """
+        tb_nm = self.__getUnitTableName(self.isConvArchived(id))
+        return self.getConnection().execute(f'SELECT IFNULL(SUM(token_cnt), 0) FROM {tb_nm} WHERE conv_id=? AND seq>?',
+                                            (id, after_seq)).fetchone()[0]
+
+    def selectConvSummary(self, id):
+        """
+        :return: the latest summary of the conversation, (until_seq, summary, token_cnt), None if there is nothing
+        """
+        return self.getConnection().execute(f'SELECT until_seq, summary, token_cnt FROM {self.__conv_summary_tb_nm} '
+                                            f'WHERE conv_id=? ORDER BY until_seq DESC LIMIT 1', (id,)).fetchone()
+
+    def insertConvSummary(self, id, until_seq, summary, token_cnt=0, model=None):
+        """
+        :param until_seq: seq of the last unit which is summarized
+        """
+        def fn(conn):
+            return conn.execute(f'INSERT INTO {self.__conv_summary_tb_nm} (conv_id, until_seq, summary, token_cnt, model) '
+                                f'VALUES (?, ?, ?, ?, ?)', (id, until_seq, summary, token_cnt, model))
+        return self.__writer.submit(fn)
+
+    def insertConvUnit(self, id, user_f, conv, model=None, token_cnt=0, cost=0, token_exact=True):
+        """
+        :param model: model which the unit is sent to (user) or generated by (AI)
+        :param token_cnt: count of the tokens of the unit, summed up in conv_stats with the cost
+        :param token_exact: False if token_cnt is only estimated (no tokenizer), it is recounted later
+        """
+        # Insert a row into the table, seq is the next number in the conversation
+        # (it is compressed in the writer thread, not in the caller's)
+        def fn(conn):
+            # the archived conversation is continued, so its units are moved back first
+            self.__restoreConvUnit(conn, id)
+            return conn.execute(
+                f'''INSERT INTO {self.__conv_unit_tb_nm} (conv_id, seq, is_user, conv, model, token_cnt, cost, token_exact) VALUES
+                    (?, (SELECT IFNULL(MAX(seq), 0) + 1 FROM {self.__conv_unit_tb_nm} WHERE conv_id=?), ?, ?, ?, ?, ?, ?)''',
+                (id, id, user_f, self.__codec.encode(conv), model, token_cnt, cost, token_exact))
+        return self.__writer.submit(fn)
+
+    def __restoreConvUnit(self, conn, id):
+        """
+        copy the units of the archived conversation back into the main database (in the writer thread)
+
+        they are removed from the archive later by ``cleanOrphan``, in another transaction,
+        since a transaction over the attached databases is not atomic across them in WAL mode
+        """
+        row = conn.execute(f'SELECT archived FROM {self.__conv_tb_nm} WHERE id=?', (id,)).fetchone()
+        # the conversation is deleted (the insert fails on its foreign key) or it is not archived
+        if row is None or not row[0]:
+            return
+        # triggers don't bump update_dt while the flag is still set
+        conn.execute(f'INSERT OR IGNORE INTO main.{self.__conv_unit_tb_nm} '
+                     f'SELECT * FROM {self.__archive_db_nm}.{self.__conv_unit_tb_nm} WHERE conv_id=?', (id,))
+        conn.execute(f'UPDATE {self.__conv_tb_nm} SET archived=0 WHERE id=?', (id,))
+
+    def archiveConv(self, days, batch_size=100, progress_callback=None):
+        """
+        move the units of the conversations which are not updated for ``days`` days into the archive database
+
+        units are copied into the archive and committed first, and then removed from the main database,
+        so the units are never lost if it is interrupted in the middle (what is left twice is removed by ``cleanOrphan``)
+        :param progress_callback: called with (done, total) count of conversations
+        :return: count of the archived conversations
+        """
+        self.__writer.flush()
+        conn = self.getConnection()
+        cutoff = conn.execute("SELECT datetime('now', ?)", (f'-{days} days',)).fetchone()[0]
+        ids = [id for id, in conn.execute(f'''SELECT id FROM {self.__conv_tb_nm} c WHERE NOT archived AND update_dt < ?
+                                              AND EXISTS (SELECT 1 FROM {self.__conv_unit_tb_nm} WHERE conv_id = c.id)''',
+                                          (cutoff,))]
+
+        def fn(conn, chunk):
+            # the conversations which are updated in the meantime are left as they are
+            cnt = conn.execute(f'UPDATE {self.__conv_tb_nm} SET archived=1 WHERE id IN (SELECT value FROM json_each(?)) '
+                               f'AND update_dt < ?', (chunk, cutoff)).rowcount
+            conn.execute(f'''DELETE FROM main.{self.__conv_unit_tb_nm} WHERE conv_id IN
+                             (SELECT id FROM {self.__conv_tb_nm} WHERE archived AND id IN (SELECT value FROM json_each(?)))''',
+                         (chunk,))
+            return cnt
+
+        future_lst = []
+        total = len(ids)
+        for i in range(0, total, batch_size):
+            chunk = json.dumps(ids[i:i+batch_size])
+            self.__writer.submit(lambda conn, chunk=chunk: conn.execute(
+                f'INSERT OR REPLACE INTO {self.__archive_db_nm}.{self.__conv_unit_tb_nm} '
+                f'SELECT * FROM main.{self.__conv_unit_tb_nm} WHERE conv_id IN (SELECT value FROM json_each(?))',
+                (chunk,)), urgent=True).result()
+            future_lst.append(self.__writer.submit(lambda conn, chunk=chunk: fn(conn, chunk)))
+            if progress_callback:
+                progress_callback(min(i+batch_size, total), total)
+        return sum(future.result() for future in future_lst)
+
+    def cleanOrphan(self):
+        """
+        remove what is left behind
+        - old conv_unit_tbN tables (with their triggers) whose conversation doesn't exist
+        - units whose conversation doesn't exist, in the main database and in the archive
+        - units left in the archive by an interrupted archiving or by restoring (moved back first if they are missing)
+        :return: count of the removed tables and units
+        """
+        def fn(conn):
+            cnt = 0
+            for tb_nm, in conn.execute(f"SELECT name FROM sqlite_master WHERE type='table' "
+                                       f"AND name GLOB '{self.__legacy_conv_unit_tb_nm}[0-9]*'").fetchall():
+                id_fk = int(tb_nm[len(self.__legacy_conv_unit_tb_nm):])
+                if not conn.execute(f'SELECT 1 FROM {self.__conv_tb_nm} WHERE id=?', (id_fk,)).fetchone():
+                    conn.execute(f'DROP TABLE {tb_nm}')
+                    cnt += 1
+            for db_nm in ('main', self.__archive_db_nm):
+                cnt += conn.execute(f'DELETE FROM {db_nm}.{self.__conv_unit_tb_nm} '
+                                    f'WHERE conv_id NOT IN (SELECT id FROM main.{self.__conv_tb_nm})').rowcount
+            conn.execute(f'''INSERT OR IGNORE INTO main.{self.__conv_unit_tb_nm}
+                             SELECT * FROM {self.__archive_db_nm}.{self.__conv_unit_tb_nm}
+                             WHERE conv_id IN (SELECT id FROM main.{self.__conv_tb_nm} WHERE NOT archived)''')
+            return cnt
+        cnt = self.__writer.submit(fn, urgent=True).result()
+        # removed from the archive only after they are committed in the main database
+        cnt += self.__writer.submit(lambda conn: conn.execute(
+            f'''DELETE FROM {self.__archive_db_nm}.{self.__conv_unit_tb_nm}
+                WHERE conv_id IN (SELECT id FROM main.{self.__conv_tb_nm} WHERE NOT archived)''').rowcount,
+            urgent=True).result()
+        return cnt
+
+    def vacuum(self, pages=2000):
+        """
+        give ``pages`` free pages of each database back to the file system (incremental vacuum)
+
+        the databases which were created before incremental vacuum was turned on are fully vacuumed once to turn it on
+        """
+        self.__writer.flush()
+        for db_nm in ('main', self.__archive_db_nm):
+            if self.getConnection().execute(f'PRAGMA {db_nm}.auto_vacuum').fetchone()[0] == 2:
+                self.__writer.submit(lambda conn, db_nm=db_nm: conn.execute(
+                    f'PRAGMA {db_nm}.incremental_vacuum({pages})').fetchall()).result()
+                continue
+            # VACUUM can't run in a transaction, so not in the writer thread
+            conn = sqlite3.connect(self.__db_filename, isolation_level=None, timeout=60)
+            try:
+                self.__initConnection(conn)
+                conn.execute(f'PRAGMA {db_nm}.auto_vacuum = INCREMENTAL')
+                conn.execute(f'VACUUM {db_nm}')
+            finally:
+                conn.close()
+
+    def optimize(self):
+        """
+        merge the segments of the full-text index a little, and update the statistics of the query planner
+        (PRAGMA optimize runs ANALYZE on the tables which need it)
+        """
+        def fn(conn):
+            conn.execute(f"INSERT INTO {self.__conv_unit_fts_nm} ({self.__conv_unit_fts_nm}, rank) VALUES ('merge', 500)")
+            conn.execute('PRAGMA optimize').fetchall()
+        return self.__writer.submit(fn)
+
+    def selectResponseCache(self, key):
+        """
+        :return: the cached reply, None if there is nothing (the hit is counted in the writer thread)
+        """
+        row = self.getConnection().execute(f'SELECT response FROM {self.__response_cache_tb_nm} WHERE key=?', (key,)).fetchone()
+        if row is None:
+            return None
+        self.__writer.submit(lambda conn: conn.execute(f'UPDATE {self.__response_cache_tb_nm} '
+                                                       f'SET hit_cnt=hit_cnt+1, access_dt=CURRENT_TIMESTAMP WHERE key=?', (key,)))
+        return self.__codec.decode(row[0])
+
+    def insertResponseCache(self, key, endpoint, model, response):
+        def fn(conn):
+            value = self.__codec.encode(response)
+            return conn.execute(f'INSERT OR REPLACE INTO {self.__response_cache_tb_nm} (key, endpoint, model, response, size) '
+                                f'VALUES (?, ?, ?, ?, ?)', (key, endpoint, model, value,
+                                                            len(value if isinstance(value, bytes) else value.encode('utf-8'))))
+        return self.__writer.submit(fn)
+
+    def evictResponseCache(self, max_bytes, max_days):
+        """
+        remove the cached replies which are not used for ``max_days`` days,
+        and then the least recently used ones until the rest take ``max_bytes`` at most
+
+        :return: future of the count of the removed replies
+        """
+        def fn(conn):
+            cnt = conn.execute(f"DELETE FROM {self.__response_cache_tb_nm} WHERE access_dt < datetime('now', ?)",
+                               (f'-{max_days} days',)).rowcount
+            cnt += conn.execute(f'''DELETE FROM {self.__response_cache_tb_nm} WHERE key IN
+                                    (SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY access_dt DESC, key) AS total_size
+                                                      FROM {self.__response_cache_tb_nm})
+                                     WHERE total_size > ?)''', (max_bytes,)).rowcount
+            return cnt
+        return self.__writer.submit(fn)
+
+    def selectSemanticCache(self, ids):
+        """
+        :return: dict of id - (model, system_hash, prompt, response), of the committed rows only
+        """
+        c = self.getConnection().execute(f'SELECT id, model, system_hash, prompt, response FROM {self.__semantic_cache_tb_nm} '
+                                         f'WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(list(ids)),))
+        return {id: (model, system_hash, prompt, self.__codec.decode(response)) for id, model, system_hash, prompt, response in c}
+
+    def selectSemanticCacheCount(self):
+        """
+        :return: count of the committed rows (the next id), ids start from 0
+        """
+        return self.getConnection().execute(f'SELECT IFNULL(MAX(id), -1) + 1 FROM {self.__semantic_cache_tb_nm}').fetchone()[0]
+
+    def insertSemanticCache(self, row_lst):
+        """
+        :param row_lst: list of (id, model, system_hash, prompt, response)
+        """
+        def fn(conn):
+            return conn.executemany(f'INSERT OR REPLACE INTO {self.__semantic_cache_tb_nm} (id, model, system_hash, prompt, response) '
+                                    f'VALUES (?, ?, ?, ?, ?)',
+                                    [(id, model, system_hash, prompt, self.__codec.encode(response))
+                                     for id, model, system_hash, prompt, response in row_lst])
+        return self.__writer.submit(fn)
+
+    def deleteSemanticCache(self, from_id):
+        """
+        remove the rows from ``from_id``, the ones whose vectors are not in the index file
+        """
+        return self.__writer.submit(lambda conn: conn.execute(f'DELETE FROM {self.__semantic_cache_tb_nm} WHERE id>=?',
+                                                              (from_id,)))
+
+    def runMaintenance(self, archive_days=90, progress_callback=None, count_fn=None, cost_fn=None):
+        """
+        run every maintenance step one by one, it is meant to run in a worker thread while the user is idle
+        :param archive_days: conversations not updated for this many days are archived, 0 means never
+        :param progress_callback: called with (done, total) count of the steps
+        :param count_fn: count_fn and cost_fn of ``recountConvUnit``, the estimated counts are left as they are if None
+        """
+        step_lst = [self.cleanOrphan,
+                    lambda: self.recountConvUnit(count_fn, cost_fn) if count_fn else 0,
+                    lambda: self.archiveConv(archive_days) if archive_days else 0,
+                    self.recompressConvUnit,
+                    self.vacuum,
+                    lambda: self.optimize().result()]
+        for i, step in enumerate(step_lst):
+            step()
+            if progress_callback:
+                progress_callback(i+1, len(step_lst))
+
+    def recountConvUnit(self, count_fn, cost_fn, batch_size=500, progress_callback=None):
+        """
+        count the tokens of the units which are only estimated again, once the exact counts are available
+        (it is meant to run in a worker thread). conv_stats is updated by the triggers
+
+        the cost is corrected by the difference, for the user unit it is the cost of the whole prompt
+        and only the share of the unit itself is known here
+        :param count_fn: (model, list of the texts) -> list of the exact counts, None if they are still estimated
+        :param cost_fn: (model, token_cnt, is_user) -> cost, the same as ``getModelCost``
+        :param progress_callback: called with (done, total), done is the last counted unit id
+        :return: count of the recounted units
+        """
+        self.__writer.flush()
+        conn = self.getConnection()
+
+        def fn(conn, row_lst):
+            # the unit is only updated if it is still the same one which was read
+            return conn.executemany(f'UPDATE {self.__conv_unit_tb_nm} SET token_cnt=?, cost=?, token_exact=1 '
+                                    f'WHERE id=? AND NOT token_exact AND token_cnt IS ?', row_lst).rowcount
+
+        total = conn.execute(f'SELECT IFNULL(MAX(id), 0) FROM {self.__conv_unit_tb_nm} WHERE NOT token_exact').fetchone()[0]
+        last_id = 0
+        future_lst = []
+        # the models which are still estimated are skipped
+        estimated_model_set = set()
+        while True:
+            rows = conn.execute(f'''SELECT id, model, is_user, conv, token_cnt, cost FROM {self.__conv_unit_tb_nm}
+                                    WHERE NOT token_exact AND id > ? ORDER BY id LIMIT ?''', (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            model_dict = {}
+            for row in rows:
+                if row[1] not in estimated_model_set:
+                    model_dict.setdefault(row[1], []).append(row)
+            row_lst = []
+            for model, model_rows in model_dict.items():
+                cnt_lst = count_fn(model, [self.__codec.decode(conv) for id, model, is_user, conv, token_cnt, cost in model_rows])
+                if cnt_lst is None:
+                    estimated_model_set.add(model)
+                    continue
+                row_lst.extend((cnt, (cost or 0) + cost_fn(model, cnt - (token_cnt or 0), bool(is_user)), id, token_cnt)
+                               for (id, model, is_user, conv, token_cnt, cost), cnt in zip(model_rows, cnt_lst))
+            if row_lst:
+                if future_lst:
+                    future_lst[-1].result()
+                future_lst.append(self.__writer.submit(lambda conn, row_lst=row_lst: fn(conn, row_lst)))
+            if progress_callback:
+                progress_callback(last_id, total)
+        return sum(future.result() for future in future_lst)
+
+    def recompressConvUnit(self, batch_size=500, progress_callback=None):
+        """
+        rewrite the units which are not stored with the current codec, in batches (it is meant to run in a worker thread)
+
+        the units stored as they are over the threshold and the ones compressed with the other codec (or the older
+        dictionary) are rewritten. the first run of zstd trains its dictionary from a sample of the units.
+        the text doesn't change, so neither the full-text index nor update_dt of the conversations are touched
+        :param progress_callback: called with (done, total), done is the last rewritten unit id
+        :return: count of the rewritten units
+        """
+        header = self.__codec.getHeader()
+        if header is None:
+            return 0
+        self.__writer.flush()
+        conn = self.getConnection()
+        if self.__codec.getCodec() == ConvCodec.ZSTD and self.__codec.getDictionaryId() is None:
+            sample_lst = [self.__codec.decode(conv) for conv, in conn.execute(
+                f'SELECT conv FROM {self.__conv_unit_tb_nm} ORDER BY random() LIMIT 5000')]
+            dict_data = self.__codec.trainDictionary(sample_lst)
+            if dict_data:
+                dict_id = self.__writer.submit(lambda conn: conn.execute(
+                    f'INSERT INTO {self.__codec_dict_tb_nm} (dict) VALUES (?)', (dict_data,)).lastrowid,
+                    urgent=True).result()
+                self.__codec.addDictionary(dict_id, dict_data)
+                header = self.__codec.getHeader()
+
+        def fn(conn, row_lst):
+            # the unit is only rewritten if it is still the same one which was read
+            return conn.executemany(f'UPDATE {self.__conv_unit_tb_nm} SET conv=? WHERE id=? AND conv=?', row_lst).rowcount
+
+        total = conn.execute(f'SELECT IFNULL(MAX(id), 0) FROM {self.__conv_unit_tb_nm}').fetchone()[0]
+        last_id = 0
+        future_lst = []
+        while True:
+            rows = conn.execute(f'''SELECT id, conv FROM {self.__conv_unit_tb_nm} WHERE id > ?
+                                    AND ((typeof(conv) = 'text' AND length(CAST(conv AS BLOB)) >= ?)
+                                      OR (typeof(conv) = 'blob' AND substr(conv, 1, ?) <> ?))
+                                    ORDER BY id LIMIT ?''',
+                                (last_id, self.__codec.getThreshold(), len(header), header, batch_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            row_lst = []
+            for id, conv in rows:
+                new_conv = self.__codec.encode(self.__codec.decode(conv))
+                # units which don't get smaller stay as they are
+                if new_conv != conv:
+                    row_lst.append((new_conv, id, conv))
+            if row_lst:
+                # waiting for the previous batch only, so reading and writing overlap
+                if future_lst:
+                    future_lst[-1].result()
+                future_lst.append(self.__writer.submit(lambda conn, row_lst=row_lst: fn(conn, row_lst)))
+            if progress_callback:
+                progress_callback(last_id, total)
+        return sum(future.result() for future in future_lst)
+
+    def searchConv(self, text, limit=200, archived=False):
+        """
+        search the titles and the units of every conversation
+
+        this is a generator which is meant to be consumed in a worker thread.
+        it yields (conv id, snippet) once per conversation (``limit`` conversations at most),
+        title matches first and then the units ranked by bm25.
+        snippet is html with the matched terms in <b>, empty for the title matches
+        :param archived: search the archived units too (at last), they are not indexed so every one of them is scanned
+        """
+        self.__writer.flush()
+        conn = self.getConnection()
+        found_id_set = set()
+        for id, in conn.execute(f'SELECT id FROM {self.__conv_tb_nm} WHERE instr(lower(name), lower(?)) > 0', (text,)):
+            found_id_set.add(id)
+            yield id, ''
+
+        # every word is quoted (so the user can't write broken fts syntax) and matched as a prefix
+        match = ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+        if not match:
+            return
+        # fts5 returns the rows already ordered by rank, so the snippet is only made for the rows which are read
+        # snippet markers are control characters, so the rest of the text can be escaped safely
+        cursor = conn.execute(f'''SELECT u.conv_id, snippet({self.__conv_unit_fts_nm}, 0, char(2), char(3), '...', 12)
+                                  FROM {self.__conv_unit_fts_nm} JOIN {self.__conv_unit_tb_nm} u
+                                  ON u.id = {self.__conv_unit_fts_nm}.rowid
+                                  WHERE {self.__conv_unit_fts_nm} MATCH ?
+                                  ORDER BY {self.__conv_unit_fts_nm}.rank''', (match,))
+        for conv_id, snippet in cursor:
+            if conv_id in found_id_set:
+                continue
+            found_id_set.add(conv_id)
+            yield conv_id, html.escape(snippet).replace('\x02', '<b>').replace('\x03', '</b>')
+            if len(found_id_set) >= limit:
+                return
+        if not archived:
+            return
+
+        cursor = conn.execute(f'''SELECT conv_id, conv FROM {self.__archive_db_nm}.{self.__conv_unit_tb_nm}
+                                  WHERE conv_id IN (SELECT id FROM main.{self.__conv_tb_nm} WHERE archived)
+                                  AND instr(lower(decode_conv(conv)), lower(?)) > 0''', (text,))
+        for conv_id, conv in cursor:
+            if conv_id in found_id_set:
+                continue
+            found_id_set.add(conv_id)
+            yield conv_id, self.__getSnippet(self.__codec.decode(conv), text)
+            if len(found_id_set) >= limit:
+                return
+
+    def __getSnippet(self, conv, text, width=40):
+        """
+        html snippet around the first match of the text, like the one of fts5
+        """
+        i = conv.lower().find(text.lower())
+        start, end = max(i - width, 0), min(i + len(text) + width, len(conv))
+        return ('...' if start > 0 else '') + html.escape(conv[start:i]) + '<b>' + html.escape(conv[i:i+len(text)]) + '</b>' \
+            + html.escape(conv[i+len(text):end]) + ('...' if end < len(conv) else '')
 
     def setModelType(self, model_type: int):
         """
@@ -431,44 +1503,141 @@ class SqliteDatabase:
         """
         self.__model_type = model_type
 
-    def export(self, ids, saved_filename):
-        shutil.copy2(self.__db_filename, saved_filename)
-        conn = sqlite3.connect(saved_filename)
-
-        placeholders = ','.join('?' for _ in ids)
-        cursor = conn.cursor()
-        for i in range(len(ids)):
-            delete_conv_q = f"DELETE FROM {self.__conv_tb_nm} WHERE id in ({placeholders})"
-            cursor.execute(delete_conv_q, ids)
-            drop_conv_unit_tb_q = f"DROP TABLE {self.__conv_unit_tb_nm}{ids[i]}"
-            cursor.execute(drop_conv_unit_tb_q)
-            conn.commit()
-
-        conn.close()
-
-    def convertJsonIntoSql(self):
+    def export(self, ids, saved_filename, progress_callback=None, chunk_size=100):
+        """
+        write the given conversations (with the info tables) into a fresh database, in one transaction
+
+        the new file gets the same schema, and rows are copied with INSERT ... SELECT from the attached database,
+        so only the exported conversations are read and written.
+        the units are decoded and the triggers and the view don't use decode_conv, so the file is a plain sqlite database
+        which any sqlite3 connection can read and write.
+        it uses its own connection, so it can run in a worker thread
+        :param progress_callback: called with (done, total) count of conversations
+        """
+        self.__flushInfo()
+        self.__writer.flush()
+        if os.path.exists(saved_filename):
+            os.remove(saved_filename)
+
+        total = len(ids)
+        conn = sqlite3.connect(saved_filename, isolation_level=None)
+        self.__initConnection(conn)
         try:
-            # Read data from json
-            with open('test/conv_history.json', 'r') as f:
-                data = json.load(f)
-                for obj in list(data.values())[0]:
-                    id, title, conv_data = obj.values()
-                    # start from 1 in sql unlike json which starts from 0
-                    id += 1
-                    self.insertConv(title)
-                    for i in range(len(conv_data)):
-                        # Insert a row into the table
-                        self.__c.execute(
-                            f'INSERT INTO {self.__conv_unit_tb_nm}{id} (id_fk, is_user, conv) VALUES (?, ?, ?)',
-                            (id, i % 2 == 0, conv_data[i],))
-                        # Commit the transaction
-                        self.__conn.commit()
+            conn.execute('ATTACH DATABASE ? AS src', (self.__db_filename,))
+            schema_lst = conn.execute("SELECT type, name, sql FROM src.sqlite_master "
+                                      "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'").fetchall()
+            # shadow tables of the virtual (fts) tables are created by the virtual tables themselves
+            virtual_tb_nm_lst = [name for type, name, sql in schema_lst if sql.upper().startswith('CREATE VIRTUAL TABLE')]
+            tb_nm_lst = [name for type, name, sql in schema_lst if type == 'table'
+                         and not any(name.startswith(f'{v}_') for v in virtual_tb_nm_lst)]
+
+            conn.execute('BEGIN')
+            for type, name, sql in schema_lst:
+                if (type == 'table' and name in tb_nm_lst) or type == 'index':
+                    conn.execute(sql)
+
+            conn.execute('CREATE TEMP TABLE export_id (id INTEGER PRIMARY KEY)')
+            conn.executemany('INSERT INTO temp.export_id VALUES (?)', ((id,) for id in ids))
+            for tb_nm, id_column in self.__export_tb_dict.items():
+                if id_column is None:
+                    conn.execute(f'INSERT INTO main.{tb_nm} SELECT * FROM src.{tb_nm}')
+                elif tb_nm != self.__conv_unit_tb_nm:
+                    conn.execute(f'INSERT INTO main.{tb_nm} SELECT * FROM src.{tb_nm} '
+                                 f'WHERE {id_column} IN (SELECT id FROM temp.export_id)')
+            # units are decoded while they are copied, the archive has the same columns in the same order
+            column_sql = ', '.join('decode_conv(conv)' if row[1] == 'conv' else row[1]
+                                   for row in conn.execute(f'PRAGMA src.table_info({self.__conv_unit_tb_nm})'))
+            # units are the bulk of the data, copy them in chunks of conversations to report the progress
+            for i in range(0, total, chunk_size):
+                chunk = ids[i:i+chunk_size]
+                conn.execute(f'INSERT INTO main.{self.__conv_unit_tb_nm} SELECT {column_sql} FROM src.{self.__conv_unit_tb_nm} '
+                             f'WHERE conv_id IN ({",".join("?" for _ in chunk)})', chunk)
+                # the archived ones are exported as the ordinary ones
+                conn.execute(f'INSERT OR IGNORE INTO main.{self.__conv_unit_tb_nm} '
+                             f'SELECT {column_sql} FROM {self.__archive_db_nm}.{self.__conv_unit_tb_nm} '
+                             f'WHERE conv_id IN (SELECT id FROM main.{self.__conv_tb_nm} WHERE archived '
+                             f'AND id IN ({",".join("?" for _ in chunk)}))', chunk)
+                if progress_callback:
+                    progress_callback(min(i+chunk_size, total), total)
+            conn.execute(f'UPDATE main.{self.__conv_tb_nm} SET archived=0')
+
+            # triggers are created after the rows are copied, so update_dt of the copied rows stays as it is
+            for type, name, sql in schema_lst:
+                if type in ('view', 'trigger'):
+                    conn.execute(re.sub(r'decode_conv\(([\w.]+)\)', r'\1', sql))
+            for name in virtual_tb_nm_lst:
+                conn.execute(f"INSERT INTO main.{name} ({name}) VALUES ('rebuild')")
+            conn.execute('COMMIT')
+            conn.execute('DETACH DATABASE src')
         except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            print(f"An error occurred while exporting: {e}")
             raise
+        finally:
+            conn.close()
+
+    def selectImport(self, filename, size, mtime):
+        """
+        get the import state of the file, it is identified by its path, size and modification time
+        :return: (id, count of the items already imported, finished or not)
+        """
+        def fn(conn):
+            conn.execute(f'INSERT OR IGNORE INTO {self.__import_tb_nm} (filename, size, mtime) VALUES (?, ?, ?)',
+                         (filename, size, mtime))
+            return conn.execute(f'SELECT id, item_cnt, finished FROM {self.__import_tb_nm} '
+                                f'WHERE filename=? AND size=? AND mtime=?', (filename, size, mtime)).fetchone()
+        id, item_cnt, finished = self.__writer.submit(fn, urgent=True).result()
+        return id, item_cnt, bool(finished)
+
+    def insertConvBatch(self, conv_lst, import_id=None, item_cnt=0, finished=False, token_exact=True):
+        """
+        insert many conversations with their units in one transaction, with executemany
+
+        ids are assigned here (the writer is the only one inserting, so MAX(id) can't change in the meantime).
+        update_dt of the conversation is bumped by the triggers while its units are inserted, so it is set back afterwards
+        :param conv_lst: list of (title, insert_dt, update_dt, [(is_user, conv, token_cnt), ...]), dt may be None
+        :param import_id: id of the import state which is updated in the same transaction
+        :param item_cnt: count of the items of the imported file which are done after this batch
+        :param token_exact: False if token_cnt of the units is only estimated
+        :return: future of the list of the new conv ids
+        """
+        def fn(conn):
+            next_id = conn.execute(f'SELECT IFNULL(MAX(id), 0) + 1 FROM {self.__conv_tb_nm}').fetchone()[0]
+            conv_row_lst = []
+            unit_row_lst = []
+            for i, (title, insert_dt, update_dt, unit_lst) in enumerate(conv_lst):
+                id = next_id + i
+                conv_row_lst.append((id, title, insert_dt, update_dt))
+                unit_row_lst.extend((id, seq, is_user, self.__codec.encode(conv), token_cnt, token_exact)
+                                    for seq, (is_user, conv, token_cnt) in enumerate(unit_lst, 1))
+            conn.executemany(f'INSERT INTO {self.__conv_tb_nm} (id, name, insert_dt, update_dt) '
+                             f'VALUES (?, ?, IFNULL(?, CURRENT_TIMESTAMP), IFNULL(?, CURRENT_TIMESTAMP))', conv_row_lst)
+            conn.executemany(f'INSERT INTO {self.__conv_unit_tb_nm} (conv_id, seq, is_user, conv, token_cnt, token_exact) '
+                             f'VALUES (?, ?, ?, ?, ?, ?)', unit_row_lst)
+            conn.executemany(f'UPDATE {self.__conv_tb_nm} SET update_dt=? WHERE id=?',
+                             [(update_dt, id) for id, _, _, update_dt in conv_row_lst if update_dt])
+            if import_id is not None:
+                conn.execute(f'UPDATE {self.__import_tb_nm} SET item_cnt=?, finished=?, update_dt=CURRENT_TIMESTAMP '
+                             f'WHERE id=?', (item_cnt, finished, import_id))
+            return [row[0] for row in conv_row_lst]
+        return self.__writer.submit(fn)
+
+    def convertJsonIntoSql(self, filename='conv_history.json', progress_callback=None):
+        """
+        import the conversations of the old json file (the version which used json as a database)
+        """
+        from pyqt_openai.convImporter import ConvImporter
+        return ConvImporter(self).importFile(filename, progress_callback=progress_callback)
 
     def getCursor(self):
-        return self.__c
+        """
+        get a new cursor of the calling thread's read connection
+        """
+        return self.getConnection().cursor()
+
+    def getDbFilename(self):
+        return self.__db_filename
 
     def getConvTableName(self):
         return self.__conv_tb_nm
@@ -476,7 +1645,18 @@ class SqliteDatabase:
     def getConvUnitTableName(self):
         return self.__conv_unit_tb_nm
 
+    def flush(self):
+        """
+        block until every queued write is committed
+        """
+        self.__writer.flush()
+
     def close(self):
+        # flush the changed info and the queued writes before closing
+        self.__flushInfo()
+        self.__writer.close()
+        for thread_conn in list(self.__thread_conn_set):
+            thread_conn.conn.close()
         self.__conn.close()
 
     def __enter__(self):
@@ -484,8 +1664,4 @@ class SqliteDatabase:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         # Close the connection
-        self.__conn.close()
-
-
-with SqliteDatabase() as f:
-    pass
\ No newline at end of file
+        self.close()
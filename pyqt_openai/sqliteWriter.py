@@ -0,0 +1,132 @@
+import queue, sqlite3, threading, time
+from concurrent.futures import Future
+
+
+class SqliteWriter(threading.Thread):
+    """
+    write-behind thread which owns the only connection that writes to the database
+
+    every write operation is a function which takes the connection, queued with ``submit``.
+    queued operations are executed in batches, one transaction per flush window
+    (``flush_interval`` seconds or ``batch_size`` operations, whichever comes first),
+    so a burst of writes pays for one commit instead of one per row.
+
+    each operation runs in its own savepoint, so a failing one only fails its own future.
+    futures are resolved after the commit, which means that once ``result()`` returns, every reader sees the write.
+    """
+    def __init__(self, db_filename, flush_interval: float = 0.05, batch_size: int = 256, init_fn=None):
+        """
+        :param init_fn: function which gets the connection right after it is opened (e.g. to register sql functions)
+        """
+        super().__init__(name='SqliteWriter', daemon=True)
+        self.__initVal(db_filename, flush_interval, batch_size, init_fn)
+
+    def __initVal(self, db_filename, flush_interval, batch_size, init_fn):
+        self.__db_filename = db_filename
+        self.__init_fn = init_fn
+        self.__flush_interval = flush_interval
+        self.__batch_size = batch_size
+
+        self.__queue = queue.Queue()
+        # submitted but not yet committed operations
+        self.__pending_cnt = 0
+        self.__lock = threading.Lock()
+        self.__closed = False
+
+    def submit(self, fn, urgent: bool = False) -> Future:
+        """
+        :param fn: function which gets the sqlite3 connection, its return value becomes the result of the future
+        :param urgent: close the current flush window right after this operation (for callers which wait for the result)
+        :return: future of the operation
+        """
+        future = Future()
+        with self.__lock:
+            if self.__closed:
+                raise RuntimeError('SqliteWriter is already closed')
+            self.__pending_cnt += 1
+            self.__queue.put((fn, future, urgent))
+        return future
+
+    def flush(self):
+        """
+        block until every operation submitted so far is committed
+        """
+        if threading.current_thread() is self:
+            return
+        with self.__lock:
+            if self.__pending_cnt == 0 or self.__closed:
+                return
+        self.submit(lambda conn: None, urgent=True).result()
+
+    def close(self):
+        """
+        flush everything which is queued and stop the thread
+        """
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.__queue.put(None)
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        # autocommit mode, transactions are opened explicitly per batch
+        conn = sqlite3.connect(self.__db_filename, isolation_level=None)
+        conn.execute('PRAGMA foreign_keys = ON;')
+        conn.execute('PRAGMA synchronous = NORMAL;')
+        if self.__init_fn:
+            self.__init_fn(conn)
+        try:
+            stop = False
+            while not stop:
+                item = self.__queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.__flush_interval
+                # collect more operations until the flush window closes
+                while not item[2] and len(batch) < self.__batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self.__queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                self.__executeBatch(conn, batch)
+        finally:
+            conn.close()
+
+    def __executeBatch(self, conn, batch):
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for fn, future, _ in batch:
+                conn.execute('SAVEPOINT op')
+                try:
+                    results.append((future, fn(conn), None))
+                    conn.execute('RELEASE op')
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+                    conn.execute('ROLLBACK TO op')
+                    conn.execute('RELEASE op')
+                    results.append((future, None, e))
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            print(f"An error occurred while committing: {e}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            results = [(future, None, e) for future, _, _ in batch]
+
+        for future, result, exc in results:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+        with self.__lock:
+            self.__pending_cnt -= len(batch)
@@ -0,0 +1,258 @@
+import base64, hashlib, os, threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from pyqt_openai.sqlite import getDataDir
+
+# optional, the encodings of OpenAI models are taken from tiktoken if it is installed
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# optional, needed to split the text the way the encodings do (\p{L}, \p{N}) when tiktoken is not installed
+try:
+    import regex
+except ImportError:
+    regex = None
+
+
+# pattern which splits the text into pieces before byte pair encoding
+# https://github.com/openai/tiktoken/blob/main/tiktoken_ext/openai_public.py
+ENCODING_PATTERN_DICT = {
+    'cl100k_base': r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+""",
+    'p50k_base': r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+}
+
+# model (prefix) - encoding
+MODEL_ENCODING_DICT = {
+    'gpt-4': 'cl100k_base',
+    'gpt-3.5-turbo': 'cl100k_base',
+    'text-embedding-ada-002': 'cl100k_base',
+    'text-davinci-003': 'p50k_base',
+    'text-davinci-002': 'p50k_base',
+    'code-davinci-002': 'p50k_base',
+}
+
+
+def getModelEncoding(model):
+    """
+    :return: name of the encoding of the model, cl100k_base for the unknown model
+    """
+    for prefix, encoding_name in MODEL_ENCODING_DICT.items():
+        if model and model.startswith(prefix):
+            return encoding_name
+    return 'cl100k_base'
+
+
+class BytePairEncoder:
+    """
+    byte pair encoding in pure python, the same result as tiktoken with the same ranks
+
+    ranks are read from the file of tiktoken (base64 of the token and its rank in each line),
+    pieces are cached since the same words appear again and again
+    """
+    def __init__(self, rank_dict, pattern, cache_size: int = 65536):
+        """
+        :param rank_dict: token (bytes) - rank
+        """
+        super().__init__()
+        self.__rank_dict = rank_dict
+        self.__token_dict = {rank: token for token, rank in rank_dict.items()}
+        self.__pattern = regex.compile(pattern)
+        self.__encodePiece = lru_cache(maxsize=cache_size)(self.__encodePiece)
+
+    @staticmethod
+    def load(filename, pattern):
+        rank_dict = {}
+        with open(filename, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    token, rank = line.split()
+                    rank_dict[base64.b64decode(token)] = int(rank)
+        return BytePairEncoder(rank_dict, pattern)
+
+    def encode(self, text):
+        token_lst = []
+        for piece in self.__pattern.findall(text):
+            token_lst.extend(self.__encodePiece(piece.encode('utf-8')))
+        return token_lst
+
+    def decode(self, token_lst):
+        return b''.join(self.__token_dict[token] for token in token_lst).decode('utf-8', errors='replace')
+
+    def __encodePiece(self, piece):
+        rank = self.__rank_dict.get(piece)
+        if rank is not None:
+            return (rank,)
+        # merge the pair which has the lowest rank (the leftmost one if they are the same) until nothing can be merged
+        part_lst = [piece[i:i+1] for i in range(len(piece))]
+        while len(part_lst) > 1:
+            min_rank, min_idx = None, None
+            for i in range(len(part_lst)-1):
+                rank = self.__rank_dict.get(part_lst[i] + part_lst[i+1])
+                if rank is not None and (min_rank is None or rank < min_rank):
+                    min_rank, min_idx = rank, i
+            if min_idx is None:
+                break
+            part_lst[min_idx:min_idx+2] = [part_lst[min_idx] + part_lst[min_idx+1]]
+        return tuple(self.__rank_dict[part] for part in part_lst)
+
+
+class Tokenizer:
+    """
+    count the tokens of the text offline
+
+    - tiktoken, if it is installed (and has the encoding)
+    - BytePairEncoder, if regex is installed and the ranks file (e.g. cl100k_base.tiktoken) is in the data directory
+    - estimation (about 4 characters per token) otherwise
+
+    counts are cached with the hash of the text, so the same text is never tokenized twice
+    """
+    TIKTOKEN = 'tiktoken'
+    BPE = 'bpe'
+    ESTIMATE = 'estimate'
+
+    def __init__(self, encoding_name: str = 'cl100k_base', cache_size: int = 65536):
+        super().__init__()
+        self.__initVal(encoding_name, cache_size)
+        self.__initEncoder()
+
+    def __initVal(self, encoding_name, cache_size):
+        self.__encoding_name = encoding_name
+        self.__cache_size = cache_size
+        # hash of the text - count of the tokens, the least recently used one first
+        self.__cnt_dict = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__encoder = None
+        self.__backend = Tokenizer.ESTIMATE
+
+    def __initEncoder(self):
+        if tiktoken is not None:
+            try:
+                self.__encoder = tiktoken.get_encoding(self.__encoding_name)
+                self.__backend = Tokenizer.TIKTOKEN
+                return
+            except Exception as e:
+                # the encoding is downloaded on the first use, which fails offline
+                print(f'tiktoken encoding {self.__encoding_name} is not available: {e}')
+        ranks_filename = os.path.join(getDataDir(), f'{self.__encoding_name}.tiktoken')
+        pattern = ENCODING_PATTERN_DICT.get(self.__encoding_name)
+        if regex is not None and pattern and os.path.exists(ranks_filename):
+            self.__encoder = BytePairEncoder.load(ranks_filename, pattern)
+            self.__backend = Tokenizer.BPE
+
+    def getBackend(self):
+        return self.__backend
+
+    def getEncodingName(self):
+        return self.__encoding_name
+
+    def isExact(self):
+        return self.__encoder is not None
+
+    def encode(self, text):
+        """
+        :return: list of the tokens, None if it is only estimated
+        """
+        if self.__backend == Tokenizer.TIKTOKEN:
+            return self.__encoder.encode_ordinary(text)
+        elif self.__backend == Tokenizer.BPE:
+            return self.__encoder.encode(text)
+        return None
+
+    def decode(self, token_lst):
+        return self.__encoder.decode(token_lst)
+
+    def count(self, text):
+        if not text:
+            return 0
+        key = self.__getKey(text)
+        with self.__lock:
+            cnt = self.__cnt_dict.get(key)
+            if cnt is not None:
+                self.__cnt_dict.move_to_end(key)
+                return cnt
+        cnt = self.__count(text)
+        self.__setCount(key, cnt)
+        return cnt
+
+    def countBatch(self, text_lst):
+        """
+        count the tokens of many texts at once, tiktoken encodes the ones which are not cached in its threads
+
+        :return: list of the counts in the same order
+        """
+        key_lst = [self.__getKey(text) if text else None for text in text_lst]
+        cnt_lst = [0] * len(text_lst)
+        miss_idx_lst = []
+        with self.__lock:
+            for i, key in enumerate(key_lst):
+                if key is None:
+                    continue
+                cnt = self.__cnt_dict.get(key)
+                if cnt is None:
+                    miss_idx_lst.append(i)
+                else:
+                    self.__cnt_dict.move_to_end(key)
+                    cnt_lst[i] = cnt
+        if not miss_idx_lst:
+            return cnt_lst
+        miss_text_lst = [text_lst[i] for i in miss_idx_lst]
+        if self.__backend == Tokenizer.TIKTOKEN:
+            miss_cnt_lst = [len(token_lst) for token_lst in self.__encoder.encode_ordinary_batch(miss_text_lst)]
+        else:
+            miss_cnt_lst = [self.__count(text) for text in miss_text_lst]
+        for i, cnt in zip(miss_idx_lst, miss_cnt_lst):
+            cnt_lst[i] = cnt
+            self.__setCount(key_lst[i], cnt)
+        return cnt_lst
+
+    def truncate(self, text, max_cnt):
+        """
+        :return: the beginning of the text which has ``max_cnt`` tokens at most
+        """
+        if self.count(text) <= max_cnt:
+            return text
+        if self.isExact():
+            return self.decode(self.encode(text)[:max_cnt])
+        return text[:max_cnt * 4]
+
+    def __count(self, text):
+        if self.__encoder is None:
+            return (len(text) + 3) // 4
+        return len(self.encode(text))
+
+    def __getKey(self, text):
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def __setCount(self, key, cnt):
+        with self.__lock:
+            self.__cnt_dict[key] = cnt
+            while len(self.__cnt_dict) > self.__cache_size:
+                self.__cnt_dict.popitem(last=False)
+
+
+_tokenizer_dict = {}
+_tokenizer_lock = threading.Lock()
+
+
+def getTokenizer(model=None):
+    """
+    get the tokenizer of the model's encoding shared by the whole application
+    """
+    encoding_name = getModelEncoding(model)
+    with _tokenizer_lock:
+        if encoding_name not in _tokenizer_dict:
+            _tokenizer_dict[encoding_name] = Tokenizer(encoding_name)
+        return _tokenizer_dict[encoding_name]
+
+
+def countExact(model, text_lst):
+    """
+    :return: list of the exact counts of the texts, None if the tokenizer of the model only estimates them
+    """
+    tokenizer = getTokenizer(model)
+    if not tokenizer.isExact():
+        return None
+    return tokenizer.countBatch(text_lst)
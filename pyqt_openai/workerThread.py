@@ -0,0 +1,30 @@
+from qtpy.QtCore import QThread, Signal
+
+
+class WorkerThread(QThread):
+    """
+    run a long function (export, import, etc.) without blocking the ui
+
+    the function gets ``progress_callback`` as a keyword argument, calling it emits progressChanged
+
+    == progressChanged Signal ==
+    First: done
+    Second: total
+    """
+    progressChanged = Signal(int, int)
+    succeeded = Signal(object)
+    failed = Signal(str)
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.__fn = fn
+        self.__args = args
+        self.__kwargs = kwargs
+
+    def run(self):
+        try:
+            result = self.__fn(*self.__args, progress_callback=self.progressChanged.emit, **self.__kwargs)
+            self.succeeded.emit(result)
+        except Exception as e:
+            print(e)
+            self.failed.emit(str(e))
@@ -17,7 +17,7 @@ setup(
     package_data={'pyqt_openai.ico': ['close.svg', 'openai.svg', 'help.svg', 'customize.svg', 'user.svg',
                                       'sidebar.svg', 'prompt.svg', 'download.svg', 'stackontop.svg',
                                       'add.svg', 'delete.svg', 'setting.svg', 'search.svg',
-                                      'vertical_three_dots.svg']},
+                                      'vertical_three_dots.svg', 'upload.svg', 'stop.svg', 'compare.svg']},
     description='PyQt OpenAI example',
     url='https://github.com/yjg30737/pyqt-openai.git',
     long_description_content_type='text/markdown',
@@ -27,7 +27,14 @@ setup(
         'PySide6',
         'qtpy',
         'aiohttp',
+        'requests',
         'openai',
-        'pyperclip'
-    ]
+        'pyperclip',
+        'tiktoken',
+        'regex'
+    ],
+    extras_require={
+        # semantic cache of the replies
+        'semantic': ['numpy'],
+    }
 )
\ No newline at end of file
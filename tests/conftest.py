@@ -0,0 +1,30 @@
+import os, sys
+
+import pytest
+
+# the package is imported from the source tree
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyqt_openai.sqlite import SqliteDatabase
+
+
+@pytest.fixture
+def db(tmp_path):
+    """
+    empty database in its own directory (the archive and the semantic index are made next to it)
+    """
+    db = SqliteDatabase(str(tmp_path / 'conv.db'))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def conv_id(db):
+    """
+    conversation of two turns in ``db``
+    """
+    id = db.insertConv('Greeting').result()
+    for user_f, conv in [(1, 'Hello'), (0, 'Hi, how can I help?'), (1, 'Say <b>bye</b>'), (0, 'Bye')]:
+        db.insertConvUnit(id, user_f, conv)
+    db.flush()
+    return id
@@ -0,0 +1,53 @@
+import sqlite3
+
+from pyqt_openai.sqlite import SqliteDatabase
+
+
+def _makeLegacyDb(filename):
+    """
+    database of the older version, one conv_unit_tbN table for each conversation
+    """
+    conn = sqlite3.connect(filename)
+    conn.execute('''CREATE TABLE conv_tb (id INTEGER PRIMARY KEY, name TEXT,
+                    update_dt DATETIME DEFAULT CURRENT_TIMESTAMP, insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    conn.execute("INSERT INTO conv_tb (id, name, update_dt) VALUES (1, 'kept', '2023-01-02 03:04:05')")
+    for id_fk, unit_lst in ((1, [(1, 'What is WAL?'), (0, 'Write-ahead logging.')]), (2, [(1, 'deleted one')])):
+        conn.execute(f'''CREATE TABLE conv_unit_tb{id_fk} (id INTEGER PRIMARY KEY, id_fk INTEGER, is_user INTEGER, conv TEXT,
+                         update_dt DATETIME DEFAULT CURRENT_TIMESTAMP, insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+        conn.execute(f'''CREATE TRIGGER conv_tb_updated_by_unit_inserted_tr{id_fk} AFTER INSERT ON conv_unit_tb{id_fk}
+                         BEGIN UPDATE conv_tb SET update_dt = CURRENT_TIMESTAMP WHERE id = NEW.id_fk; END''')
+        conn.executemany(f'INSERT INTO conv_unit_tb{id_fk} (id_fk, is_user, conv) VALUES (?, ?, ?)',
+                         [(id_fk, is_user, conv) for is_user, conv in unit_lst])
+    conn.execute("UPDATE conv_tb SET update_dt = '2023-01-02 03:04:05'")
+    conn.commit()
+    conn.close()
+
+
+def test_legacy_tables_are_moved_into_the_messages_table(tmp_path):
+    filename = str(tmp_path / 'legacy.db')
+    _makeLegacyDb(filename)
+    db = SqliteDatabase(filename)
+    try:
+        assert db.selectConvUnitPage(1) == [(1, 1, 'What is WAL?'), (2, 0, 'Write-ahead logging.')]
+        conn = db.getConnection()
+        # the table of the deleted conversation is dropped with its units, and so are the triggers
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name GLOB 'conv_unit_tb[0-9]*' "
+                            "OR name GLOB 'conv_tb_updated_by_unit_*_tr[0-9]*'").fetchone()[0] == 0
+        assert conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0] == 2
+        assert db.selectConvStats(1)[4] == 2
+        assert [id for id, snippet in db.searchConv('logging')] == [1]
+    finally:
+        db.close()
+
+
+def test_units_are_numbered_within_their_conversation(db, conv_id):
+    other_id = db.insertConv('other').result()
+    db.insertConvUnit(other_id, 1, 'first of the other')
+    db.insertConvUnit(conv_id, 0, 'fifth of the greeting')
+    db.flush()
+    assert [seq for seq, is_user, conv in db.selectConvUnitPage(other_id)] == [1]
+    assert db.selectConvUnitPage(conv_id)[-1] == (5, 0, 'fifth of the greeting')
+    # the units go with their conversation
+    db.deleteConv(conv_id).result()
+    assert db.selectConvUnitPage(conv_id) == []
+    assert db.getConnection().execute('SELECT COUNT(*) FROM messages').fetchone()[0] == 1
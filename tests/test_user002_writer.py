@@ -0,0 +1,96 @@
+import sqlite3, time
+
+import pytest
+
+from pyqt_openai.sqliteWriter import SqliteWriter
+
+
+@pytest.fixture
+def filename(tmp_path):
+    filename = str(tmp_path / 'writer.db')
+    conn = sqlite3.connect(filename)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT NOT NULL)')
+    conn.close()
+    return filename
+
+
+@pytest.fixture
+def statement_lst():
+    return []
+
+
+@pytest.fixture
+def writer(filename, statement_lst):
+    # every statement of the writer's connection is recorded
+    writer = SqliteWriter(filename, flush_interval=0.5, init_fn=lambda conn: conn.set_trace_callback(statement_lst.append))
+    writer.start()
+    yield writer
+    writer.close()
+
+
+def _values(filename):
+    conn = sqlite3.connect(filename)
+    value_lst = [v for v, in conn.execute('SELECT v FROM t ORDER BY id')]
+    conn.close()
+    return value_lst
+
+
+def test_future_gets_the_result_after_the_commit(writer, filename):
+    future = writer.submit(lambda conn: conn.execute("INSERT INTO t (v) VALUES ('a')").lastrowid, urgent=True)
+    assert future.result(5) == 1
+    # visible to the other connections as soon as the result is there
+    assert _values(filename) == ['a']
+
+
+def test_failing_operation_only_rolls_back_its_own_savepoint(writer, filename):
+    ok_future = writer.submit(lambda conn: conn.execute("INSERT INTO t (v) VALUES ('kept')"))
+
+    def fail(conn):
+        conn.execute("INSERT INTO t (v) VALUES ('rolled back')")
+        conn.execute('INSERT INTO t (v) VALUES (NULL)')
+
+    failed_future = writer.submit(fail)
+    last_future = writer.submit(lambda conn: conn.execute("INSERT INTO t (v) VALUES ('also kept')"), urgent=True)
+    with pytest.raises(sqlite3.IntegrityError):
+        failed_future.result(5)
+    ok_future.result(5)
+    last_future.result(5)
+    assert _values(filename) == ['kept', 'also kept']
+
+
+def test_burst_of_writes_is_committed_in_one_transaction(writer, filename, statement_lst):
+    future_lst = [writer.submit(lambda conn, i=i: conn.execute('INSERT INTO t (v) VALUES (?)', (str(i),)))
+                  for i in range(100)]
+    writer.flush()
+    assert all(future.done() for future in future_lst)
+    assert len(_values(filename)) == 100
+    # the flush itself is the last operation of the same window
+    assert statement_lst.count('COMMIT') == 1
+
+
+def test_closed_writer_flushes_and_refuses_the_new_operations(writer, filename):
+    writer.submit(lambda conn: conn.execute("INSERT INTO t (v) VALUES ('last')"))
+    writer.close()
+    assert _values(filename) == ['last']
+    with pytest.raises(RuntimeError):
+        writer.submit(lambda conn: None)
+
+
+def test_sidebar_reads_do_not_wait_for_the_queued_writes(db, conv_id):
+    # another connection holds the write lock, so the writer can't commit for now
+    blocker = sqlite3.connect(db.getDbFilename(), isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')
+    try:
+        future = db.insertConvUnit(conv_id, 1, 'Queued')
+        start_time = time.monotonic()
+        assert db.selectConvStats(conv_id)[4] == 4
+        assert db.selectConvIds() == [conv_id]
+        assert db.selectConvUnitPage(conv_id)[-1][2] == 'Bye'
+        assert time.monotonic() - start_time < 1
+        assert not future.done()
+    finally:
+        blocker.execute('ROLLBACK')
+        blocker.close()
+    future.result(5)
+    assert db.selectConvStats(conv_id)[4] == 5
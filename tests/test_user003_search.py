@@ -0,0 +1,40 @@
+import sqlite3
+
+
+def test_title_matches_come_first_and_then_the_units_by_rank(db, conv_id):
+    other_id = db.insertConv('Say bye politely').result()
+    db.insertConvUnit(other_id, 1, 'nothing here')
+    third_id = db.insertConv('Third').result()
+    db.insertConvUnit(third_id, 0, 'bye bye bye, and bye again')
+    db.flush()
+    result_lst = list(db.searchConv('bye'))
+    assert result_lst[0] == (other_id, '')
+    # once per conversation
+    assert [id for id, snippet in result_lst] == [other_id, third_id, conv_id]
+
+
+def test_snippet_is_escaped_and_the_words_are_matched_as_prefixes(db):
+    id = db.insertConv('Markup').result()
+    db.insertConvUnit(id, 0, 'Use <i>italic</i> text')
+    db.flush()
+    assert list(db.searchConv('ital')) == [(id, 'Use &lt;i&gt;<b>italic</b>&lt;/i&gt; text')]
+
+
+def test_broken_fts_syntax_is_searched_as_words(db, conv_id):
+    assert [id for id, snippet in db.searchConv('"how (can*')] == [conv_id]
+    assert list(db.searchConv('"*()')) == []
+
+
+def test_index_follows_the_deleted_conversations(db, conv_id):
+    db.deleteConv(conv_id)
+    assert list(db.searchConv('help')) == []
+
+
+def test_archived_units_are_scanned_only_when_asked(db, conv_id):
+    conn = sqlite3.connect(db.getDbFilename())
+    with conn:
+        conn.execute("UPDATE conv_tb SET update_dt = datetime('now', '-200 days')")
+    conn.close()
+    db.archiveConv(90)
+    assert list(db.searchConv('help')) == []
+    assert list(db.searchConv('help', archived=True)) == [(conv_id, 'Hi, how can I <b>help</b>?')]
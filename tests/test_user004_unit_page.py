@@ -0,0 +1,36 @@
+import pytest
+
+
+@pytest.fixture
+def long_conv_id(db):
+    """
+    conversation of 23 units, 'unit 0' to 'unit 22'
+    """
+    id = db.insertConv('Long').result()
+    for i in range(23):
+        db.insertConvUnit(id, i % 2 == 0, f'unit {i}')
+    db.flush()
+    return id
+
+
+def test_pages_go_back_from_the_newest_units_until_the_first_one(db, long_conv_id):
+    page_lst = []
+    before_seq = None
+    while True:
+        page = db.selectConvUnitPage(long_conv_id, before_seq, limit=10)
+        if not page:
+            break
+        page_lst.append([conv for seq, is_user, conv in page])
+        before_seq = page[0][0]
+
+    assert [len(page) for page in page_lst] == [10, 10, 3]
+    assert page_lst[0][-1] == 'unit 22'
+    # the pages put in front of each other make the whole conversation, in order
+    assert sum(reversed(page_lst), []) == db.selectConvUnit(long_conv_id)
+
+
+def test_page_is_read_from_the_index_without_sorting(db, long_conv_id):
+    plan = ' '.join(row[-1] for row in db.getCursor().execute(
+        'EXPLAIN QUERY PLAN SELECT seq, is_user, conv FROM messages WHERE conv_id=? AND seq<? ORDER BY seq DESC LIMIT ?',
+        (long_conv_id, 10, 10)))
+    assert plan.startswith('SEARCH messages') and 'TEMP B-TREE' not in plan
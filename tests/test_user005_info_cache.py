@@ -0,0 +1,46 @@
+import sqlite3, time
+
+from pyqt_openai.sqlite import SqliteDatabase
+
+
+def _storedTemperature(filename):
+    conn = sqlite3.connect(filename)
+    try:
+        return conn.execute('SELECT temperature FROM info_tb').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_ticks_of_the_spin_box_are_read_back_at_once_and_written_together(tmp_path):
+    filename = str(tmp_path / 'info.db')
+    db = SqliteDatabase(filename)
+    try:
+        for tick in range(1, 10):
+            db.updateInfo(1, 'temperature', tick / 10)
+        assert db.selectInfo(1)['temperature'] == 0.9
+        # the database has the old value until the changes are flushed
+        assert _storedTemperature(filename) == 0.7
+
+        deadline = time.monotonic() + 5
+        while _storedTemperature(filename) != 0.9 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert _storedTemperature(filename) == 0.9
+    finally:
+        db.close()
+
+
+def test_copy_of_the_caller_does_not_change_the_cache(db):
+    info_dict = db.selectInfo(1)
+    info_dict['temperature'] = 2
+    assert db.selectInfo(1)['temperature'] == 0.7
+
+
+def test_pending_changes_are_written_when_the_database_is_closed(tmp_path):
+    filename = str(tmp_path / 'info.db')
+    db = SqliteDatabase(filename)
+    db.updateInfo(1, 'temperature', 0.2)
+    db.close()
+
+    assert _storedTemperature(filename) == 0.2
+    with SqliteDatabase(filename) as reopened:
+        assert reopened.selectInfo(1)['temperature'] == 0.2
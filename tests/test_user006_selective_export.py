@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def three_conv_ids(db):
+    """
+    three conversations of one turn each, about a different animal
+    """
+    id_lst = []
+    for animal in ('cat', 'dog', 'owl'):
+        id = db.insertConv(f'About {animal}').result()
+        db.insertConvUnit(id, 1, f'Tell me about the {animal}')
+        db.insertConvUnit(id, 0, f'The {animal} is an animal')
+        id_lst.append(id)
+    db.flush()
+    return id_lst
+
+
+def test_only_the_selected_conversations_are_copied(db, three_conv_ids, tmp_path):
+    cat_id, dog_id, owl_id = three_conv_ids
+    filename = str(tmp_path / 'selected.db')
+    db.export([cat_id, owl_id], filename)
+
+    conn = sqlite3.connect(filename)
+    try:
+        assert conn.execute('SELECT id, name FROM conv_tb ORDER BY id').fetchall() == [(cat_id, 'About cat'), (owl_id, 'About owl')]
+        assert conn.execute('SELECT DISTINCT conv_id FROM messages ORDER BY conv_id').fetchall() == [(cat_id,), (owl_id,)]
+        assert conn.execute('SELECT conv_id, msg_cnt FROM conv_stats ORDER BY conv_id').fetchall() == [(cat_id, 2), (owl_id, 2)]
+        # the full-text index is rebuilt from the copied units only
+        assert conn.execute("SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH 'dog'").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH 'owl'").fetchone()[0] == 2
+        assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    finally:
+        conn.close()
+
+    # the source is not changed
+    assert len(db.selectAllConv()) == 3
+
+
+def test_existing_file_is_replaced(db, three_conv_ids, tmp_path):
+    filename = tmp_path / 'replaced.db'
+    filename.write_bytes(b'not a database')
+    db.export(three_conv_ids[1:2], str(filename))
+
+    conn = sqlite3.connect(str(filename))
+    assert conn.execute('SELECT name FROM conv_tb').fetchall() == [('About dog',)]
+    conn.close()
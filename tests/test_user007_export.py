@@ -0,0 +1,61 @@
+import gzip, json, sqlite3
+
+import pytest
+
+from pyqt_openai.convExporter import getExportDict
+
+
+@pytest.mark.parametrize('name_filter, ext', [
+    ('SQLite DB file (*.db)', '.db'),
+    ('JSON Lines (*.jsonl)', '.jsonl'),
+    ('JSON Lines, gzip (*.jsonl.gz)', '.jsonl.gz'),
+    ('Markdown (*.md)', '.md'),
+    ('HTML (*.html)', '.html'),
+])
+def test_every_format_is_written_by_the_call_of_the_ui(db, conv_id, tmp_path, name_filter, ext):
+    filename = str(tmp_path / f'export{ext}')
+    progress_lst = []
+    # the same call as WorkerThread(export_dict[name_filter], ids, filename) makes
+    getExportDict(db)[name_filter]([conv_id], filename, progress_callback=lambda done, total: progress_lst.append((done, total)))
+
+    assert progress_lst[-1] == (1, 1)
+    if ext == '.db':
+        conn = sqlite3.connect(filename)
+        assert conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0] == 4
+        conn.close()
+        return
+    opener = gzip.open if ext.endswith('.gz') else open
+    with opener(filename, 'rt', encoding='utf-8') as f:
+        text = f.read()
+    if ext.startswith('.jsonl'):
+        conv = json.loads(text)
+        assert conv['title'] == 'Greeting'
+        assert [message['role'] for message in conv['messages']] == ['user', 'assistant', 'user', 'assistant']
+    elif ext == '.md':
+        assert text.startswith('# Greeting')
+        assert '**Assistant**\n\nBye' in text
+    else:
+        # the content is escaped
+        assert 'Say &lt;b&gt;bye&lt;/b&gt;' in text
+
+
+def test_text_exporters_take_the_arguments_of_the_database_export(db, conv_id, tmp_path):
+    export_dict = getExportDict(db)
+    filename = str(tmp_path / 'by_keyword.jsonl')
+    export_dict['JSON Lines (*.jsonl)'](ids=[conv_id], filename=filename)
+    with open(filename, encoding='utf-8') as f:
+        assert json.loads(f.readline())['id'] == conv_id
+
+
+def test_gzip_filter_compresses_a_name_without_the_extension(db, conv_id, tmp_path):
+    export_dict = getExportDict(db)
+    filename = str(tmp_path / 'typed_without_extension')
+    export_dict['JSON Lines, gzip (*.jsonl.gz)']([conv_id], filename)
+    with gzip.open(filename, 'rt', encoding='utf-8') as f:
+        assert json.loads(f.readline())['id'] == conv_id
+
+    # and the plain one is not compressed by the name
+    filename = str(tmp_path / 'plain.gz')
+    export_dict['JSON Lines (*.jsonl)']([conv_id], filename)
+    with open(filename, encoding='utf-8') as f:
+        assert json.loads(f.readline())['id'] == conv_id
@@ -0,0 +1,86 @@
+import io, json
+
+import pytest
+
+from pyqt_openai.convImporter import ConvImporter, iterJsonArray
+
+
+def _node(id, parent, role, text):
+    return {'id': id, 'parent': parent,
+            'message': {'author': {'role': role}, 'content': {'content_type': 'text', 'parts': [text]}}}
+
+
+def _chatGPTItem(title, create_time=1700000000):
+    """
+    conversation of the ChatGPT export whose first answer was regenerated, 'a2' is the current branch
+    """
+    mapping = {node['id']: node for node in [
+        {'id': 'root', 'parent': None, 'message': None},
+        _node('system', 'root', 'system', 'You are ChatGPT'),
+        _node('q1', 'system', 'user', 'Name a fruit'),
+        _node('a1', 'q1', 'assistant', 'Banana'),
+        _node('a2', 'q1', 'assistant', 'Apple'),
+    ]}
+    return {'title': title, 'create_time': create_time, 'update_time': create_time + 60,
+            'mapping': mapping, 'current_node': 'a2'}
+
+
+@pytest.fixture
+def export_file(tmp_path):
+    """
+    conversations.json of the ChatGPT data export with five conversations and an item which isn't one
+    """
+    filename = tmp_path / 'conversations.json'
+    item_lst = [_chatGPTItem(f'Fruit {i}') for i in range(5)] + ['not a conversation']
+    filename.write_text(json.dumps(item_lst, indent=1), encoding='utf-8')
+    return str(filename)
+
+
+def test_items_are_parsed_one_by_one_even_with_tiny_chunks():
+    data = '\ufeff{"each_conv_lst": [{"title": "été", "conv_data": ["a", "b"]}, [1, [2]] , "]"]}'.encode('utf-8')
+    item_lst = [item for item, _ in iterJsonArray(io.BytesIO(data), chunk_size=3)]
+    assert item_lst == [{'title': 'été', 'conv_data': ['a', 'b']}, [1, [2]], ']']
+
+
+def test_only_the_current_branch_of_the_chatgpt_conversation_is_imported(db, export_file):
+    progress_lst = []
+    assert ConvImporter(db).importFile(export_file, lambda done, total: progress_lst.append(done)) == 5
+    assert progress_lst[-1] == 1000
+
+    conv_lst = db.selectAllConv()
+    assert len(conv_lst) == 5
+    # the system message and the regenerated answer are left out
+    assert db.selectConvUnit(conv_lst[0][0]) == ['Name a fruit', 'Apple']
+
+
+def test_legacy_history_takes_turns_starting_with_the_user(db, tmp_path):
+    filename = tmp_path / 'conv_history.json'
+    filename.write_text(json.dumps({'each_conv_lst': [{'id': 1, 'title': 'Old', 'conv_data': ['Q', 'A', 'Q2']}]}))
+    assert ConvImporter(db).importFile(str(filename)) == 1
+
+    id = db.selectAllConv()[0][0]
+    assert [is_user for seq, is_user, conv in db.selectConvUnitPage(id)] == [1, 0, 1]
+
+
+def test_interrupted_import_resumes_after_the_last_batch(db, export_file, monkeypatch):
+    insert_fn = db.insertConvBatch
+    call_lst = []
+
+    def interruptedInsert(*args, **kwargs):
+        call_lst.append(args[2])
+        if len(call_lst) > 1:
+            raise KeyboardInterrupt
+        return insert_fn(*args, **kwargs)
+
+    monkeypatch.setattr(db, 'insertConvBatch', interruptedInsert)
+    # two conversations (four units) a batch
+    with pytest.raises(KeyboardInterrupt):
+        ConvImporter(db, batch_size=4).importFile(export_file)
+    assert call_lst == [2, 4]
+    assert len(db.selectAllConv()) == 2
+
+    monkeypatch.setattr(db, 'insertConvBatch', insert_fn)
+    assert ConvImporter(db, batch_size=4).importFile(export_file) == 3
+    assert [title for id, title, *_ in db.selectAllConv()] == [f'Fruit {i}' for i in range(5)]
+    # the finished file is not imported again
+    assert ConvImporter(db).importFile(export_file) == 0
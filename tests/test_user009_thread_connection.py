@@ -0,0 +1,55 @@
+import sqlite3, threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pyqt_openai.sqlite import SqliteDatabase
+
+
+def _inThread(fn):
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(fn).result()
+
+
+def test_every_thread_reads_with_its_own_connection(db, conv_id):
+    main_conn = db.getConnection()
+    assert db.getConnection() is main_conn
+
+    conn, again = _inThread(lambda: (db.getConnection(), db.getConnection()))
+    assert conn is again and conn is not main_conn
+
+
+def test_workers_read_concurrently_what_the_writer_wrote(db, conv_id):
+    with ThreadPoolExecutor(4) as executor:
+        unit_lst_lst = list(executor.map(db.selectConvUnit, [conv_id] * 8))
+    assert unit_lst_lst == [['Hello', 'Hi, how can I help?', 'Say <b>bye</b>', 'Bye']] * 8
+
+
+def test_connection_of_the_other_thread_can_not_write(db, conv_id):
+    def write():
+        db.getConnection().execute('DELETE FROM messages')
+
+    with pytest.raises(sqlite3.OperationalError, match='readonly'):
+        _inThread(write)
+    assert len(db.selectConvUnit(conv_id)) == 4
+
+
+def test_connections_of_the_other_threads_are_closed_with_the_database(tmp_path):
+    db = SqliteDatabase(str(tmp_path / 'pool.db'))
+    opened = threading.Event()
+    closed = threading.Event()
+
+    def read():
+        # the thread is still alive when the database is closed
+        conn = db.getConnection()
+        opened.set()
+        closed.wait(5)
+        conn.execute('SELECT 1')
+
+    with ThreadPoolExecutor(1) as executor:
+        future = executor.submit(read)
+        assert opened.wait(5)
+        db.close()
+        closed.set()
+        with pytest.raises(sqlite3.ProgrammingError):
+            future.result()
@@ -0,0 +1,63 @@
+import pytest
+
+from pyqt_openai.convCodec import ConvCodec
+from pyqt_openai.sqlite import SqliteDatabase
+
+
+LONG_TEXT = 'The quick brown fox jumps over the lazy dog. ' * 40
+
+
+def test_long_units_are_compressed_and_the_short_ones_are_kept_as_they_are():
+    codec = ConvCodec(ConvCodec.ZLIB, threshold=64)
+    value = codec.encode(LONG_TEXT)
+    assert isinstance(value, bytes) and value[:1] == b'z' and len(value) < len(LONG_TEXT)
+    assert codec.decode(value) == LONG_TEXT
+    assert codec.encode('short') == 'short'
+    # doesn't get smaller
+    distinct_text = ''.join(chr(0x4e00 + i * 7) for i in range(20))
+    assert ConvCodec(ConvCodec.ZLIB, threshold=16).encode(distinct_text) == distinct_text
+
+
+def test_every_format_is_decoded_whatever_the_current_codec_is():
+    value = ConvCodec(ConvCodec.ZLIB, threshold=64).encode(LONG_TEXT)
+    plain = ConvCodec(None)
+    assert plain.getHeader() is None
+    assert plain.encode(LONG_TEXT) == LONG_TEXT
+    assert plain.decode(value) == LONG_TEXT
+    assert plain.decode(None) is None
+
+
+def test_zstd_with_a_trained_dictionary():
+    pytest.importorskip('zstandard')
+    codec = ConvCodec(ConvCodec.ZSTD, threshold=64)
+    sample_lst = [f'Question {i}: how do I configure the {i}th proxy of the cluster? ' * 3 for i in range(2000)]
+    dict_data = codec.trainDictionary(sample_lst, dict_size=4096)
+    assert dict_data
+    codec.addDictionary(7, dict_data)
+    value = codec.encode(sample_lst[0])
+    assert value[:5] == codec.getHeader() == b'd\x00\x00\x00\x07'
+    # another codec needs the dictionary to read it
+    reader = ConvCodec(ConvCodec.ZLIB)
+    reader.addDictionary(7, dict_data, current=False)
+    assert reader.decode(value) == sample_lst[0]
+
+
+def test_units_stored_before_are_recompressed_in_the_background(tmp_path):
+    filename = str(tmp_path / 'conv.db')
+    db = SqliteDatabase(filename, codec=None)
+    conv_id = db.insertConv('stored plain').result()
+    db.insertConvUnit(conv_id, 0, LONG_TEXT)
+    db.insertConvUnit(conv_id, 1, 'short one')
+    db.close()
+
+    db = SqliteDatabase(filename, codec='zlib', compress_threshold=64)
+    try:
+        assert db.recompressConvUnit(batch_size=1) == 1
+        conn = db.getConnection()
+        assert [typeof for typeof, in conn.execute('SELECT typeof(conv) FROM messages ORDER BY seq')] == ['blob', 'text']
+        assert [conv for seq, is_user, conv in db.selectConvUnitPage(conv_id)] == [LONG_TEXT, 'short one']
+        assert [id for id, snippet in db.searchConv('lazy')] == [conv_id]
+        # nothing is left to do
+        assert db.recompressConvUnit() == 0
+    finally:
+        db.close()
@@ -0,0 +1,59 @@
+import sqlite3
+
+from pyqt_openai.sqlite import SqliteDatabase
+
+
+def _insertAndSearch(filename, conv_id):
+    """
+    write and search the units with a plain sqlite3 connection, which doesn't have decode_conv
+    """
+    conn = sqlite3.connect(filename)
+    with conn:
+        conn.execute('INSERT INTO messages (conv_id, seq, is_user, conv) VALUES (?, 100, 1, ?)', (conv_id, 'plain marmalade'))
+        conn.execute("UPDATE messages SET conv = 'plain marmot' WHERE conv_id = ? AND seq = 100", (conv_id,))
+    found = conn.execute("SELECT rowid FROM messages_fts WHERE messages_fts MATCH 'marmot'").fetchall()
+    conn.close()
+    return found
+
+
+def test_uncompressed_database_is_writable_without_the_udf(tmp_path):
+    filename = str(tmp_path / 'plain.db')
+    db = SqliteDatabase(filename, codec=None)
+    conv_id = db.insertConv('plain').result()
+    db.close()
+
+    assert len(_insertAndSearch(filename, conv_id)) == 1
+
+
+def test_compressed_units_are_exported_decoded_into_a_plain_database(tmp_path):
+    db = SqliteDatabase(str(tmp_path / 'zlib.db'), codec='zlib', compress_threshold=16)
+    conv_id = db.insertConv('compressed').result()
+    long_text = 'the quick brown fox ' * 50
+    db.insertConvUnit(conv_id, 0, long_text)
+    db.flush()
+    # stored compressed, searched through decode_conv
+    assert db.getConnection().execute('SELECT typeof(conv) FROM messages').fetchone()[0] == 'blob'
+    assert [id for id, snippet in db.searchConv('quick')] == [conv_id]
+
+    filename = str(tmp_path / 'export.db')
+    db.export([conv_id], filename)
+    db.close()
+
+    conn = sqlite3.connect(filename)
+    assert conn.execute('SELECT conv FROM messages').fetchone()[0] == long_text
+    assert 'decode_conv' not in ''.join(sql for sql, in conn.execute('SELECT sql FROM sqlite_master WHERE sql IS NOT NULL'))
+    conn.close()
+    assert len(_insertAndSearch(filename, conv_id)) == 1
+
+
+def test_schema_becomes_plain_when_no_compressed_unit_is_left(tmp_path):
+    filename = str(tmp_path / 'switch.db')
+    db = SqliteDatabase(filename, codec='zlib')
+    db.insertConv('short units are not compressed').result()
+    db.close()
+
+    db = SqliteDatabase(filename, codec=None)
+    db.close()
+    conn = sqlite3.connect(filename)
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE sql LIKE '%decode_conv%'").fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,30 @@
+import sqlite3
+
+import pytest
+
+
+def test_archived_conversation_is_restored_when_it_is_continued(db, conv_id):
+    conn = sqlite3.connect(db.getDbFilename())
+    with conn:
+        conn.execute("UPDATE conv_tb SET update_dt = datetime('now', '-200 days')")
+    conn.close()
+    assert db.archiveConv(90) == 1
+    assert db.isConvArchived(conv_id)
+    assert db.getConnection().execute('SELECT COUNT(*) FROM main.messages').fetchone()[0] == 0
+    # still readable from the archive
+    assert [row[2] for row in db.selectConvUnitAfter(conv_id)][-1] == 'Bye'
+
+    db.insertConvUnit(conv_id, 1, 'Hello again').result()
+    assert not db.isConvArchived(conv_id)
+    assert [row[2] for row in db.selectConvUnitAfter(conv_id, 4)] == ['Hello again']
+    # the copies left in the archive are removed by the cleaning
+    assert db.cleanOrphan() == 4
+    assert db.getConnection().execute('SELECT COUNT(*) FROM archive.messages').fetchone()[0] == 0
+
+
+def test_unit_of_a_deleted_conversation_fails_on_its_foreign_key(db, conv_id):
+    db.deleteConv(conv_id)
+    with pytest.raises(sqlite3.IntegrityError):
+        db.insertConvUnit(conv_id, 0, 'a reply which came after the deletion').result()
+    # the writer goes on
+    assert db.insertConv('next').result()
@@ -0,0 +1,71 @@
+import sqlite3
+
+from pyqt_openai.sqlite import SqliteDatabase
+
+
+def _schema(filename):
+    conn = sqlite3.connect(filename)
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    sql_lst = sorted(sql for sql, in conn.execute('SELECT sql FROM sqlite_master WHERE sql IS NOT NULL'))
+    conn.close()
+    return version, sql_lst
+
+
+def test_up_to_date_database_is_opened_without_schema_work(tmp_path, monkeypatch):
+    filename = str(tmp_path / 'conv.db')
+    SqliteDatabase(filename).close()
+    version, sql_lst = _schema(filename)
+    assert version > 0
+
+    # every statement of every connection which is opened from here on
+    statement_lst = []
+    connect_fn = sqlite3.connect
+
+    def connect(*args, **kwargs):
+        conn = connect_fn(*args, **kwargs)
+        conn.set_trace_callback(statement_lst.append)
+        return conn
+
+    monkeypatch.setattr(sqlite3, 'connect', connect)
+    SqliteDatabase(filename).close()
+    monkeypatch.undo()
+    assert statement_lst
+    assert _schema(filename) == (version, sql_lst)
+    assert not any(statement.lstrip().upper().startswith(('CREATE', 'ALTER', 'DROP')) for statement in statement_lst)
+
+
+def test_database_of_the_newer_version_is_left_as_it_is(tmp_path):
+    filename = str(tmp_path / 'conv.db')
+    SqliteDatabase(filename).close()
+    version, sql_lst = _schema(filename)
+    conn = sqlite3.connect(filename)
+    conn.execute(f'PRAGMA user_version = {version + 5}')
+    conn.execute('DROP TABLE import_tb')
+    conn.close()
+
+    SqliteDatabase(filename).close()
+    new_version, new_sql_lst = _schema(filename)
+    assert new_version == version + 5
+    assert len(new_sql_lst) == len(sql_lst) - 1
+
+
+def test_steps_of_an_unversioned_database_are_applied_once(tmp_path):
+    filename = str(tmp_path / 'conv.db')
+    # made before the versioning, some of the tables are there already
+    conn = sqlite3.connect(filename)
+    conn.execute('''CREATE TABLE conv_tb (id INTEGER PRIMARY KEY, name TEXT,
+                    update_dt DATETIME DEFAULT CURRENT_TIMESTAMP, insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    conn.execute("INSERT INTO conv_tb (name) VALUES ('old')")
+    conn.commit()
+    conn.close()
+
+    db = SqliteDatabase(filename)
+    try:
+        conv_id = db.selectConvIds()[0]
+        db.insertConvUnit(conv_id, 1, 'still works').result()
+        assert db.selectConvStats(conv_id)[4] == 1
+    finally:
+        db.close()
+    # the same version as a new database
+    SqliteDatabase(str(tmp_path / 'fresh.db')).close()
+    assert _schema(filename)[0] == _schema(str(tmp_path / 'fresh.db'))[0]
@@ -0,0 +1,45 @@
+import os, subprocess, sys
+
+import pytest
+
+from pyqt_openai import sqlite
+from pyqt_openai.sqlite import getDatabase, closeDatabase
+
+
+@pytest.fixture
+def data_home(tmp_path, monkeypatch):
+    """
+    empty working and data directory, the shared database is closed after the test
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path))
+    yield tmp_path
+    closeDatabase()
+
+
+def test_importing_the_module_opens_nothing(data_home):
+    source_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', 'import pyqt_openai.sqlite'], check=True,
+                   env={**os.environ, 'PYTHONPATH': source_dir})
+    assert os.listdir(data_home) == []
+
+
+def test_database_is_opened_on_the_first_call_in_the_data_directory(data_home):
+    assert sqlite._db is None
+    db = getDatabase()
+    assert db.getDbFilename() == os.path.join(str(data_home), 'pyqt_openai', 'conv.db')
+    assert getDatabase() is db
+    # the arguments can't change the opened one
+    with pytest.raises(RuntimeError):
+        getDatabase(db_filename=str(data_home / 'other.db'))
+
+
+def test_closed_database_is_opened_again_by_the_next_call(data_home):
+    db = getDatabase(db_filename=str(data_home / 'first.db'))
+    db.insertConv('kept').result()
+    closeDatabase()
+    closeDatabase()
+
+    reopened = getDatabase(db_filename=str(data_home / 'first.db'))
+    assert reopened is not db
+    assert [name for id, name, *_ in reopened.selectAllConv()] == ['kept']
@@ -0,0 +1,27 @@
+import pytest
+
+from pyqt_openai.apiData import getModelCost
+from pyqt_openai.contextBuilder import ContextBuilder
+from pyqt_openai.tokenizer import getTokenizer
+
+
+def test_prompt_is_billed_for_every_message_which_is_sent(db, conv_id):
+    builder = ContextBuilder(db)
+    messages = builder.build(conv_id, 'gpt-4', 'Be brief.', 'And now?')
+    tokenizer = getTokenizer('gpt-4')
+    prompt_cnt = builder.countMessages(messages, 'gpt-4')
+    # the system message and the previous turns, not only the new prompt
+    assert len(messages) == 6
+    assert prompt_cnt == sum(tokenizer.count(message['content']) for message in messages) + 6 * ContextBuilder.MESSAGE_TOKEN_CNT
+    assert prompt_cnt > tokenizer.count('And now?')
+
+
+def test_stats_sum_the_tokens_and_the_cost_of_each_model(db):
+    conv_id = db.insertConv('two models').result()
+    db.insertConvUnit(conv_id, 1, 'Hi', model='gpt-4', token_cnt=1, cost=getModelCost('gpt-4', 50, True))
+    db.insertConvUnit(conv_id, 0, 'Hello', model='gpt-4', token_cnt=2, cost=getModelCost('gpt-4', 2, False))
+    db.insertConvUnit(conv_id, 1, 'Bye', model='gpt-3.5-turbo', token_cnt=1, cost=getModelCost('gpt-3.5-turbo', 60, True)).result()
+    msg_cnt, token_cnt, cost, model = db.selectConvStats(conv_id)[4:]
+    assert (msg_cnt, token_cnt, model) == (3, 4, 'gpt-3.5-turbo')
+    assert cost == pytest.approx(getModelCost('gpt-4', 50, True) + getModelCost('gpt-4', 2, False)
+                                 + getModelCost('gpt-3.5-turbo', 60, True))
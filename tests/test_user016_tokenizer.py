@@ -0,0 +1,68 @@
+import base64
+
+import pytest
+
+from pyqt_openai import tokenizer
+from pyqt_openai.apiData import getModelCost
+from pyqt_openai.tokenizer import Tokenizer, countExact
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    """
+    no tiktoken and an empty data directory, as on a machine which can't download the encodings
+    """
+    monkeypatch.setattr(tokenizer, 'tiktoken', None)
+    monkeypatch.setattr(tokenizer, '_tokenizer_dict', {})
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path / 'data'))
+    return tmp_path / 'data' / 'pyqt_openai'
+
+
+def _writeRanks(data_dir):
+    """
+    tiny cl100k_base ranks: every byte, and the merges of 'hello'
+    """
+    token_lst = [bytes([i]) for i in range(256)] + [b'he', b'll', b'hell', b'hello']
+    data_dir.mkdir(parents=True, exist_ok=True)
+    with open(data_dir / 'cl100k_base.tiktoken', 'wb') as f:
+        for rank, token in enumerate(token_lst):
+            f.write(base64.b64encode(token) + b' ' + str(rank).encode() + b'\n')
+
+
+def test_count_is_estimated_without_an_encoding(offline):
+    t = Tokenizer('cl100k_base')
+    assert t.getBackend() == Tokenizer.ESTIMATE and not t.isExact()
+    assert t.count('a' * 40) == 10
+    assert countExact('gpt-4', ['hello']) is None
+
+
+def test_ranks_file_gives_exact_counts(offline):
+    _writeRanks(offline)
+    t = Tokenizer('cl100k_base')
+    assert t.getBackend() == Tokenizer.BPE and t.isExact()
+    assert t.encode('hello') == [259]
+    assert countExact('gpt-4', ['hello', 'hello hello', '']) == [1, 3, 0]
+
+
+def test_estimated_units_are_recounted_once_the_exact_tokenizer_is_there(db, offline):
+    conv_id = db.insertConv('estimated').result()
+    text = 'hello hello hello hello hello'
+    estimate = Tokenizer('cl100k_base').count(text)
+    db.insertConvUnit(conv_id, 0, text, model='gpt-4', token_cnt=estimate,
+                      cost=getModelCost('gpt-4', estimate, False), token_exact=False)
+    db.flush()
+    # not trusted for the context, the builder counts it again
+    assert db.selectConvUnitAfter(conv_id)[0][3] is None
+    # nothing to do while the tokenizer still estimates
+    assert db.recountConvUnit(countExact, getModelCost) == 0
+
+    _writeRanks(offline)
+    tokenizer._tokenizer_dict.clear()
+    assert db.recountConvUnit(countExact, getModelCost) == 1
+    db.flush()
+
+    assert db.selectConvUnitAfter(conv_id)[0][3] == 9
+    msg_cnt, token_cnt, cost = db.selectConvStats(conv_id)[4:7]
+    assert (msg_cnt, token_cnt) == (1, 9)
+    assert cost == pytest.approx(getModelCost('gpt-4', 9, False))
+    assert db.recountConvUnit(countExact, getModelCost) == 0
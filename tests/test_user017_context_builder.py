@@ -0,0 +1,84 @@
+from pyqt_openai.contextBuilder import ContextBuilder, TRUNCATED_MARK, isContextUnit
+
+
+def _insertTurns(db, cnt, words=20):
+    """
+    conversation of ``cnt`` user/assistant pairs, every unit is about ``words`` tokens
+    """
+    conv_id = db.insertConv('long').result()
+    for i in range(cnt):
+        db.insertConvUnit(conv_id, 1, f'question {i} ' + 'word ' * words)
+        db.insertConvUnit(conv_id, 0, f'answer {i} ' + 'word ' * words)
+    db.flush()
+    return conv_id
+
+
+def _recordReads(db, monkeypatch):
+    read_lst = []
+    select_fn = db.selectConvUnitAfter
+
+    def selectConvUnitAfter(*args, **kwargs):
+        row_lst = select_fn(*args, **kwargs)
+        read_lst.append(len(row_lst))
+        return row_lst
+
+    monkeypatch.setattr(db, 'selectConvUnitAfter', selectConvUnitAfter)
+    return read_lst
+
+
+def test_units_which_are_not_turns_are_not_sent():
+    assert isContextUnit(1, '<p style="color:red">user text is sent as it is</p>')
+    assert not isContextUnit(0, '<p style="color:red">Rate limit reached</p>')
+    assert not isContextUnit(0, 'https://images.example.com/a.png?sig=1')
+    assert not isContextUnit(0, 'It was cut' + TRUNCATED_MARK)
+    assert isContextUnit(0, 'See https://example.com for the details.')
+
+
+def test_failures_images_and_stopped_replies_are_left_out(db, conv_id):
+    db.insertConvUnit(conv_id, 1, 'Draw a cat')
+    db.insertConvUnit(conv_id, 0, 'https://images.example.com/cat.png')
+    db.insertConvUnit(conv_id, 1, 'Tell me a story')
+    db.insertConvUnit(conv_id, 0, 'Once upon' + TRUNCATED_MARK)
+    db.insertConvUnit(conv_id, 1, 'Again')
+    db.insertConvUnit(conv_id, 0, '<p style="color:red">The server had an error</p>')
+    db.flush()
+    messages = ContextBuilder(db).build(conv_id, 'gpt-4', prompt='Thanks')
+    assert [message['content'] for message in messages][-5:] == ['Bye', 'Draw a cat', 'Tell me a story', 'Again', 'Thanks']
+
+
+def test_long_conversation_is_read_from_the_newest_until_the_budget(db, monkeypatch):
+    conv_id = _insertTurns(db, 250)
+    read_lst = _recordReads(db, monkeypatch)
+    builder = ContextBuilder(db, page_size=20)
+    # gpt-4 takes about 6000 tokens of the previous turns, 250 of them
+    messages = builder.build(conv_id, 'gpt-4', prompt='next')
+    assert messages[-2]['content'].startswith('answer 249 ')
+    assert 100 < len(messages) < 500
+    assert sum(read_lst) < 500
+
+    # the next turn only reads what is added
+    read_lst.clear()
+    db.insertConvUnit(conv_id, 1, 'next')
+    db.insertConvUnit(conv_id, 0, 'reply')
+    db.flush()
+    messages = builder.build(conv_id, 'gpt-4', prompt='and then')
+    assert read_lst == [2]
+    assert [message['content'] for message in messages][-3:] == ['next', 'reply', 'and then']
+
+
+def test_bigger_budget_reads_the_older_pages_in_order(db):
+    conv_id = _insertTurns(db, 80)
+    builder = ContextBuilder(db, page_size=16)
+    small = builder.build(conv_id, 'gpt-3.5-turbo', prompt='next')
+    large = builder.build(conv_id, 'gpt-4', prompt='next')
+    assert len(small) < len(large) == 161
+    # every turn once, oldest first
+    assert [message['content'].split()[1] for message in large[:-1]] == [str(i // 2) for i in range(160)]
+
+
+def test_only_the_units_after_the_summary_are_read(db):
+    conv_id = _insertTurns(db, 10)
+    db.insertConvSummary(conv_id, 16, 'They asked eight questions.').result()
+    messages = ContextBuilder(db).build(conv_id, 'gpt-4', 'Be brief.', 'next')
+    assert messages[1]['content'].endswith('They asked eight questions.')
+    assert [message['content'].split()[1] for message in messages[2:-1]] == ['8', '8', '9', '9']
@@ -0,0 +1,96 @@
+import asyncio, configparser, os
+
+import openai
+import pytest
+
+from pyqt_openai import httpClient
+from pyqt_openai.httpClient import closeHttpClient, getHttpClient, getSettingsArgs
+
+
+INI_FILENAME = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pyqt_openai', 'pyqt_openai.ini')
+
+
+@pytest.fixture
+def client_closed():
+    """
+    no shared client before the test, the one made in it is closed after it
+    """
+    closeHttpClient()
+    yield
+    closeHttpClient()
+
+
+def _readIni(filename):
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    parser.read(filename)
+    return parser['General']
+
+
+def test_shipped_ini_has_the_defaults_of_the_client():
+    assert getSettingsArgs(_readIni(INI_FILENAME).get) == {'pool_maxsize': 16, 'read_timeout': 600}
+
+
+def test_pool_size_and_timeout_of_both_sessions_come_from_the_ini(client_closed, tmp_path):
+    filename = tmp_path / 'pyqt_openai.ini'
+    filename.write_text('[General]\nHTTP_POOL_SIZE=3\nHTTP_TIMEOUT=42\n')
+    # as the main window makes it
+    client = getHttpClient(**getSettingsArgs(_readIni(str(filename)).get))
+
+    assert client.getSession().get_adapter('https://api.openai.com')._pool_maxsize == 3
+    assert client.getTimeout()[1] == 42
+
+    async def run():
+        session = client.getAsyncSession(asyncio.get_running_loop())
+        try:
+            return session.connector.limit_per_host, session.timeout.sock_read
+        finally:
+            await client.closeAsyncSession(asyncio.get_running_loop())
+
+    assert asyncio.run(run()) == (3, 42)
+
+
+def test_unset_values_leave_the_defaults():
+    assert getSettingsArgs({'HTTP_POOL_SIZE': ''}.get) == {}
+
+
+def test_one_session_is_shared_with_openai_and_one_aiohttp_session_is_made_for_each_loop(client_closed):
+    client = getHttpClient()
+    assert openai.requestssession is client.getSession()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        session = client.getAsyncSession(loop)
+        try:
+            assert client.getAsyncSession(loop) is session
+            assert openai.aiosession.get() is session
+            return session
+        finally:
+            await client.closeAsyncSession(loop)
+
+    first = asyncio.run(run())
+    second = asyncio.run(run())
+    assert first is not second
+
+
+def test_closing_releases_both_sessions(client_closed):
+    client = getHttpClient()
+    session = client.getSession()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        async_session = client.getAsyncSession(loop)
+        await client.closeAsyncSession(loop)
+        # made again after it is closed
+        reopened = client.getAsyncSession(loop)
+        await client.closeAsyncSession(loop)
+        return async_session, reopened
+
+    async_session, reopened = asyncio.run(run())
+    assert async_session.closed and reopened.closed and reopened is not async_session
+
+    closeHttpClient()
+    assert openai.requestssession is None
+    assert not session.adapters['https://'].poolmanager.pools
+    assert httpClient._client is None
+    assert getHttpClient() is not client
@@ -0,0 +1,65 @@
+import asyncio, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+
+from pyqt_openai.httpClient import getHttpClient
+from pyqt_openai.requestEngine import RequestEngine
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, every request of the connection is handled by the same instance
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connection_cnt += 1
+
+    def __reply(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(401)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self.__reply(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.connection_cnt = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_first_request_of_the_engine_reuses_the_warmed_connection(server, monkeypatch):
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    async def acreate(**kwargs):
+        # in the event loop of the engine, through its session as openai does
+        async with getHttpClient().getAsyncSession(asyncio.get_running_loop()).get(url) as response:
+            return {'choices': [{'message': {'content': await response.text()}}]}
+
+    monkeypatch.setattr(openai.ChatCompletion, 'acreate', acreate)
+    engine = RequestEngine(frame_interval=0)
+    engine.start()
+    try:
+        engine.warmup(url).result(5)
+        assert server.connection_cnt == 1
+        handle = engine.submit(1, 'gpt-4', {'model': 'gpt-4', 'messages': [{'role': 'user', 'content': 'hi'}]})
+        assert handle.result(5) == 'ok'
+    finally:
+        engine.stop()
+    assert server.connection_cnt == 1
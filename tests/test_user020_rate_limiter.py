@@ -0,0 +1,163 @@
+import asyncio
+
+import openai
+import pytest
+
+from pyqt_openai import rateLimiter
+from pyqt_openai.rateLimiter import RateLimiter, TokenBucket, parseResetTime
+
+
+class _Clock:
+    """
+    monotonic clock of the rate limiter which only moves when somebody sleeps
+    """
+    def __init__(self):
+        self.now = 1000.0
+        self.sleep_lst = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, sec):
+        self.sleep_lst.append(sec)
+        self.now += sec
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rateLimiter.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(rateLimiter.time, 'sleep', clock.sleep)
+    return clock
+
+
+def _headers(limit, remaining, reset, model=None):
+    headers = {'x-ratelimit-limit-requests': str(limit), 'x-ratelimit-remaining-requests': str(remaining),
+               'x-ratelimit-reset-requests': reset}
+    if model:
+        headers['openai-model'] = model
+    return headers
+
+
+def test_reset_time_headers_are_read_as_seconds():
+    assert parseResetTime('6m0s') == 360
+    assert parseResetTime('1h2m3.5s') == 3723.5
+    assert parseResetTime('20ms') == pytest.approx(0.02)
+    assert parseResetTime(None) == 0
+
+
+def test_bucket_is_refilled_with_its_capacity_per_minute(clock):
+    bucket = TokenBucket(60)
+    assert bucket.getWaitTime(60) == 0
+    bucket.take(60)
+    assert bucket.getWaitTime(1) == pytest.approx(1)
+    clock.now += 0.5
+    assert bucket.getWaitTime(1) == pytest.approx(0.5)
+    # more than the capacity waits for the full bucket, not forever
+    assert bucket.getWaitTime(1000) == pytest.approx(59.5)
+
+
+def test_headers_of_the_versioned_model_correct_the_buckets_of_the_requested_name(clock):
+    limiter = RateLimiter()
+    limiter.acquireSync('gpt-3.5-turbo')
+    assert not clock.sleep_lst
+
+    # nothing is left, and the server refills the 3500 requests in 2 seconds
+    limiter.updateFromHeaders(_headers(3500, 0, '2s', model='gpt-3.5-turbo-0613'))
+    limiter.acquireSync('gpt-3.5-turbo')
+    assert sum(clock.sleep_lst) == pytest.approx(2 / 3500)
+
+
+def test_headers_of_an_unknown_model_are_ignored(clock):
+    limiter = RateLimiter()
+    limiter.updateFromHeaders(_headers(1, 0, '1m', model='gpt-4-0613'))
+    limiter.updateFromHeaders({'content-type': 'application/json'}, 'gpt-4')
+    limiter.acquireSync('gpt-4')
+    assert not clock.sleep_lst
+
+
+def test_interactive_request_goes_before_the_batch_one_waiting_longer():
+    limiter = RateLimiter(poll_interval=0.005)
+    order_lst = []
+
+    async def request(name, priority):
+        await limiter.acquire('model', priority=priority)
+        order_lst.append(name)
+
+    async def main():
+        # empty bucket, one request every 20ms
+        limiter.updateFromHeaders(_headers(3, 0, '60ms'), 'model')
+        batch = asyncio.create_task(request('batch', RateLimiter.BATCH))
+        await asyncio.sleep(0)
+        await request('interactive', RateLimiter.INTERACTIVE)
+        await batch
+
+    asyncio.run(main())
+    assert order_lst == ['interactive', 'batch']
+
+
+def test_cancelled_request_leaves_the_queue():
+    limiter = RateLimiter(poll_interval=0.005)
+
+    async def main():
+        limiter.updateFromHeaders(_headers(3, 0, '60ms'), 'model')
+        first = asyncio.create_task(limiter.acquire('model', priority=RateLimiter.INTERACTIVE))
+        await asyncio.sleep(0)
+        first.cancel()
+        # the batch request is not stuck behind the ticket of the cancelled one
+        await asyncio.wait_for(limiter.acquire('model', priority=RateLimiter.BATCH), 1)
+
+    asyncio.run(main())
+
+
+def test_rate_limit_errors_are_retried_after_the_time_the_server_asks(clock):
+    limiter = RateLimiter(max_retries=3)
+    attempt_lst = []
+
+    def fn():
+        attempt_lst.append(len(attempt_lst))
+        if len(attempt_lst) < 3:
+            raise openai.error.RateLimitError('slow down', headers={'retry-after': '1.5'})
+        return 'answer'
+
+    assert limiter.call(fn, 'gpt-4') == 'answer'
+    assert attempt_lst == [0, 1, 2]
+    assert clock.sleep_lst == [1.5, 1.5]
+
+
+def test_retries_give_up_after_the_max_and_other_errors_are_not_retried(clock):
+    limiter = RateLimiter(max_retries=2, base_delay=1, max_delay=3)
+    attempt_lst = []
+
+    def overloaded():
+        attempt_lst.append(None)
+        raise openai.error.ServiceUnavailableError('overloaded')
+
+    with pytest.raises(openai.error.ServiceUnavailableError):
+        limiter.call(overloaded, 'gpt-4')
+    assert len(attempt_lst) == 3
+    # full jitter under the exponential backoff, which is capped
+    assert [0 <= sec <= limit for sec, limit in zip(clock.sleep_lst, [1, 2])] == [True, True]
+
+    def invalid():
+        attempt_lst.append(None)
+        raise openai.error.InvalidRequestError('bad request', 'messages')
+
+    attempt_lst.clear()
+    with pytest.raises(openai.error.InvalidRequestError):
+        limiter.call(invalid, 'gpt-4')
+    assert len(attempt_lst) == 1
+
+
+def test_coroutines_are_retried_in_the_event_loop():
+    limiter = RateLimiter(base_delay=0.001)
+    attempt_lst = []
+
+    async def coro_fn():
+        attempt_lst.append(None)
+        if len(attempt_lst) == 1:
+            raise openai.error.TryAgain('try again')
+        return 'answer'
+
+    assert asyncio.run(limiter.run(coro_fn, 'gpt-4')) == 'answer'
+    assert len(attempt_lst) == 2
@@ -0,0 +1,94 @@
+import threading
+
+import openai
+
+from pyqt_openai.requestEngine import RequestEngine, RequestListener
+from pyqt_openai.responseCache import ResponseCache
+
+
+ENDPOINT = '/v1/chat/completions'
+
+
+def _chatArg(content, **kwargs):
+    return {'model': 'gpt-4', 'messages': [{'role': 'user', 'content': content}], **kwargs}
+
+
+def test_key_depends_on_what_changes_the_reply(db):
+    cache = ResponseCache(db)
+    key = cache.getKey(ENDPOINT, _chatArg('hi', temperature=0))
+    # streaming or not is the same reply
+    assert cache.getKey(ENDPOINT, _chatArg('hi', temperature=0, stream=True)) == key
+    assert cache.getKey(ENDPOINT, _chatArg('hi', temperature=0.5)) != key
+    assert cache.getKey(ENDPOINT, _chatArg('hello', temperature=0)) != key
+    assert cache.getKey('/v1/completions', _chatArg('hi', temperature=0)) != key
+
+
+def test_chat_without_temperature_is_cached_only_with_the_opt_in(db):
+    assert not ResponseCache(db).isCacheable(_chatArg('hi'))
+    assert ResponseCache(db, always_f=True).isCacheable(_chatArg('hi'))
+
+
+def test_only_deterministic_single_replies_are_cached_unless_opted_in(db):
+    cache = ResponseCache(db)
+    cache.put(ENDPOINT, _chatArg('hi', temperature=0.7), 'random')
+    cache.put(ENDPOINT, _chatArg('hi', temperature=0, n=2), 'two of them')
+    cache.put(ENDPOINT, _chatArg('hi', temperature=0), 'Hello!')
+    db.flush()
+    assert cache.get(ENDPOINT, _chatArg('hi', temperature=0)) == 'Hello!'
+    assert cache.get(ENDPOINT, _chatArg('hi', temperature=0.7)) is None
+
+    always_cache = ResponseCache(db, always_f=True)
+    always_cache.put(ENDPOINT, _chatArg('hi', temperature=0.7), 'random')
+    db.flush()
+    assert always_cache.get(ENDPOINT, _chatArg('hi', temperature=0.7)) == 'random'
+
+
+def test_replies_over_the_size_are_evicted(db):
+    cache = ResponseCache(db, max_bytes=250, evict_interval=100)
+    for i in range(5):
+        cache.put(ENDPOINT, _chatArg(f'question {i}', temperature=0), str(i) * 100)
+    db.flush()
+    assert db.evictResponseCache(250, 30).result() == 3
+    assert db.getConnection().execute('SELECT COUNT(*), SUM(size) FROM response_cache_tb').fetchone() == (2, 200)
+
+
+class _Listener(RequestListener):
+    def __init__(self):
+        self.reply_lst = []
+        self.done = threading.Event()
+
+    def onReply(self, handle, text, image_f):
+        self.reply_lst.append(text)
+
+    def onDone(self, handle):
+        self.done.set()
+
+
+def test_cached_reply_is_replayed_without_blocking_the_loop(db, monkeypatch):
+    cache = ResponseCache(db)
+    cache.put(ENDPOINT, _chatArg('hi', temperature=0), 'Hello from the cache')
+    db.flush()
+
+    async def acreate(**kwargs):
+        raise AssertionError('the API is called for the cached reply')
+
+    monkeypatch.setattr(openai.ChatCompletion, 'acreate', acreate)
+    thread_lst = []
+    get_fn = cache.get
+
+    def get(endpoint, openai_arg):
+        thread_lst.append(threading.current_thread().name)
+        return get_fn(endpoint, openai_arg)
+
+    monkeypatch.setattr(cache, 'get', get)
+    listener = _Listener()
+    engine = RequestEngine(listener, response_cache=cache, frame_interval=0)
+    engine.start()
+    try:
+        handle = engine.submit(1, 'gpt-4', _chatArg('hi', temperature=0))
+        assert listener.done.wait(5)
+    finally:
+        engine.stop()
+    assert handle.result(1) == 'Hello from the cache'
+    assert listener.reply_lst == ['Hello from the cache']
+    assert thread_lst and 'RequestEngine' not in thread_lst
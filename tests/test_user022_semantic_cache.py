@@ -0,0 +1,166 @@
+import asyncio, re, threading, zlib
+
+import numpy as np
+import openai
+import pytest
+
+from pyqt_openai.requestEngine import RequestEngine, RequestListener
+from pyqt_openai.semanticCache import SemanticCache, VectorIndex
+
+
+def _embedding(text):
+    """
+    one-hot vector of the words of the text, so the prompts which differ only in case and punctuation are the same
+    """
+    vector = [0.0] * 1536
+    for word in re.findall(r'\w+', text.lower()):
+        vector[zlib.crc32(word.encode()) % 1536] += 1
+    return vector
+
+
+@pytest.fixture
+def embedding_call_lst(monkeypatch):
+    call_lst = []
+
+    async def acreate(input, model):
+        call_lst.append(list(input))
+        return {'data': [{'index': i, 'embedding': _embedding(text)} for i, text in enumerate(input)]}
+
+    monkeypatch.setattr(openai.Embedding, 'acreate', acreate)
+    return call_lst
+
+
+def _messages(prompt, system='Be brief.'):
+    return [{'role': 'system', 'content': system}, {'role': 'user', 'content': prompt}]
+
+
+def test_index_returns_the_nearest_rows_first(tmp_path):
+    index = VectorIndex(str(tmp_path / 'index.f32'), 4, chunk_rows=2)
+    index.append(np.eye(4, dtype=np.float32))
+    assert len(index) == 4
+    nearest_lst = index.search(np.array([0, 0.6, 0.8, 0], dtype=np.float32), k=2)
+    assert [row for row, sim in nearest_lst] == [2, 1]
+    assert nearest_lst[0][1] == pytest.approx(0.8)
+    index.truncate(1)
+    assert len(index) == 1
+
+
+def test_similar_prompt_gets_the_reply_read_outside_of_the_loop(db, embedding_call_lst, monkeypatch):
+    cache = SemanticCache(db, SemanticCache.SERVE, threshold=0.99)
+    thread_lst = []
+    select_fn = db.selectSemanticCache
+
+    def selectSemanticCache(ids):
+        thread_lst.append(threading.current_thread())
+        return select_fn(ids)
+
+    monkeypatch.setattr(db, 'selectSemanticCache', selectSemanticCache)
+
+    async def run():
+        assert await cache.lookup('gpt-4', _messages('What is the capital of France?')) is None
+        await cache.add('gpt-4', _messages('What is the capital of France?'), 'Paris.')
+        db.flush()
+        found = await cache.lookup('gpt-4', _messages('what is the capital of france'))
+        # other model, other system message, follow-up
+        assert await cache.lookup('gpt-3.5-turbo', _messages('what is the capital of france')) is None
+        assert await cache.lookup('gpt-4', _messages('what is the capital of france', 'Be verbose.')) is None
+        follow_up = _messages('and of Italy?')
+        follow_up.insert(1, {'role': 'assistant', 'content': 'Paris.'})
+        assert await cache.lookup('gpt-4', follow_up) is None
+        return found, threading.current_thread()
+
+    found, loop_thread = asyncio.run(run())
+    response, prompt, similarity = found
+    assert (response, prompt) == ('Paris.', 'What is the capital of France?')
+    assert similarity == pytest.approx(1)
+    assert thread_lst and loop_thread not in thread_lst
+
+
+def test_pending_prompts_are_embedded_with_the_next_lookup(db, embedding_call_lst):
+    cache = SemanticCache(db, SemanticCache.OFFER, batch_size=16)
+
+    async def run():
+        await cache.add('gpt-4', _messages('first question'), 'first answer')
+        await cache.add('gpt-4', _messages('second question'), 'second answer')
+        assert not embedding_call_lst
+        await cache.lookup('gpt-4', _messages('second question?'))
+
+    asyncio.run(run())
+    assert embedding_call_lst == [['second question?', 'first question', 'second question']]
+    db.flush()
+    assert db.selectSemanticCacheCount() == 2
+
+
+def test_offered_reply_is_looked_up_alongside_the_request(db, monkeypatch):
+    cache = SemanticCache(db, SemanticCache.OFFER, threshold=0.99)
+    chat_called = threading.Event()
+    event_lst = []
+    offered = threading.Event()
+
+    async def seed():
+        await cache.add('gpt-4', _messages('What is the capital of France?'), 'Paris.')
+        await cache.flush()
+
+    async def acreate(input, model):
+        # the embedding is slow, it is given only after the chat request is made
+        for _ in range(200):
+            if chat_called.is_set():
+                break
+            await asyncio.sleep(0.01)
+        event_lst.append('embedded')
+        return {'data': [{'index': i, 'embedding': _embedding(text)} for i, text in enumerate(input)]}
+
+    async def chat_acreate(**kwargs):
+        chat_called.set()
+        event_lst.append('requested')
+        return {'choices': [{'message': {'content': 'It is Paris.'}}]}
+
+    monkeypatch.setattr(openai.Embedding, 'acreate', acreate)
+    monkeypatch.setattr(openai.ChatCompletion, 'acreate', chat_acreate)
+    # without waiting while it is seeded
+    chat_called.set()
+    asyncio.run(seed())
+    db.flush()
+    event_lst.clear()
+    chat_called.clear()
+
+    class Listener(RequestListener):
+        def onReply(self, handle, text, image_f):
+            event_lst.append('reply')
+
+        def onSimilarFound(self, handle, prompt, text, similarity):
+            event_lst.append(('similar', prompt, text))
+            offered.set()
+
+    engine = RequestEngine(Listener(), semantic_cache=cache)
+    engine.start()
+    try:
+        handle = engine.submit(1, 'gpt-4', {'model': 'gpt-4', 'messages': _messages('what is the capital of france')})
+        assert handle.result(5) == 'It is Paris.'
+        assert offered.wait(5)
+    finally:
+        engine.stop()
+
+    assert event_lst == ['requested', 'reply', 'embedded', ('similar', 'What is the capital of France?', 'Paris.')]
+
+
+def test_index_file_is_written_outside_of_the_loop(db, embedding_call_lst, monkeypatch):
+    cache = SemanticCache(db, SemanticCache.OFFER, batch_size=16)
+    thread_lst = []
+    append_fn = VectorIndex.append
+
+    def append(self, vectors):
+        thread_lst.append(threading.current_thread())
+        return append_fn(self, vectors)
+
+    monkeypatch.setattr(VectorIndex, 'append', append)
+
+    async def run():
+        await cache.add('gpt-4', _messages('first question'), 'first answer')
+        await cache.flush()
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(run())
+    assert thread_lst and loop_thread not in thread_lst
+    db.flush()
+    assert db.selectSemanticCacheCount() == 1
@@ -0,0 +1,56 @@
+import asyncio
+
+from pyqt_openai.requestEngine import ChunkBuffer
+
+
+def _stream(chunk_lst, **kwargs):
+    """
+    append the chunks to a buffer in the event loop, then wait longer than its interval
+
+    :return: texts given to the listener, with the time of each since the first chunk
+    """
+    flush_lst = []
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        buffer = ChunkBuffer(loop, lambda text: flush_lst.append((text, loop.time() - start_time)), **kwargs)
+        for chunk in chunk_lst:
+            buffer.append(chunk)
+        await asyncio.sleep(0.1)
+        buffer.flush()
+
+    asyncio.run(main())
+    return flush_lst
+
+
+def test_chunks_of_one_frame_are_given_together_after_the_interval():
+    flush_lst = _stream(['Hel', 'lo', ', world'], interval=0.02)
+    assert [text for text, _ in flush_lst] == ['Hello, world']
+    assert flush_lst[0][1] >= 0.015
+
+
+def test_big_buffer_is_given_at_once_without_waiting_for_the_frame():
+    flush_lst = _stream(['x' * 6, 'y' * 6, 'z'], interval=10, max_size=10)
+    # the first two are over the size, the last one is flushed at the end
+    assert [text for text, _ in flush_lst] == ['x' * 6 + 'y' * 6, 'z']
+    assert flush_lst[0][1] < 1
+
+
+def test_every_chunk_is_given_by_itself_without_the_interval():
+    flush_lst = _stream(['a', 'b', 'c'], interval=0)
+    assert [text for text, _ in flush_lst] == ['a', 'b', 'c']
+
+
+def test_flush_cancels_the_frame_timer():
+    flush_lst = []
+
+    async def main():
+        buffer = ChunkBuffer(asyncio.get_running_loop(), flush_lst.append, interval=0.02)
+        buffer.append('done')
+        buffer.flush()
+        await asyncio.sleep(0.05)
+        buffer.flush()
+
+    asyncio.run(main())
+    assert flush_lst == ['done']
@@ -0,0 +1,67 @@
+import asyncio, threading
+
+import openai
+
+from pyqt_openai.requestEngine import RequestEngine, RequestListener
+
+
+class _SlowStream:
+    """
+    stream of chunks which never ends by itself, like a runaway reply
+    """
+    def __init__(self):
+        self.closed = False
+        self.first_chunk = threading.Event()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0.01)
+        self.first_chunk.set()
+        return {'choices': [{'delta': {'content': 'word '}}]}
+
+    async def aclose(self):
+        self.closed = True
+
+
+class _Listener(RequestListener):
+    def __init__(self):
+        self.event_lst = []
+        self.done = threading.Event()
+
+    def onStreamFinished(self, handle, text):
+        self.event_lst.append(('finished', text))
+
+    def onCancelled(self, handle, text):
+        self.event_lst.append(('cancelled', text))
+
+    def onDone(self, handle):
+        self.event_lst.append(('done', handle.getId()))
+        self.done.set()
+
+
+def test_cancelled_stream_gives_its_partial_text_and_closes_the_response(monkeypatch):
+    stream = _SlowStream()
+
+    async def acreate(**kwargs):
+        return stream
+
+    monkeypatch.setattr(openai.ChatCompletion, 'acreate', acreate)
+    listener = _Listener()
+    engine = RequestEngine(listener, frame_interval=0)
+    engine.start()
+    try:
+        handle = engine.submit(1, 'gpt-4', {'model': 'gpt-4', 'messages': [{'role': 'user', 'content': 'hi'}], 'stream': True})
+        assert stream.first_chunk.wait(5)
+        engine.cancel(1)
+        assert listener.done.wait(5)
+    finally:
+        engine.stop()
+
+    kind, text = listener.event_lst[0]
+    # cancelled, not finished, with what was streamed so far, then done
+    assert kind == 'cancelled' and text.startswith('word ')
+    assert listener.event_lst[-1] == ('done', handle.getId())
+    assert stream.closed
+    assert handle.isDone() and not engine.getHandles(1)
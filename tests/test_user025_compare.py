@@ -0,0 +1,148 @@
+import threading
+
+import openai
+import pytest
+
+from pyqt_openai.compareRunner import COMPARE_CONV_ID, CompareBranch, CompareRunner, parseTemperatures
+from pyqt_openai.requestEngine import RequestEngine, RequestListener
+from pyqt_openai.responseCache import ResponseCache
+from pyqt_openai.tokenizer import getTokenizer
+
+
+class _Handle:
+    def __init__(self, id, text='', ttft=None, latency=None):
+        self.id = id
+        self.text = text
+        self.ttft = ttft
+        self.latency = latency
+        self.cancelled = False
+
+    def getId(self):
+        return self.id
+
+    def getText(self):
+        return self.text
+
+    def getTimeToFirstToken(self):
+        return self.ttft
+
+    def getLatency(self):
+        return self.latency
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _Engine:
+    """
+    engine of the main window which only keeps what is submitted
+    """
+    def __init__(self):
+        self.submit_lst = []
+        self.handle_lst = []
+
+    def submit(self, conv_id, model, openai_arg, listener=None, cache_f=True):
+        self.submit_lst.append((conv_id, model, openai_arg, listener, cache_f))
+        self.handle_lst.append(_Handle(len(self.handle_lst) + 1))
+        return self.handle_lst[-1]
+
+
+def test_temperatures_are_read_and_clamped():
+    assert parseTemperatures('0, 0.7, 3, x') == [0, 0.7, 2]
+    assert parseTemperatures('') == [None]
+
+
+def test_prompt_is_fanned_out_to_every_model_and_temperature():
+    engine = _Engine()
+    listener = RequestListener()
+    branch_lst = CompareRunner(engine, listener).run('Hi', ['gpt-4', 'gpt-3.5-turbo'], [0, 1], system='Be brief.')
+
+    assert [(branch.getModel(), branch.getTemperature()) for branch in branch_lst] == \
+           [('gpt-4', 0), ('gpt-4', 1), ('gpt-3.5-turbo', 0), ('gpt-3.5-turbo', 1)]
+    messages = [{'role': 'system', 'content': 'Be brief.'}, {'role': 'user', 'content': 'Hi'}]
+    conv_id, model, openai_arg, submit_listener, cache_f = engine.submit_lst[1]
+    assert openai_arg == {'model': 'gpt-4', 'messages': messages, 'stream': True, 'temperature': 1}
+    # through the engine of the main window, with the listener of the comparison and without the cache
+    assert conv_id == COMPARE_CONV_ID and submit_listener is listener and not cache_f
+    # the default temperature is not sent
+    CompareRunner(engine, listener).run('Hi', ['gpt-4'])
+    assert 'temperature' not in engine.submit_lst[-1][2]
+
+
+def test_one_column_is_cancelled_and_the_next_run_cancels_the_rest():
+    engine = _Engine()
+    runner = CompareRunner(engine, RequestListener())
+    first, second = runner.run('Hi', ['gpt-4', 'gpt-3.5-turbo'])
+    first.cancel()
+    assert [handle.cancelled for handle in engine.handle_lst] == [True, False]
+    assert runner.getBranch(second.getHandle().getId()) is second
+
+    runner.run('Hi again', ['gpt-4'])
+    assert engine.handle_lst[1].cancelled
+    # the results of the previous run are not routed to the new columns
+    assert runner.getBranch(second.getHandle().getId()) is None
+
+
+def test_stats_are_of_the_handle_and_the_price_of_the_model():
+    branch = CompareBranch('gpt-4', None, 100)
+    branch.setHandle(_Handle(1, 'Hello there, how are you?', ttft=0.25, latency=1.5))
+    ttft, latency, prompt_token_cnt, completion_token_cnt, cost = branch.getStats()
+
+    assert (ttft, latency, prompt_token_cnt) == (0.25, 1.5, 100)
+    assert completion_token_cnt == getTokenizer('gpt-4').count('Hello there, how are you?')
+    assert cost == pytest.approx((100 * 0.03 + completion_token_cnt * 0.06) / 1000)
+
+
+def test_request_with_its_own_listener_skips_the_listener_and_the_cache_of_the_engine(db, monkeypatch):
+    call_lst = []
+
+    async def acreate(**kwargs):
+        call_lst.append(kwargs)
+        return {'choices': [{'message': {'content': 'generated'}}]}
+
+    monkeypatch.setattr(openai.ChatCompletion, 'acreate', acreate)
+
+    class Listener(RequestListener):
+        def __init__(self):
+            self.reply_lst = []
+            self.done = threading.Event()
+
+        def onReply(self, handle, text, image_f):
+            self.reply_lst.append(text)
+
+        def onDone(self, handle):
+            self.done.set()
+
+    cache = ResponseCache(db, always_f=True)
+    openai_arg = {'model': 'gpt-4', 'messages': [{'role': 'user', 'content': 'hi'}], 'temperature': 0}
+    cache.put('/v1/chat/completions', openai_arg, 'cached')
+    db.flush()
+    main_listener, compare_listener = Listener(), Listener()
+    engine = RequestEngine(main_listener, response_cache=cache)
+    engine.start()
+    try:
+        assert engine.submit(COMPARE_CONV_ID, 'gpt-4', openai_arg, listener=compare_listener, cache_f=False).result(5) == 'generated'
+        assert compare_listener.done.wait(5)
+    finally:
+        engine.stop()
+
+    assert compare_listener.reply_lst == ['generated'] and not main_listener.reply_lst
+    assert len(call_lst) == 1
+
+
+def test_column_shows_the_stats_when_it_is_finished(monkeypatch):
+    pytest.importorskip('qtpy.QtWidgets')
+    monkeypatch.setenv('QT_QPA_PLATFORM', 'offscreen')
+    from qtpy.QtWidgets import QApplication
+    from pyqt_openai.compareDialog import CompareColumn
+
+    app = QApplication.instance() or QApplication([])
+    branch = CompareBranch('gpt-4', 0.7, 10)
+    branch.setHandle(_Handle(1, 'Hello', ttft=0.5, latency=2))
+    column = CompareColumn(branch)
+    column.finish('Done')
+
+    completion_token_cnt = getTokenizer('gpt-4').count('Hello')
+    cost = (10 * 0.03 + completion_token_cnt * 0.06) / 1000
+    assert column.getStatsText() == f'Done\nTime to first token: 0.50s, latency: 2.00s\n' \
+                                    f'Tokens: 10 prompt, {completion_token_cnt} completion (${cost:.4f})'